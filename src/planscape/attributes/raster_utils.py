@@ -24,7 +24,8 @@ def _validate_attribute_raster_name(raster_name: str) -> None:
 # Fetches raster pixel values for all non-NaN pixels that intersect with geo.
 # If no intersection exists, returns None.
 def get_attribute_values_from_raster(
-        geo: GEOSGeometry, raster_name: str) -> AttributePixelValues | None:
+        geo: GEOSGeometry, raster_name: str,
+        is_valid: bool | None = None) -> AttributePixelValues | None:
     _validate_attribute_raster_name(raster_name)
     return get_pixel_values_from_raster(
-        geo, RASTER_ATTRIBUTE_TABLE, raster_name)
+        geo, RASTER_ATTRIBUTE_TABLE, raster_name, is_valid)
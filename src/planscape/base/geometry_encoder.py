@@ -0,0 +1,454 @@
+"""
+Encodes geometries in API responses.
+
+By default, geometries are serialized as full-precision GeoJSON. A request
+may instead ask for reduced payloads with these URL parameters:
+  precision: the number of decimal places kept in coordinates.
+  zoom: a web map zoom level; geometries are simplified with a tolerance of
+    one pixel at that zoom level. If precision isn't set, it is chosen to
+    match the tolerance.
+  geometry_format: 'geojson' (the default) or 'topojson'. TopoJSON output is
+    quantized and shares arcs between neighboring geometries (e.g. adjacent
+    project areas or boundaries), which are simplified once per arc so that
+    shared edges stay shared.
+  quantization: the number of distinct values per axis in TopoJSON output.
+"""
+
+import enum
+import json
+import math
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.http import QueryDict
+from rest_framework_gis.fields import GeometryField
+
+# The serializer context key of the GeometryEncoder used by
+# EncodedGeometryField.
+GEOMETRY_ENCODER_CONTEXT_KEY = 'geometry_encoder'
+
+# Web map tiles are 256 pixels wide and span 360 degrees at zoom level 0.
+_TILE_SIZE_IN_PIXELS = 256
+_MAX_ZOOM = 24
+_MAX_PRECISION = 15
+
+
+class GeometryFormat(str, enum.Enum):
+    """Output formats of geometries."""
+    GEOJSON = 'geojson'
+    TOPOJSON = 'topojson'
+
+
+class GeometryEncoder():
+    """
+    Reduces the precision and detail of geometries, per request.
+    Geometries are expected to be in degrees (e.g. EPSG:4269).
+    """
+    _URL_PRECISION = 'precision'
+    _URL_ZOOM = 'zoom'
+    _URL_FORMAT = 'geometry_format'
+    _URL_QUANTIZATION = 'quantization'
+
+    _DEFAULT_FORMAT = GeometryFormat.GEOJSON
+    _DEFAULT_QUANTIZATION = 100000
+
+    # Decimal places kept in GeoJSON coordinates; None keeps all of them.
+    precision: int | None
+    # Simplification tolerance, in degrees; None disables simplification.
+    tolerance: float | None
+    geometry_format: GeometryFormat
+    quantization: int
+
+    def __init__(self, precision: int | None = None,
+                 tolerance: float | None = None,
+                 geometry_format: GeometryFormat = _DEFAULT_FORMAT,
+                 quantization: int = _DEFAULT_QUANTIZATION) -> None:
+        self.precision = precision
+        self.tolerance = tolerance
+        self.geometry_format = geometry_format
+        self.quantization = quantization
+
+    @classmethod
+    def from_params(cls, params: QueryDict) -> 'GeometryEncoder | None':
+        """
+        Reads encoder URL parameters.
+        Returns None if no encoder parameter is set, in which case geometries
+        should be serialized as they are.
+        Raises a ValueError for invalid parameters.
+        """
+        if not any(p in params for p in (
+                cls._URL_PRECISION, cls._URL_ZOOM, cls._URL_FORMAT,
+                cls._URL_QUANTIZATION)):
+            return None
+
+        tolerance = None
+        precision = None
+        if cls._URL_ZOOM in params:
+            zoom = int(params[cls._URL_ZOOM])
+            if zoom < 0 or zoom > _MAX_ZOOM:
+                raise ValueError(
+                    "zoom must be in [0, %d]" % _MAX_ZOOM)
+            tolerance = get_tolerance_for_zoom(zoom)
+            # Keeps one more decimal place than the tolerance needs.
+            precision = min(_MAX_PRECISION,
+                            math.ceil(-math.log10(tolerance)) + 1)
+        if cls._URL_PRECISION in params:
+            precision = int(params[cls._URL_PRECISION])
+            if precision < 0 or precision > _MAX_PRECISION:
+                raise ValueError(
+                    "precision must be in [0, %d]" % _MAX_PRECISION)
+        geometry_format = GeometryFormat(
+            params.get(cls._URL_FORMAT, cls._DEFAULT_FORMAT))
+        quantization = int(params.get(
+            cls._URL_QUANTIZATION, cls._DEFAULT_QUANTIZATION))
+        if quantization < 2:
+            raise ValueError("quantization must be at least 2")
+        return cls(precision, tolerance, geometry_format, quantization)
+
+    @property
+    def is_topojson(self) -> bool:
+        return self.geometry_format == GeometryFormat.TOPOJSON
+
+    def encode_geometry(self, geometry: GEOSGeometry) -> dict:
+        """
+        Converts a geometry to GeoJSON.
+        For GeoJSON output, the geometry is simplified (preserving the
+        validity of its polygons) and coordinates are rounded. For TopoJSON
+        output, the geometry is left as is; it is simplified and quantized
+        when the topology is built (see encode_topology).
+        """
+        if not self.is_topojson and self.tolerance is not None:
+            geometry = geometry.simplify(
+                self.tolerance, preserve_topology=True)
+        geojson = json.loads(geometry.geojson)
+        if not self.is_topojson and self.precision is not None:
+            _round_coordinates(geojson, self.precision)
+        return geojson
+
+    def encode_topology(self, objects: dict[str, dict]) -> dict:
+        """
+        Converts named GeoJSON objects (geometries, features, or feature
+        collections) to a quantized TopoJSON topology.
+        """
+        return _TopologyBuilder(
+            self.quantization, self.tolerance).build(objects)
+
+
+def get_tolerance_for_zoom(zoom: int) -> float:
+    """Returns the width of a web map pixel at a zoom level, in degrees."""
+    return 360 / (_TILE_SIZE_IN_PIXELS * 2 ** zoom)
+
+
+def _round_coordinates(geojson: dict, precision: int) -> None:
+    if geojson['type'] == 'GeometryCollection':
+        for g in geojson['geometries']:
+            _round_coordinates(g, precision)
+        return
+
+    def round_recursively(coordinates):
+        if len(coordinates) > 0 and isinstance(coordinates[0], list):
+            return [round_recursively(c) for c in coordinates]
+        return [round(c, precision) for c in coordinates]
+    geojson['coordinates'] = round_recursively(geojson['coordinates'])
+
+
+def _simplify_line(line: list[tuple[int, int]],
+                   tolerance: float) -> list[tuple[int, int]]:
+    """
+    Simplifies a line with the Douglas-Peucker algorithm. Endpoints are kept.
+    """
+    if len(line) <= 2:
+        return line
+    keep = [False] * len(line)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(line) - 1)]
+    while len(stack) > 0:
+        first, last = stack.pop()
+        (x0, y0), (x1, y1) = line[first], line[last]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.hypot(dx, dy)
+        max_distance = -1.0
+        max_index = first
+        for i in range(first + 1, last):
+            x, y = line[i]
+            if length == 0:
+                distance = math.hypot(x - x0, y - y0)
+            else:
+                distance = abs(dy * (x - x0) - dx * (y - y0)) / length
+            if distance > max_distance:
+                max_distance = distance
+                max_index = i
+        if max_distance > tolerance:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+    return [p for p, k in zip(line, keep) if k]
+
+
+class _TopologyBuilder():
+    """
+    Builds a TopoJSON topology (https://github.com/topojson/topojson-spec).
+      1. Coordinates are quantized to a quantization x quantization grid
+         spanning all objects' bounding box.
+      2. Lines (polygon rings and line strings) are cut at junctions: points
+         where lines meet or diverge. Identical pieces (in either direction)
+         become one arc.
+      3. Each arc is simplified once, keeping its endpoints, and is
+         delta-encoded.
+    """
+
+    def __init__(self, quantization: int, tolerance: float | None) -> None:
+        self._quantization = quantization
+        self._tolerance = tolerance
+        self._arcs = []
+        self._arc_indices = {}
+
+    def build(self, objects: dict[str, dict]) -> dict:
+        points = []
+        for o in objects.values():
+            _collect_points(o, points)
+        if len(points) == 0:
+            x0 = y0 = 0.0
+            kx = ky = 1.0
+        else:
+            x0 = min(p[0] for p in points)
+            y0 = min(p[1] for p in points)
+            kx = (max(p[0] for p in points) - x0) / (self._quantization - 1)
+            ky = (max(p[1] for p in points) - y0) / (self._quantization - 1)
+            kx = kx if kx > 0 else 1.0
+            ky = ky if ky > 0 else 1.0
+        self._transform = (x0, y0, kx, ky)
+
+        quantized = {name: self._quantize_object(o)
+                     for name, o in objects.items()}
+        lines = []
+        for o in quantized.values():
+            _collect_lines(o, lines)
+        self._junctions = _find_junctions(lines)
+
+        topology_objects = {name: self._convert_object(o)
+                            for name, o in quantized.items()}
+        return {
+            'type': 'Topology',
+            'transform': {'scale': [kx, ky], 'translate': [x0, y0]},
+            'objects': topology_objects,
+            'arcs': [self._encode_arc(a) for a in self._arcs],
+        }
+
+    def _quantize_point(self, p: list[float]) -> tuple[int, int]:
+        x0, y0, kx, ky = self._transform
+        return (round((p[0] - x0) / kx), round((p[1] - y0) / ky))
+
+    def _quantize_line(self, line: list[list[float]]) -> list[tuple[int, int]]:
+        quantized = []
+        for p in line:
+            q = self._quantize_point(p)
+            # Points that collapse onto their predecessor are dropped.
+            if len(quantized) == 0 or quantized[-1] != q:
+                quantized.append(q)
+        return quantized
+
+    def _quantize_object(self, o: dict) -> dict:
+        match o['type']:
+            case 'FeatureCollection':
+                return dict(o, features=[self._quantize_object(f)
+                                         for f in o['features']])
+            case 'Feature':
+                return dict(o, geometry=None if o['geometry'] is None
+                            else self._quantize_object(o['geometry']))
+            case 'GeometryCollection':
+                return dict(o, geometries=[self._quantize_object(g)
+                                           for g in o['geometries']])
+            case 'Point':
+                return dict(o, coordinates=self._quantize_point(
+                    o['coordinates']))
+            case 'MultiPoint':
+                return dict(o, coordinates=[self._quantize_point(p)
+                                            for p in o['coordinates']])
+            case 'LineString':
+                return dict(o, coordinates=self._quantize_line(
+                    o['coordinates']))
+            case 'MultiLineString' | 'Polygon':
+                return dict(o, coordinates=[self._quantize_line(l)
+                                            for l in o['coordinates']])
+            case 'MultiPolygon':
+                return dict(o, coordinates=[
+                    [self._quantize_line(l) for l in polygon]
+                    for polygon in o['coordinates']])
+        raise ValueError("unsupported GeoJSON type, %s" % o['type'])
+
+    def _convert_object(self, o: dict) -> dict:
+        match o['type']:
+            case 'FeatureCollection':
+                return {'type': 'GeometryCollection',
+                        'geometries': [self._convert_object(f)
+                                       for f in o['features']]}
+            case 'Feature':
+                converted = {'type': None} if o['geometry'] is None else \
+                    self._convert_object(o['geometry'])
+                if o.get('id') is not None:
+                    converted['id'] = o['id']
+                if o.get('properties') is not None:
+                    converted['properties'] = o['properties']
+                return converted
+            case 'GeometryCollection':
+                return {'type': 'GeometryCollection',
+                        'geometries': [self._convert_object(g)
+                                       for g in o['geometries']]}
+            case 'Point' | 'MultiPoint':
+                return {'type': o['type'], 'coordinates': o['coordinates']}
+            case 'LineString':
+                return {'type': o['type'],
+                        'arcs': self._cut_line(o['coordinates'])}
+            case 'MultiLineString' | 'Polygon':
+                return {'type': o['type'],
+                        'arcs': [self._cut_line(l)
+                                 for l in o['coordinates']]}
+            case 'MultiPolygon':
+                return {'type': o['type'],
+                        'arcs': [[self._cut_line(l) for l in polygon]
+                                 for polygon in o['coordinates']]}
+        raise ValueError("unsupported GeoJSON type, %s" % o['type'])
+
+    def _cut_line(self, line: list[tuple[int, int]]) -> list[int]:
+        """
+        Cuts a line at junctions and returns the indices of its arcs; the
+        index of an arc traversed backwards is ~index.
+        """
+        is_ring = len(line) > 3 and line[0] == line[-1]
+        if is_ring:
+            ring = line[:-1]
+            cuts = [i for i, p in enumerate(ring) if p in self._junctions]
+            if len(cuts) == 0:
+                # Rings without junctions are rotated to start at their
+                # smallest point, so that identical rings match.
+                start = ring.index(min(ring))
+                ring = ring[start:] + ring[:start]
+                return [self._get_arc_index(ring + [ring[0]])]
+            ring = ring[cuts[0]:] + ring[:cuts[0]]
+            line = ring + [ring[0]]
+            cuts = [c - cuts[0] for c in cuts] + [len(ring)]
+        else:
+            cuts = [0] + [i for i, p in enumerate(line[1:-1], 1)
+                          if p in self._junctions] + [len(line) - 1]
+        return [self._get_arc_index(line[a:b + 1])
+                for a, b in zip(cuts[:-1], cuts[1:])]
+
+    def _get_arc_index(self, arc: list[tuple[int, int]]) -> int:
+        is_closed = arc[0] == arc[-1]
+        key = tuple(arc)
+        if key in self._arc_indices:
+            return self._arc_indices[key]
+        reversed_key = tuple(reversed(arc))
+        if reversed_key in self._arc_indices:
+            return ~self._arc_indices[reversed_key]
+        if is_closed:
+            # A closed arc may also match the reverse of an arc that starts
+            # at the same point.
+            reversed_key = (key[0],) + tuple(reversed(key[1:-1])) + (key[0],)
+            if reversed_key in self._arc_indices:
+                return ~self._arc_indices[reversed_key]
+
+        index = len(self._arcs)
+        self._arc_indices[key] = index
+        self._arcs.append(self._simplify_arc(arc, is_closed))
+        return index
+
+    def _simplify_arc(self, arc: list[tuple[int, int]],
+                      is_closed: bool) -> list[tuple[int, int]]:
+        if self._tolerance is None:
+            return arc
+        _, _, kx, ky = self._transform
+        simplified = _simplify_line(arc, self._tolerance / max(kx, ky))
+        # Closed arcs must keep at least 4 points to remain rings.
+        if is_closed and len(simplified) < 4:
+            return arc
+        return simplified
+
+    def _encode_arc(self, arc: list[tuple[int, int]]) -> list[list[int]]:
+        encoded = [list(arc[0])]
+        for (xa, ya), (xb, yb) in zip(arc[:-1], arc[1:]):
+            encoded.append([xb - xa, yb - ya])
+        return encoded
+
+
+def _collect_points(o: dict, points: list) -> None:
+    match o['type']:
+        case 'FeatureCollection':
+            for f in o['features']:
+                _collect_points(f, points)
+        case 'Feature':
+            if o['geometry'] is not None:
+                _collect_points(o['geometry'], points)
+        case 'GeometryCollection':
+            for g in o['geometries']:
+                _collect_points(g, points)
+        case 'Point':
+            points.append(o['coordinates'])
+        case 'MultiPoint' | 'LineString':
+            points.extend(o['coordinates'])
+        case 'MultiLineString' | 'Polygon':
+            for l in o['coordinates']:
+                points.extend(l)
+        case 'MultiPolygon':
+            for polygon in o['coordinates']:
+                for l in polygon:
+                    points.extend(l)
+
+
+def _collect_lines(o: dict, lines: list) -> None:
+    match o['type']:
+        case 'FeatureCollection':
+            for f in o['features']:
+                _collect_lines(f, lines)
+        case 'Feature':
+            if o['geometry'] is not None:
+                _collect_lines(o['geometry'], lines)
+        case 'GeometryCollection':
+            for g in o['geometries']:
+                _collect_lines(g, lines)
+        case 'LineString':
+            lines.append(o['coordinates'])
+        case 'MultiLineString' | 'Polygon':
+            lines.extend(o['coordinates'])
+        case 'MultiPolygon':
+            for polygon in o['coordinates']:
+                lines.extend(polygon)
+
+
+def _find_junctions(
+        lines: list[list[tuple[int, int]]]) -> set[tuple[int, int]]:
+    """
+    Returns points where lines meet or diverge: points whose neighbors differ
+    between the lines that visit them, and endpoints of open lines.
+    """
+    neighbors = {}
+    junctions = set()
+    for line in lines:
+        is_ring = len(line) > 3 and line[0] == line[-1]
+        if is_ring:
+            ring = line[:-1]
+            for i, p in enumerate(ring):
+                pair = tuple(sorted((ring[i - 1], ring[(i + 1) % len(ring)])))
+                if neighbors.setdefault(p, pair) != pair:
+                    junctions.add(p)
+        elif len(line) > 0:
+            junctions.add(line[0])
+            junctions.add(line[-1])
+            for i in range(1, len(line) - 1):
+                pair = tuple(sorted((line[i - 1], line[i + 1])))
+                if neighbors.setdefault(line[i], pair) != pair:
+                    junctions.add(line[i])
+    return junctions
+
+
+class EncodedGeometryField(GeometryField):
+    """
+    A GeometryField that encodes geometries with the GeometryEncoder in the
+    serializer context (under GEOMETRY_ENCODER_CONTEXT_KEY), if any.
+    """
+
+    def to_representation(self, value):
+        encoder = self.context.get(GEOMETRY_ENCODER_CONTEXT_KEY, None)
+        if encoder is None or value is None or isinstance(value, dict):
+            return super().to_representation(value)
+        return encoder.encode_geometry(value)
@@ -0,0 +1,97 @@
+from base.geometry_encoder import (GeometryEncoder, GeometryFormat,
+                                   get_tolerance_for_zoom)
+from django.contrib.gis.geos import Polygon
+from django.http import QueryDict
+from django.test import TestCase
+
+
+class GeometryEncoderParamsTest(TestCase):
+    def test_no_params(self):
+        self.assertIsNone(GeometryEncoder.from_params(QueryDict('')))
+
+    def test_zoom_sets_tolerance_and_precision(self):
+        encoder = GeometryEncoder.from_params(QueryDict('zoom=10'))
+        self.assertAlmostEqual(encoder.tolerance, get_tolerance_for_zoom(10))
+        self.assertEqual(encoder.precision, 4)
+        self.assertEqual(encoder.geometry_format, GeometryFormat.GEOJSON)
+
+        encoder = GeometryEncoder.from_params(QueryDict('zoom=10&precision=6'))
+        self.assertEqual(encoder.precision, 6)
+
+    def test_invalid_params(self):
+        for params in ('zoom=-1', 'precision=20', 'geometry_format=wkt',
+                       'quantization=1'):
+            with self.assertRaises(ValueError):
+                GeometryEncoder.from_params(QueryDict(params))
+
+
+class EncodeGeometryTest(TestCase):
+    def test_rounds_and_simplifies(self):
+        geometry = Polygon(((0, 0), (0.5, 0.000001), (1, 0), (1, 1.123456),
+                            (0, 1), (0, 0)))
+        encoded = GeometryEncoder(precision=2, tolerance=0.01).encode_geometry(
+            geometry)
+        self.assertEqual(encoded['type'], 'Polygon')
+        self.assertListEqual(encoded['coordinates'], [
+            [[0, 0], [1, 0], [1, 1.12], [0, 1], [0, 0]]])
+
+
+class EncodeTopologyTest(TestCase):
+    def _decode_arc(self, topology: dict, index: int) -> list[list[float]]:
+        arc = topology['arcs'][~index if index < 0 else index]
+        points = []
+        x = y = 0
+        for dx, dy in arc:
+            x = x + dx
+            y = y + dy
+            points.append([
+                x * topology['transform']['scale'][0] +
+                topology['transform']['translate'][0],
+                y * topology['transform']['scale'][1] +
+                topology['transform']['translate'][1]])
+        return points[::-1] if index < 0 else points
+
+    def test_shares_arcs_between_neighbors(self):
+        left = {'type': 'Polygon', 'coordinates': [
+            [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+        right = {'type': 'Polygon', 'coordinates': [
+            [[1, 0], [2, 0], [2, 1], [1, 1], [1, 0]]]}
+        topology = GeometryEncoder(
+            geometry_format=GeometryFormat.TOPOJSON,
+            quantization=11).encode_topology({
+                'left': {'type': 'Feature', 'id': 1, 'properties': {'a': 1},
+                         'geometry': left},
+                'right': right})
+
+        self.assertEqual(topology['type'], 'Topology')
+        self.assertEqual(len(topology['arcs']), 3)
+        left_arcs = topology['objects']['left']['arcs'][0]
+        right_arcs = topology['objects']['right']['arcs'][0]
+        # The shared edge is one arc, traversed in opposite directions.
+        shared = set(a if a >= 0 else ~a for a in left_arcs) & set(
+            a if a >= 0 else ~a for a in right_arcs)
+        self.assertEqual(len(shared), 1)
+        self.assertListEqual(
+            sorted(self._decode_arc(topology, list(shared)[0])),
+            [[1, 0], [1, 1]])
+        self.assertEqual(topology['objects']['left']['id'], 1)
+        self.assertDictEqual(
+            topology['objects']['left']['properties'], {'a': 1})
+
+    def test_matches_identical_rings(self):
+        ring = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+        topology = GeometryEncoder(
+            geometry_format=GeometryFormat.TOPOJSON).encode_topology({
+                'a': {'type': 'Polygon', 'coordinates': [ring]},
+                'b': {'type': 'Polygon', 'coordinates': [ring[::-1]]}})
+        self.assertEqual(len(topology['arcs']), 1)
+        self.assertListEqual(topology['objects']['a']['arcs'], [[0]])
+        self.assertListEqual(topology['objects']['b']['arcs'], [[~0]])
+
+    def test_simplifies_arcs(self):
+        ring = [[0, 0], [0.5, 0.0001], [1, 0], [1, 1], [0, 1], [0, 0]]
+        topology = GeometryEncoder(
+            tolerance=0.01, geometry_format=GeometryFormat.TOPOJSON,
+            quantization=10001).encode_topology(
+                {'a': {'type': 'Polygon', 'coordinates': [ring]}})
+        self.assertEqual(len(topology['arcs'][0]), 5)
@@ -1,3 +1,4 @@
+from base.geometry_encoder import EncodedGeometryField
 from rest_framework_gis import serializers
 from .models import Boundary, BoundaryDetails
 
@@ -9,7 +10,7 @@ class BoundarySerializer(serializers.ModelSerializer):
 
 
 class BoundaryDetailsSerializer(serializers.GeoFeatureModelSerializer):
-    clipped_geometry = serializers.GeometryField()
+    clipped_geometry = EncodedGeometryField()
 
     class Meta:
         fields = ("id", "shape_name")
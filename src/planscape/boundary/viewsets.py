@@ -1,9 +1,11 @@
+from base.geometry_encoder import GEOMETRY_ENCODER_CONTEXT_KEY, GeometryEncoder
 from base.region_name import RegionName
 from django.contrib.gis.db.models.functions import Intersection
 from django.db.models import F, Subquery
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
 
 from .models import Boundary, BoundaryDetails
 from .serializers import BoundaryDetailsSerializer, BoundarySerializer
@@ -60,8 +62,30 @@ class BoundaryDetailsViewSet(viewsets.ReadOnlyModelViewSet):
 
         return BoundaryDetails.objects.none()
 
+    def get_geometry_encoder(self) -> GeometryEncoder | None:
+        """
+        Returns the geometry encoder requested by URL parameters (see
+        base.geometry_encoder), if any.
+        """
+        try:
+            return GeometryEncoder.from_params(self.request.GET)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context[GEOMETRY_ENCODER_CONTEXT_KEY] = self.get_geometry_encoder()
+        return context
+
     # The requests take O(10s) often to serialize, and boundaries don't change much.
     # Cache the results for CACHE_TIME_IN_SECONDS seconds.
+    # If TopoJSON is requested, the feature collection is returned as a
+    # topology with a single 'boundaries' object.
     @method_decorator(cache_page(CACHE_TIME_IN_SECONDS))
     def list(self, request, *args, **kwargs):
-        return super().list(self, request, *args, **kwargs)
+        response = super().list(self, request, *args, **kwargs)
+        encoder = self.get_geometry_encoder()
+        if encoder is not None and encoder.is_topojson:
+            response.data = encoder.encode_topology(
+                {'boundaries': response.data})
+        return response
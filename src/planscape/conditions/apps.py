@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ConditionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'conditions'
+
+    def ready(self):
+        from .catalog import _on_condition_changed
+        from .models import BaseCondition, Condition
+
+        # Saving or deleting conditions (e.g. in conditions.load) invalidates
+        # condition catalogs (see conditions.catalog).
+        for model in (BaseCondition, Condition):
+            post_save.connect(_on_condition_changed, sender=model,
+                              dispatch_uid='condition_catalog_%s' %
+                              model.__name__)
+            post_delete.connect(_on_condition_changed, sender=model,
+                                dispatch_uid='condition_catalog_%s_delete' %
+                                model.__name__)
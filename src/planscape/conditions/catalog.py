@@ -0,0 +1,150 @@
+import threading
+import time
+import uuid
+
+from base.condition_types import ConditionScoreType
+from django.core.cache import cache
+
+from .models import BaseCondition, Condition
+
+# Cache key of the catalog version stamp. The stamp is shared by all processes
+# (via the Django cache) so that a change made by one process (e.g. a loader
+# run from a shell) invalidates catalogs in the others.
+# With the default LocMemCache, the stamp is per-process.
+_VERSION_CACHE_KEY = 'conditions_catalog_version'
+
+# How long a loaded catalog is used before the version stamp is checked
+# again. Between checks, lookups don't touch the cache, which may be a network
+# round trip away (e.g. memcached or redis); changes made by other processes
+# are picked up within this interval. Changes made by this process invalidate
+# its catalog immediately (see bump_catalog_version).
+VERSION_CHECK_INTERVAL_SECONDS = 5
+
+_catalog = None
+# When the version stamp was last checked, per time.monotonic.
+_catalog_checked_time = 0.0
+_catalog_lock = threading.Lock()
+
+
+# An in-memory snapshot of the BaseCondition and Condition tables.
+# Conditions are small, rarely-changing tables (they change only when loaders
+# in conditions.load run), so lookups by ID or by name are served from memory
+# instead of querying per item.
+# Each Condition's condition_dataset is set to the snapshot's BaseCondition,
+# so reading condition.condition_dataset doesn't query.
+class ConditionCatalog():
+    # The version stamp the catalog was loaded at.
+    version: str
+    # Conditions and BaseConditions by primary key.
+    conditions: dict[int, Condition]
+    base_conditions: dict[int, BaseCondition]
+    # Conditions keyed by condition name (across regions and score types).
+    _conditions_by_name: dict[str, list[Condition]]
+
+    def __init__(self, version: str) -> None:
+        self.version = version
+        self.base_conditions = {
+            b.pk: b for b in BaseCondition.objects.all()}
+        self.conditions = {}
+        self._conditions_by_name = {}
+        for c in Condition.objects.all():
+            c.condition_dataset = self.base_conditions[c.condition_dataset_id]
+            self.conditions[c.pk] = c
+            self._conditions_by_name.setdefault(
+                c.condition_dataset.condition_name, []).append(c)
+
+    # Returns the condition name of the Condition with primary key, pk.
+    def get_condition_name(self, pk: int) -> str:
+        if pk not in self.conditions.keys():
+            raise Exception("no condition with ID, %d" % (pk))
+        return self.conditions[pk].condition_dataset.condition_name
+
+    # Returns conditions matching the given fields. If region_name is None,
+    # conditions from all regions match; if condition_score_type is None,
+    # all score types match.
+    def find_conditions(
+            self, condition_name: str, region_name: str | None = None,
+            condition_score_type: ConditionScoreType | None = None,
+            is_raw: bool = False) -> list[Condition]:
+        return [c for c in self._conditions_by_name.get(condition_name, [])
+                if (region_name is None or
+                    c.condition_dataset.region_name == region_name) and
+                (condition_score_type is None or
+                 c.condition_score_type == condition_score_type) and
+                c.is_raw == is_raw]
+
+    # Returns the current, normalized (i.e. not raw) Condition for a
+    # condition name; this is the Condition used for planning priorities.
+    # Raises an error unless exactly one such condition exists.
+    def get_priority_condition(
+            self, condition_name: str,
+            region_name: str | None = None) -> Condition:
+        conditions = self.find_conditions(
+            condition_name, region_name, ConditionScoreType.CURRENT)
+        if len(conditions) != 1:
+            raise Exception(
+                "expected 1 condition for priority, %s, instead, %d were " %
+                (condition_name, len(conditions)) + "found")
+        return conditions[0]
+
+
+# Returns the process-wide condition catalog, (re)loading it if the version
+# stamp has changed since it was loaded. The stamp is checked at most once
+# every VERSION_CHECK_INTERVAL_SECONDS.
+# If refresh is true, the catalog is reloaded regardless; callers that miss
+# a lookup may retry with a refreshed catalog, since a concurrent loader may
+# not have bumped the version stamp yet.
+def get_condition_catalog(refresh: bool = False) -> ConditionCatalog:
+    global _catalog, _catalog_checked_time
+    now = time.monotonic()
+    with _catalog_lock:
+        if not refresh and _catalog is not None and \
+                now - _catalog_checked_time < VERSION_CHECK_INTERVAL_SECONDS:
+            return _catalog
+
+    version = cache.get_or_set(
+        _VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, timeout=None)
+    with _catalog_lock:
+        if refresh or _catalog is None or _catalog.version != version:
+            _catalog = ConditionCatalog(version)
+        _catalog_checked_time = now
+        return _catalog
+
+
+# Invalidates condition catalogs in all processes sharing the Django cache.
+# This is called whenever a BaseCondition or Condition is saved or deleted
+# (see conditions.apps), e.g. by conditions.load.
+def bump_catalog_version() -> None:
+    global _catalog
+    # Stamps are random rather than counters so that a stamp evicted from the
+    # cache is never reissued.
+    cache.set(_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+    with _catalog_lock:
+        _catalog = None
+
+
+# Returns the priority Condition (see ConditionCatalog.get_priority_condition)
+# for condition_name. On a miss, the catalog is reloaded once before raising.
+def get_priority_condition(condition_name: str,
+                           region_name: str | None = None) -> Condition:
+    try:
+        return get_condition_catalog().get_priority_condition(
+            condition_name, region_name)
+    except Exception:
+        return get_condition_catalog(refresh=True).get_priority_condition(
+            condition_name, region_name)
+
+
+# Returns the condition name of the Condition with primary key, pk. On a miss,
+# the catalog is reloaded once before raising.
+def get_condition_name(pk: int) -> str:
+    try:
+        return get_condition_catalog().get_condition_name(pk)
+    except Exception:
+        return get_condition_catalog(refresh=True).get_condition_name(pk)
+
+
+# Signal receiver that invalidates condition catalogs when a BaseCondition or
+# Condition changes.
+def _on_condition_changed(sender, **kwargs) -> None:
+    bump_catalog_version()
@@ -0,0 +1,86 @@
+import time
+from unittest import mock
+
+from base.condition_types import ConditionLevel, ConditionScoreType
+from conditions.catalog import (VERSION_CHECK_INTERVAL_SECONDS,
+                                get_condition_catalog, get_condition_name,
+                                get_priority_condition)
+from conditions.models import BaseCondition, Condition
+from django.core.cache import cache
+from django.test import TestCase
+
+
+class ConditionCatalogTest(TestCase):
+    def setUp(self) -> None:
+        self.foo = self._create_condition('foo', 'region1', is_raw=False)
+        self.foo_raw = self._create_condition('foo', 'region1', is_raw=True)
+        self.bar = self._create_condition('bar', 'region1', is_raw=False)
+        self.bar2 = self._create_condition('bar', 'region2', is_raw=False)
+
+    def _create_condition(self, name: str, region: str,
+                          is_raw: bool) -> Condition:
+        base_condition = BaseCondition.objects.create(
+            condition_name=name, region_name=region,
+            condition_level=ConditionLevel.METRIC)
+        return Condition.objects.create(
+            condition_dataset=base_condition, raster_name=name,
+            condition_score_type=ConditionScoreType.CURRENT, is_raw=is_raw)
+
+    def test_finds_conditions(self):
+        catalog = get_condition_catalog()
+        self.assertListEqual(
+            [c.pk for c in catalog.find_conditions('foo', 'region1')],
+            [self.foo.pk])
+        self.assertListEqual(
+            [c.pk for c in catalog.find_conditions(
+                'foo', 'region1', is_raw=True)],
+            [self.foo_raw.pk])
+        self.assertListEqual(
+            sorted([c.pk for c in catalog.find_conditions('bar')]),
+            sorted([self.bar.pk, self.bar2.pk]))
+        self.assertListEqual(catalog.find_conditions('baz'), [])
+
+    def test_gets_condition_name_without_querying(self):
+        get_condition_catalog()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_condition_name(self.foo.pk), 'foo')
+            self.assertEqual(
+                get_priority_condition('bar', 'region2').condition_dataset.
+                region_name, 'region2')
+
+    def test_fails_for_ambiguous_priority(self):
+        with self.assertRaises(Exception) as context:
+            get_priority_condition('bar')
+        self.assertEqual(
+            str(context.exception),
+            "expected 1 condition for priority, bar, instead, 2 were found")
+
+    def test_reloads_after_conditions_change(self):
+        catalog = get_condition_catalog()
+        self.assertIs(get_condition_catalog(), catalog)
+
+        baz = self._create_condition('baz', 'region1', is_raw=False)
+        self.assertIsNot(get_condition_catalog(), catalog)
+        self.assertEqual(get_priority_condition('baz').pk, baz.pk)
+
+        Condition.objects.filter(pk=baz.pk).delete()
+        with self.assertRaises(Exception):
+            get_priority_condition('baz')
+
+    def test_checks_version_once_per_interval(self):
+        catalog = get_condition_catalog()
+        # Simulates a change made by another process.
+        cache.set('conditions_catalog_version', 'other', timeout=None)
+
+        with mock.patch('conditions.catalog.cache', wraps=cache) as \
+                mock_cache:
+            self.assertIs(get_condition_catalog(), catalog)
+            mock_cache.get_or_set.assert_not_called()
+
+            with mock.patch('conditions.catalog.time.monotonic',
+                            return_value=time.monotonic() +
+                            VERSION_CHECK_INTERVAL_SECONDS):
+                reloaded = get_condition_catalog()
+            mock_cache.get_or_set.assert_called_once()
+        self.assertIsNot(reloaded, catalog)
+        self.assertEqual(reloaded.version, 'other')
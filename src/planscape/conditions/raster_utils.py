@@ -1,10 +1,10 @@
 import numpy as np
 from base.region_name import RegionName
 from conditions.models import BaseCondition, Condition, ConditionRaster
-from django.contrib.gis.gdal import CoordTransform, SpatialReference
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection
-from plan.models import ConditionScores, Plan
+from plan.geos_utils import get_raster_geo
+from plan.models import ConditionScores, Plan, RasterGeometryModel
 from planscape import settings
 from typing import TypedDict
 
@@ -45,10 +45,12 @@ ConditionPixelValues = RasterPixelValues
 
 # Validates that a geomeetry is compatible with rasters stored in the DB.
 # This must be called before a postGIS function call.
-def _validate_geo(geo: GEOSGeometry) -> None:
+# If is_valid is given (e.g. stored along with the geometry), the geometry's
+# validity isn't recomputed.
+def _validate_geo(geo: GEOSGeometry, is_valid: bool | None = None) -> None:
     if geo is None:
         raise AssertionError("missing input geometry")
-    if not geo.valid:
+    if not (geo.valid if is_valid is None else is_valid):
         raise AssertionError("invalid geo: %s" % geo.valid_reason)
     if geo.srid != settings.CRS_FOR_RASTERS:
         raise AssertionError(
@@ -96,26 +98,27 @@ def _append_to_list(
         values[key] = [value]
 
 
-# Returns a geometry in the raster SRS.
-def get_raster_geo(geo: GEOSGeometry) -> GEOSGeometry:
-    if geo.srid == settings.CRS_FOR_RASTERS:
-        return geo
-    transformed_geo = geo.clone()
-    transformed_geo.transform(
-        CoordTransform(
-            SpatialReference(geo.srid),
-            SpatialReference(settings.CRS_9822_PROJ4)))
-    transformed_geo.srid = settings.CRS_FOR_RASTERS
-    return transformed_geo
+# Returns a Plan or ProjectArea geometry in the raster SRS, and whether it is
+# valid, as stored on the model (see plan.models.RasterGeometryModel), so that
+# the geometry isn't reprojected or validated again.
+# For rows saved before these were stored, they are computed and saved.
+def get_stored_raster_geo(
+        obj: RasterGeometryModel) -> tuple[GEOSGeometry, bool | None]:
+    if obj.raster_geometry is None and obj.update_raster_geometry() and \
+            obj.pk is not None:
+        obj.save(update_fields=RasterGeometryModel.RASTER_GEOMETRY_FIELDS)
+    return obj.raster_geometry, obj.raster_geometry_valid
 
 
 # Returns None if no intersection exists between a geometry and the condition
 # raster.
 # Otherwise, returns ConditionStatistics.
+# is_valid is passed to _validate_geo.
 def compute_condition_stats_from_raster(
-        geo: GEOSGeometry, raster_name: str) -> ConditionStatistics | None:
+        geo: GEOSGeometry, raster_name: str,
+        is_valid: bool | None = None) -> ConditionStatistics | None:
     _validate_condition_raster_name(raster_name)
-    _validate_geo(geo)
+    _validate_geo(geo, is_valid)
     with connection.cursor() as cursor:
         cursor.callproc(
             'get_condition_stats',
@@ -141,11 +144,10 @@ def fetch_or_compute_condition_stats(
     reg = plan.region_name.removeprefix('RegionName.').lower()
     if reg not in RegionName.__members__.values():
         raise AssertionError("region, %s, is invalid" % (reg))
-    geo = plan.geometry
-    if geo is None:
+    if plan.geometry is None:
         raise AssertionError("plan is missing geometry")
 
-    geo = get_raster_geo(geo)
+    geo, is_valid = get_stored_raster_geo(plan)
 
     ids_to_condition_names = {
         c.pk: c.condition_name
@@ -168,7 +170,7 @@ def fetch_or_compute_condition_stats(
             continue
 
         stats = compute_condition_stats_from_raster(
-            geo, condition.raster_name)
+            geo, condition.raster_name, is_valid)
         condition_stats[name] = stats
         ConditionScores.objects.create(
             plan=plan, condition=condition, mean_score=stats['mean'],
@@ -180,9 +182,11 @@ def fetch_or_compute_condition_stats(
 
 # Fetches raster pixel values for all non-NaN pixels that intersect with geo.
 # If no intersection exists, returns None.
+# is_valid is passed to _validate_geo.
 def get_pixel_values_from_raster(
-        geo: GEOSGeometry, table_name: str, raster_name: str) -> RasterPixelValues | None:
-    _validate_geo(geo)
+        geo: GEOSGeometry, table_name: str, raster_name: str,
+        is_valid: bool | None = None) -> RasterPixelValues | None:
+    _validate_geo(geo, is_valid)
     with connection.cursor() as cursor:
         cursor.callproc(
             'get_condition_pixels',
@@ -203,7 +207,8 @@ def get_pixel_values_from_raster(
 
 
 def get_condition_values_from_raster(
-        geo: GEOSGeometry, raster_name: str) -> ConditionPixelValues | None:
+        geo: GEOSGeometry, raster_name: str,
+        is_valid: bool | None = None) -> ConditionPixelValues | None:
     _validate_condition_raster_name(raster_name)
     return get_pixel_values_from_raster(
-        geo, RASTER_CONDITION_TABLE, raster_name)
+        geo, RASTER_CONDITION_TABLE, raster_name, is_valid)
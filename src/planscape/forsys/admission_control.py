@@ -0,0 +1,190 @@
+import math
+from enum import IntEnum
+
+from forsys.forsys_request_params import (ClusterAlgorithmType,
+                                          ForsysGenerationRequestParams)
+from planscape import settings
+
+
+# A pre-flight estimate of the size of a generation run, computed from the
+# planning area geometry and the raster grid before any raster data is
+# fetched.
+class GenerationEstimate():
+    # Bytes per raster value held by RasterConditionFetcher (a python float in
+    # a list, plus the transient numpy value it was read from).
+    _BYTES_PER_RASTER_VALUE = 40
+    # Bytes per value in the forsys input table (a python object in a list,
+    # plus its copy in an R dataframe).
+    _BYTES_PER_INPUT_VALUE = 40
+    # Bytes per stand for its WKT geometry string (both in python and R).
+    _BYTES_PER_STAND_GEOMETRY = 400
+    # Non-priority columns in the forsys input table (stand ID, project ID,
+    # area, cost, geometry, and treatment eligibility).
+    _NUM_FIXED_INPUT_COLUMNS = 6
+
+    # The area of the planning area, in km-squared.
+    planning_area_in_km2: float
+    # The number of raster pixels inside the planning area.
+    pixel_count: int
+    # The number of raster pixels inside the planning area's bounding box;
+    # raster data is fetched for this window.
+    window_pixel_count: int
+    # The number of stands passed to forsys.
+    stand_count: int
+    # Estimated peak memory for raster fetch and forsys input.
+    memory_bytes: int
+
+    def __init__(self, params: ForsysGenerationRequestParams):
+        geo, _ = params.get_raster_planning_area()
+        pixel_width = abs(settings.CRS_9822_SCALE[0])
+        pixel_height = abs(settings.CRS_9822_SCALE[1])
+        self.planning_area_in_km2 = geo.area / 1e6
+        self.pixel_count = int(math.ceil(
+            geo.area / (pixel_width * pixel_height)))
+        xmin, ymin, xmax, ymax = geo.extent
+        self.window_pixel_count = \
+            int(math.ceil((xmax - xmin) / pixel_width)) * \
+            int(math.ceil((ymax - ymin) / pixel_height))
+        self.stand_count = self._estimate_stand_count(params)
+
+        num_priorities = len(params.priorities)
+        num_attributes = self._get_num_attributes(params)
+        self.memory_bytes = \
+            self.window_pixel_count * (num_priorities + num_attributes) * \
+            self._BYTES_PER_RASTER_VALUE + \
+            self.pixel_count * (2 * num_priorities +
+                                self._NUM_FIXED_INPUT_COLUMNS) * \
+            self._BYTES_PER_INPUT_VALUE + \
+            self.pixel_count * self._BYTES_PER_STAND_GEOMETRY
+
+    # Land attributes (e.g. slope) are fetched along with priorities if stand
+    # eligibility depends on them.
+    def _get_num_attributes(
+            self, params: ForsysGenerationRequestParams) -> int:
+        eligibility_params = params.stand_eligibility_params
+        if eligibility_params is None:
+            return 0
+        return int(eligibility_params.filter_by_buildings) + \
+            int(eligibility_params.filter_by_road_proximity) + \
+            int(eligibility_params.filter_by_slope)
+
+    # Python clustering merges pixels into at most num_clusters stands before
+    # forsys runs; otherwise, each pixel is a stand.
+    def _estimate_stand_count(
+            self, params: ForsysGenerationRequestParams) -> int:
+        cluster_params = params.cluster_params
+        if cluster_params is None or \
+                cluster_params.cluster_algorithm_type in (
+                    ClusterAlgorithmType.NONE,
+                    ClusterAlgorithmType.KMEANS_IN_R):
+            return self.pixel_count
+        return min(self.pixel_count, cluster_params.num_clusters)
+
+    def to_dict(self) -> dict:
+        return {'planning_area_in_km2': self.planning_area_in_km2,
+                'pixel_count': self.pixel_count,
+                'window_pixel_count': self.window_pixel_count,
+                'stand_count': self.stand_count,
+                'memory_bytes': self.memory_bytes}
+
+
+# Size limits for generation runs. A limit of 0 disables the check.
+class AdmissionLimits():
+    # Runs estimated to exceed max_pixels or max_memory_bytes are rejected.
+    max_pixels: int
+    max_memory_bytes: int
+    # Synchronous runs with more than max_sync_pixels pixels are queued as
+    # generation jobs instead.
+    max_sync_pixels: int
+    # Runs with more than max_stands stands are clustered (by region
+    # growing) into max_stands stands, since Patchmax slows sharply with stand
+    # count.
+    max_stands: int
+
+    def __init__(self, max_pixels: int = 0, max_memory_bytes: int = 0,
+                 max_sync_pixels: int = 0, max_stands: int = 0):
+        self.max_pixels = max_pixels
+        self.max_memory_bytes = max_memory_bytes
+        self.max_sync_pixels = max_sync_pixels
+        self.max_stands = max_stands
+
+    # Returns limits configured in settings.
+    @staticmethod
+    def from_settings() -> "AdmissionLimits":
+        return AdmissionLimits(
+            settings.FORSYS_MAX_PIXELS,
+            settings.FORSYS_MAX_MEMORY_MB * 1024 * 1024,
+            settings.FORSYS_MAX_SYNC_PIXELS,
+            settings.FORSYS_MAX_STANDS)
+
+
+class AdmissionDecision(IntEnum):
+    ACCEPT = 0
+    # Accepted after enabling clustering (see AdmissionLimits.max_stands).
+    FORCE_CLUSTERING = 1
+    # Too large to run within a request; run it as a generation job.
+    QUEUE = 2
+    REJECT = 3
+
+
+# The outcome of admission control for a generation run.
+class Admission():
+    decision: AdmissionDecision
+    estimate: GenerationEstimate
+    # Explains the decision if it isn't ACCEPT.
+    message: str | None
+
+    def __init__(self, decision: AdmissionDecision,
+                 estimate: GenerationEstimate, message: str | None = None):
+        self.decision = decision
+        self.estimate = estimate
+        self.message = message
+
+    def to_dict(self) -> dict:
+        return {'decision': self.decision.name,
+                'message': self.message,
+                'estimate': self.estimate.to_dict()}
+
+
+# Estimates the size of the generation run described by params and decides
+# whether and how it may run.
+# If the decision is FORCE_CLUSTERING, params.cluster_params is updated.
+# synchronous indicates whether the run would block an HTTP request; only
+# synchronous runs are queued.
+def admit_generation_run(params: ForsysGenerationRequestParams,
+                         limits: AdmissionLimits,
+                         synchronous: bool) -> Admission:
+    estimate = GenerationEstimate(params)
+
+    if limits.max_pixels > 0 and estimate.pixel_count > limits.max_pixels:
+        return Admission(
+            AdmissionDecision.REJECT, estimate,
+            "planning area has an estimated %d pixels (limit: %d)" %
+            (estimate.pixel_count, limits.max_pixels))
+    if limits.max_memory_bytes > 0 and \
+            estimate.memory_bytes > limits.max_memory_bytes:
+        return Admission(
+            AdmissionDecision.REJECT, estimate,
+            "planning area needs an estimated %d MB (limit: %d MB)" %
+            (estimate.memory_bytes // (1024 * 1024),
+             limits.max_memory_bytes // (1024 * 1024)))
+
+    if synchronous and limits.max_sync_pixels > 0 and \
+            estimate.pixel_count > limits.max_sync_pixels:
+        return Admission(
+            AdmissionDecision.QUEUE, estimate,
+            "planning area has an estimated %d pixels " %
+            (estimate.pixel_count) +
+            "(limit for synchronous runs: %d)" % (limits.max_sync_pixels))
+
+    if limits.max_stands > 0 and estimate.stand_count > limits.max_stands:
+        params.cluster_params.cluster_algorithm_type = \
+            ClusterAlgorithmType.REGION_GROWING_IN_PYTHON
+        params.cluster_params.num_clusters = limits.max_stands
+        estimate.stand_count = limits.max_stands
+        return Admission(
+            AdmissionDecision.FORCE_CLUSTERING, estimate,
+            "clustered %d pixels into %d stands" %
+            (estimate.pixel_count, limits.max_stands))
+
+    return Admission(AdmissionDecision.ACCEPT, estimate)
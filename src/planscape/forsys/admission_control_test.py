@@ -0,0 +1,85 @@
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.http import QueryDict
+from django.test import TestCase
+from forsys.admission_control import (AdmissionDecision, AdmissionLimits,
+                                      GenerationEstimate,
+                                      admit_generation_run)
+from forsys.forsys_request_params import (ClusterAlgorithmRequestParams,
+                                          ClusterAlgorithmType,
+                                          ForsysGenerationRequestParams,
+                                          StandEligibilityParams)
+from planscape import settings
+
+
+class AdmissionControlTest(TestCase):
+    def setUp(self) -> None:
+        self.params = ForsysGenerationRequestParams()
+        self.params.priorities = ['foo', 'bar']
+        self.params.priority_weights = [1, 1]
+        self.params.cluster_params = ClusterAlgorithmRequestParams(
+            QueryDict(''))
+        self.params.stand_eligibility_params = StandEligibilityParams()
+        # A 10x10-pixel square (pixels are 300m x 300m) in the raster CRS.
+        self.params.planning_area = MultiPolygon(Polygon(
+            ((0, 0), (0, 3000), (3000, 3000), (3000, 0), (0, 0))))
+        self.params.planning_area.srid = settings.CRS_FOR_RASTERS
+
+    def test_estimates_size(self):
+        estimate = GenerationEstimate(self.params)
+        self.assertAlmostEqual(estimate.planning_area_in_km2, 9)
+        self.assertEqual(estimate.pixel_count, 100)
+        self.assertEqual(estimate.window_pixel_count, 100)
+        self.assertEqual(estimate.stand_count, 100)
+        self.assertGreater(estimate.memory_bytes, 0)
+
+    def test_estimates_stand_count_with_clustering(self):
+        self.params.cluster_params.cluster_algorithm_type = \
+            ClusterAlgorithmType.REGION_GROWING_IN_PYTHON
+        self.params.cluster_params.num_clusters = 20
+        self.assertEqual(GenerationEstimate(self.params).stand_count, 20)
+
+    def test_estimates_more_memory_for_attributes(self):
+        memory_bytes = GenerationEstimate(self.params).memory_bytes
+        self.params.stand_eligibility_params.filter_by_slope = True
+        self.assertGreater(GenerationEstimate(self.params).memory_bytes,
+                           memory_bytes)
+
+    def test_accepts_without_limits(self):
+        admission = admit_generation_run(
+            self.params, AdmissionLimits(), synchronous=True)
+        self.assertEqual(admission.decision, AdmissionDecision.ACCEPT)
+        self.assertIsNone(admission.message)
+        self.assertEqual(admission.to_dict()['estimate']['pixel_count'], 100)
+
+    def test_rejects_too_many_pixels(self):
+        admission = admit_generation_run(
+            self.params, AdmissionLimits(max_pixels=99), synchronous=False)
+        self.assertEqual(admission.decision, AdmissionDecision.REJECT)
+        self.assertEqual(admission.message,
+                         "planning area has an estimated 100 pixels " +
+                         "(limit: 99)")
+
+    def test_rejects_too_much_memory(self):
+        admission = admit_generation_run(
+            self.params, AdmissionLimits(max_memory_bytes=1),
+            synchronous=False)
+        self.assertEqual(admission.decision, AdmissionDecision.REJECT)
+
+    def test_queues_large_synchronous_runs(self):
+        limits = AdmissionLimits(max_sync_pixels=50)
+        self.assertEqual(
+            admit_generation_run(self.params, limits, True).decision,
+            AdmissionDecision.QUEUE)
+        self.assertEqual(
+            admit_generation_run(self.params, limits, False).decision,
+            AdmissionDecision.ACCEPT)
+
+    def test_forces_clustering(self):
+        admission = admit_generation_run(
+            self.params, AdmissionLimits(max_stands=30), synchronous=False)
+        self.assertEqual(admission.decision,
+                         AdmissionDecision.FORCE_CLUSTERING)
+        self.assertEqual(admission.estimate.stand_count, 30)
+        self.assertEqual(self.params.cluster_params.cluster_algorithm_type,
+                         ClusterAlgorithmType.REGION_GROWING_IN_PYTHON)
+        self.assertEqual(self.params.cluster_params.num_clusters, 30)
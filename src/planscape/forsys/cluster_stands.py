@@ -1,8 +1,18 @@
+import hashlib
+import heapq
+import os
+
 import numpy as np
 
-from sklearn.cluster import AgglomerativeClustering
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.cache import cache
+from sklearn.cluster import (AgglomerativeClustering, MiniBatchKMeans,
+                             ward_tree)
 from sklearn.feature_extraction.image import grid_to_graph
+from scipy import sparse
 from scipy.sparse.csgraph import connected_components
+from scipy.stats import rankdata
 
 
 # This compresses stand data by clustering adjacent stands according to a
@@ -42,6 +52,10 @@ from scipy.sparse.csgraph import connected_components
 #
 # The output maps cluster ID's to stand index tuples, (x-index, y-index).
 class ClusteredStands():
+    # If true, every cluster must be contiguous, so the number of clusters
+    # can't be lower than the number of connected components.
+    REQUIRES_CONTIGUOUS_CLUSTERS = True
+
     # -------
     # outputs
     # -------
@@ -98,7 +112,8 @@ class ClusteredStands():
         self._connectivity = grid_to_graph(
             pixel_width, pixel_height, mask=self._mask)
         num_connected_components = connected_components(self._connectivity)[0]
-        if num_connected_components > num_clusters:
+        if self.REQUIRES_CONTIGUOUS_CLUSTERS and \
+                num_connected_components > num_clusters:
             raise Exception(
                 "It's impossible to cluster pixels into %d clusters - " %
                 (num_clusters) +
@@ -113,13 +128,23 @@ class ClusteredStands():
             self._x_to_y_to_condition_to_value, self._mask,
             self._normalized_priority_weights, pixel_index_weight)
 
-        ward = AgglomerativeClustering(
-            n_clusters=num_clusters, linkage='ward',
-            connectivity=self._connectivity
-        ).fit(np.array(self._features))
+        cluster_labels = self._cluster(
+            np.array(self._features), self._connectivity, num_clusters)
 
         self.clusters_to_stands = self._get_cluster_pixels(
-            ward.labels_, self._mask, pixel_width, pixel_height)
+            cluster_labels, self._mask, pixel_width, pixel_height)
+
+    # Assigns a cluster label to each feature vector.
+    # Labels are listed in the same order as features.
+    # Subclasses override this to swap in a different clustering algorithm.
+    def _cluster(self, features: np.ndarray,
+                 connectivity: sparse.spmatrix,
+                 num_clusters: int) -> np.ndarray:
+        ward = AgglomerativeClustering(
+            n_clusters=num_clusters, linkage='ward',
+            connectivity=connectivity
+        ).fit(features)
+        return ward.labels_
 
     # Validates that input parameter values make sense.
     def _validate_input_params(
@@ -245,3 +270,458 @@ class ClusteredStands():
                         cluster_to_pixels[cluster] = [(x, y)]
                     i = i + 1
         return cluster_to_pixels
+
+
+# A near-linear-time alternative to the Ward clustering in ClusteredStands,
+# intended for planning areas with many pixels.
+# Inputs, outputs, feature vectors, and corner-case handling are identical to
+# ClusteredStands.
+#
+# Clusters are computed via seeded region growing:
+#   1. num_clusters seed pixels are spread across the connected components of
+#      the pixel connectivity graph. Each component receives at least one seed
+#      and a number of seeds roughly proportional to its size. Within a
+#      component, seeds are spread out spatially.
+#   2. Starting from the seeds, clusters grow one pixel at a time. Of all
+#      pixels adjacent to a cluster, the next one to be added is the one whose
+#      feature vector is closest to the mean feature vector of its neighboring
+#      cluster.
+# Because clusters only ever absorb adjacent pixels, every cluster is
+# contiguous, and because every seed starts its own cluster, exactly
+# num_clusters clusters are returned.
+# Runtime is O(n log n) given n pixels, and memory is O(n).
+class RegionGrowingClusteredStands(ClusteredStands):
+    def _cluster(self, features: np.ndarray,
+                 connectivity: sparse.spmatrix,
+                 num_clusters: int) -> np.ndarray:
+        connectivity = sparse.csr_matrix(connectivity)
+        num_components, component_labels = connected_components(
+            connectivity)
+        # Pixel positions are listed in the same order as features.
+        positions = np.argwhere(self._mask)
+        seeds = self._select_seeds(
+            positions, component_labels, num_components, num_clusters)
+        return self._grow_regions(features, connectivity, seeds)
+
+    # Selects num_clusters seed pixels and returns their feature indices.
+    def _select_seeds(self, positions: np.ndarray,
+                      component_labels: np.ndarray, num_components: int,
+                      num_clusters: int) -> np.ndarray:
+        component_sizes = np.bincount(
+            component_labels, minlength=num_components)
+        num_seeds = self._allocate_seeds(component_sizes, num_clusters)
+
+        # Pixels are grouped into square blocks sized so that there's roughly
+        # one seed per block. Sorting pixels by component, then by block, then
+        # by position, and selecting evenly spaced pixels from each component
+        # spreads seeds out spatially.
+        block_size = max(1.0, np.sqrt(len(positions) / num_clusters))
+        blocks = (positions // block_size).astype(int)
+        order = np.lexsort((positions[:, 1], positions[:, 0],
+                            blocks[:, 1], blocks[:, 0], component_labels))
+
+        seeds = []
+        start = 0
+        for c in range(num_components):
+            size = component_sizes[c]
+            offsets = ((np.arange(num_seeds[c]) + 0.5) *
+                       size / num_seeds[c]).astype(int)
+            seeds.append(order[start + offsets])
+            start = start + size
+        return np.concatenate(seeds)
+
+    # Splits num_clusters seeds across connected components.
+    # Each component receives at least 1 seed and at most 1 seed per pixel.
+    # The remaining seeds are allocated in proportion to component size via
+    # the largest remainder method.
+    def _allocate_seeds(self, component_sizes: np.ndarray,
+                        num_clusters: int) -> np.ndarray:
+        num_seeds = np.ones(len(component_sizes), dtype=int)
+        num_remaining = num_clusters - len(component_sizes)
+        if num_remaining <= 0:
+            return num_seeds
+        capacity = component_sizes - 1
+        shares = num_remaining * capacity / np.sum(capacity)
+        extra = np.floor(shares).astype(int)
+        num_seeds = num_seeds + extra
+        num_leftover = num_remaining - np.sum(extra)
+        if num_leftover > 0:
+            remainders = shares - extra
+            num_seeds[np.argsort(-remainders, kind='stable')[
+                :num_leftover]] += 1
+        return num_seeds
+
+    # Grows one cluster per seed until every pixel reachable from a seed is
+    # assigned to a cluster.
+    def _grow_regions(self, features: np.ndarray,
+                      connectivity: sparse.csr_matrix,
+                      seeds: np.ndarray) -> np.ndarray:
+        labels = np.full(len(features), -1, dtype=int)
+        feature_sums = features[seeds].astype(float)
+        counts = np.ones(len(seeds))
+        labels[seeds] = np.arange(len(seeds))
+
+        # Heap entries are (distance to cluster mean, pixel, cluster).
+        heap = []
+        for cluster, seed in enumerate(seeds):
+            self._push_unlabeled_neighbors(
+                heap, features, connectivity, labels, seed, cluster,
+                feature_sums[cluster])
+
+        while len(heap) > 0:
+            _, i, cluster = heapq.heappop(heap)
+            if labels[i] >= 0:
+                continue
+            labels[i] = cluster
+            feature_sums[cluster] = feature_sums[cluster] + features[i]
+            counts[cluster] = counts[cluster] + 1
+            self._push_unlabeled_neighbors(
+                heap, features, connectivity, labels, i, cluster,
+                feature_sums[cluster] / counts[cluster])
+        return labels
+
+    # Pushes the unlabeled neighbors of pixel i onto the heap, keyed by their
+    # squared distance to the cluster mean.
+    def _push_unlabeled_neighbors(
+            self, heap: list[tuple[float, int, int]], features: np.ndarray,
+            connectivity: sparse.csr_matrix, labels: np.ndarray, i: int,
+            cluster: int, cluster_mean: np.ndarray) -> None:
+        neighbors = connectivity.indices[
+            connectivity.indptr[i]:connectivity.indptr[i + 1]]
+        neighbors = neighbors[labels[neighbors] < 0]
+        distances = np.sum((features[neighbors] - cluster_mean) ** 2, axis=1)
+        for d, j in zip(distances.tolist(), neighbors.tolist()):
+            heapq.heappush(heap, (d, j, cluster))
+
+
+# Produces the same clusters as ClusteredStands (cluster ID's may differ), but
+# instead of fitting Ward clustering to num_clusters, it computes the full Ward
+# merge tree and cuts it to num_clusters.
+# Merge trees are cached, keyed by a hash of the mask and feature vectors
+# (which capture stand eligibility, priority weights, and pixel_index_weight).
+# Subsequent calls with the same inputs and a different num_clusters skip the
+# clustering step and only cut the cached tree, which takes linear time.
+class MergeTreeClusteredStands(ClusteredStands):
+    # Time to cache merge trees, in seconds.
+    CACHE_TIME_IN_SECONDS = 60 * 60
+    _CACHE_KEY_PREFIX = 'forsys_ward_merge_tree_'
+
+    def _cluster(self, features: np.ndarray,
+                 connectivity: sparse.spmatrix,
+                 num_clusters: int) -> np.ndarray:
+        key = self._get_cache_key(features, self._mask)
+        children = cache.get(key)
+        if children is None:
+            children = ward_tree(features, connectivity=connectivity)[0]
+            # int32 halves the cached size; pixel counts are far below 2^31.
+            children = children.astype(np.int32)
+            cache.set(key, children, self.CACHE_TIME_IN_SECONDS)
+        return self._cut_merge_tree(children, len(features), num_clusters)
+
+    # Returns a cache key identifying the inputs to ward_tree.
+    def _get_cache_key(self, features: np.ndarray, mask: np.ndarray) -> str:
+        h = hashlib.sha256()
+        h.update(np.array(mask.shape, dtype=np.int64).tobytes())
+        h.update(np.packbits(mask).tobytes())
+        h.update(np.ascontiguousarray(features, dtype=np.float64).tobytes())
+        return self._CACHE_KEY_PREFIX + h.hexdigest()
+
+    # Cuts a merge tree so that num_clusters clusters remain.
+    # children[i] lists the two nodes merged into node, num_leaves + i; nodes
+    # below num_leaves are leaves (i.e. feature vectors). Merges are listed in
+    # the order they happened, so undoing the last num_clusters - 1 merges
+    # leaves num_clusters clusters.
+    def _cut_merge_tree(self, children: np.ndarray, num_leaves: int,
+                        num_clusters: int) -> np.ndarray:
+        num_merges = num_leaves - num_clusters
+        node_labels = np.full(num_leaves + num_merges, -1, dtype=int)
+        next_label = 0
+        # Nodes are visited top-down so that each cluster root passes its
+        # label down to every descendant.
+        for i in range(num_merges - 1, -1, -1):
+            node = num_leaves + i
+            if node_labels[node] < 0:
+                node_labels[node] = next_label
+                next_label = next_label + 1
+            node_labels[children[i]] = node_labels[node]
+
+        labels = node_labels[:num_leaves]
+        unmerged = labels < 0
+        labels[unmerged] = np.arange(next_label, next_label + np.sum(unmerged))
+        return labels
+
+
+# Fits Ward clustering to a single tile.
+# Defined at module level so that it can be pickled and sent to worker
+# processes.
+def _cluster_tile(features: np.ndarray, connectivity: sparse.spmatrix,
+                  num_clusters: int) -> np.ndarray:
+    if num_clusters >= len(features):
+        return np.arange(len(features))
+    ward = AgglomerativeClustering(
+        n_clusters=num_clusters, linkage='ward',
+        connectivity=connectivity
+    ).fit(features)
+    return ward.labels_
+
+
+# A divide-and-conquer version of ClusteredStands for very large planning
+# areas.
+# Inputs, outputs, feature vectors, and corner-case handling are identical to
+# ClusteredStands.
+#
+# Clusters are computed as follows:
+#   1. The pixel grid is split into TILE_SIZE x TILE_SIZE core tiles. Each tile
+#      is padded by TILE_OVERLAP pixels on every side.
+#   2. Each padded tile is clustered with Ward clustering in a process pool.
+#      A tile receives a share of num_clusters proportional to its number of
+#      core pixels, multiplied by OVERSEGMENTATION_FACTOR.
+#   3. Tile clusters are cropped to their core tiles and split into
+#      contiguous segments (cropping may cut a cluster in two).
+#   4. Seams are reconciled by merging adjacent segments - including segments
+#      from different tiles - with Ward linkage until num_clusters clusters
+#      remain.
+# Since each process only holds one tile's connectivity graph, memory per
+# process is bounded by the tile size rather than the planning area size.
+class TiledClusteredStands(ClusteredStands):
+    # Width and height of a core tile, in pixels.
+    TILE_SIZE = 256
+    # Number of pixels each tile extends past its core tile. Overlap lets
+    # clusters along tile edges take their neighbors into account.
+    TILE_OVERLAP = 16
+    # Tiles produce more clusters than their share of num_clusters so that
+    # the final merge step has room to reconcile clusters cut by tile seams.
+    OVERSEGMENTATION_FACTOR = 2
+    # Maximum number of worker processes. If None, os.cpu_count() is used. If
+    # 1, tiles are clustered in the calling process.
+    MAX_WORKERS = None
+
+    def _cluster(self, features: np.ndarray,
+                 connectivity: sparse.spmatrix,
+                 num_clusters: int) -> np.ndarray:
+        width, height = self._mask.shape
+        if width <= self.TILE_SIZE and height <= self.TILE_SIZE:
+            return ClusteredStands._cluster(
+                self, features, connectivity, num_clusters)
+
+        connectivity = sparse.csr_matrix(connectivity)
+        pixel_to_index = np.full(self._mask.shape, -1, dtype=int)
+        pixel_to_index[self._mask] = np.arange(len(features))
+
+        tile_labels = self._cluster_tiles(
+            features, connectivity, pixel_to_index, num_clusters)
+        segment_labels = self._split_into_contiguous_segments(
+            tile_labels, connectivity)
+        if np.max(segment_labels) + 1 < num_clusters:
+            # Rare: too few clusters survived cropping to reach num_clusters
+            # by merging.
+            return ClusteredStands._cluster(
+                self, features, connectivity, num_clusters)
+        return self._merge_segments(
+            features, connectivity, segment_labels, num_clusters)
+
+    # Clusters each tile and returns a label for each feature vector.
+    # Labels are unique across tiles.
+    def _cluster_tiles(self, features: np.ndarray,
+                       connectivity: sparse.csr_matrix,
+                       pixel_to_index: np.ndarray,
+                       num_clusters: int) -> np.ndarray:
+        width, height = pixel_to_index.shape
+        jobs = []
+        for x in range(0, width, self.TILE_SIZE):
+            for y in range(0, height, self.TILE_SIZE):
+                core = pixel_to_index[x:x + self.TILE_SIZE,
+                                      y:y + self.TILE_SIZE]
+                core = core[core >= 0]
+                if len(core) == 0:
+                    continue
+                padded = pixel_to_index[
+                    max(0, x - self.TILE_OVERLAP):
+                    x + self.TILE_SIZE + self.TILE_OVERLAP,
+                    max(0, y - self.TILE_OVERLAP):
+                    y + self.TILE_SIZE + self.TILE_OVERLAP]
+                padded = padded[padded >= 0]
+                tile_connectivity = connectivity[padded][:, padded]
+                num_tile_clusters = int(np.ceil(
+                    self.OVERSEGMENTATION_FACTOR * num_clusters * len(core) /
+                    len(features)))
+                # Ward clustering can't produce contiguous clusters if there
+                # are fewer clusters than connected components.
+                num_tile_clusters = max(
+                    num_tile_clusters,
+                    connected_components(tile_connectivity)[0])
+                jobs.append((core, padded, (
+                    features[padded], tile_connectivity, num_tile_clusters)))
+
+        if self.MAX_WORKERS == 1 or len(jobs) == 1:
+            results = [_cluster_tile(*args) for _, _, args in jobs]
+        else:
+            max_workers = min(len(jobs), self.MAX_WORKERS or os.cpu_count())
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(
+                    _cluster_tile, *zip(*[args for _, _, args in jobs])))
+
+        labels = np.full(len(features), -1, dtype=int)
+        next_label = 0
+        for (core, padded, _), tile_labels in zip(jobs, results):
+            # Crops tile clusters to the core tile.
+            padded_to_tile_label = dict(zip(padded.tolist(),
+                                            tile_labels.tolist()))
+            labels[core] = next_label + np.array(
+                [padded_to_tile_label[i] for i in core.tolist()])
+            next_label = next_label + np.max(tile_labels) + 1
+        return labels
+
+    # Relabels pixels so that each label denotes a contiguous segment.
+    def _split_into_contiguous_segments(
+            self, labels: np.ndarray,
+            connectivity: sparse.csr_matrix) -> np.ndarray:
+        coo = connectivity.tocoo()
+        same_label = labels[coo.row] == labels[coo.col]
+        graph = sparse.csr_matrix(
+            (np.ones(np.sum(same_label)),
+             (coo.row[same_label], coo.col[same_label])),
+            shape=connectivity.shape)
+        return connected_components(graph)[1]
+
+    # Greedily merges adjacent segments with the smallest increase in Ward
+    # variance until num_clusters clusters remain.
+    def _merge_segments(self, features: np.ndarray,
+                        connectivity: sparse.csr_matrix,
+                        segment_labels: np.ndarray,
+                        num_clusters: int) -> np.ndarray:
+        num_segments = np.max(segment_labels) + 1
+        sizes = np.bincount(segment_labels, minlength=num_segments).astype(
+            float)
+        sums = np.zeros((num_segments, features.shape[1]))
+        np.add.at(sums, segment_labels, features)
+
+        coo = connectivity.tocoo()
+        a = segment_labels[coo.row]
+        b = segment_labels[coo.col]
+        crossing = a != b
+        neighbors = [set() for _ in range(num_segments)]
+        for i, j in zip(a[crossing].tolist(), b[crossing].tolist()):
+            neighbors[i].add(j)
+
+        # Heap entries are (merge cost, segment, segment, segment versions).
+        # Entries whose versions are stale are skipped when popped.
+        versions = [0] * num_segments
+        heap = []
+        for i in range(num_segments):
+            for j in neighbors[i]:
+                if i < j:
+                    heap.append((self._get_ward_cost(sizes, sums, i, j),
+                                 i, j, 0, 0))
+        heapq.heapify(heap)
+
+        # Maps each segment to the segment it was merged into.
+        merged_into = np.arange(num_segments)
+        num_remaining = num_segments
+        while num_remaining > num_clusters and len(heap) > 0:
+            _, i, j, version_i, version_j = heapq.heappop(heap)
+            if versions[i] != version_i or versions[j] != version_j:
+                continue
+            # Merges j into i.
+            sizes[i] = sizes[i] + sizes[j]
+            sums[i] = sums[i] + sums[j]
+            merged_into[j] = i
+            versions[i] = versions[i] + 1
+            versions[j] = -1
+            neighbors[i] = (neighbors[i] | neighbors[j]) - {i, j}
+            for k in neighbors[j]:
+                neighbors[k].discard(j)
+                if k != i:
+                    neighbors[k].add(i)
+            neighbors[j] = set()
+            for k in neighbors[i]:
+                heapq.heappush(heap, (
+                    self._get_ward_cost(sizes, sums, i, k),
+                    min(i, k), max(i, k),
+                    versions[min(i, k)], versions[max(i, k)]))
+            num_remaining = num_remaining - 1
+
+        # Resolves chains of merges, then renumbers clusters from 0.
+        roots = np.arange(num_segments)
+        for s in range(num_segments):
+            r = s
+            while merged_into[r] != r:
+                r = merged_into[r]
+            roots[s] = r
+            merged_into[s] = r
+        return np.unique(roots, return_inverse=True)[1][segment_labels]
+
+    # Returns the increase in within-cluster variance from merging segments
+    # i and j.
+    def _get_ward_cost(self, sizes: np.ndarray, sums: np.ndarray,
+                       i: int, j: int) -> float:
+        diff = sums[i] / sizes[i] - sums[j] / sizes[j]
+        return float(sizes[i] * sizes[j] / (sizes[i] + sizes[j]) *
+                     np.dot(diff, diff))
+
+
+# A python port of kmeans_cluster_cells_to_stands.R, which lets
+# ClusterAlgorithmType.KMEANS_IN_PYTHON skip the R round trip for clustering.
+# Inputs, outputs, and corner-case handling are identical to ClusteredStands,
+# except that clusters need not be contiguous, and pixel_index_weight is
+# ignored in favor of GEO_WEIGHT.
+#
+# As in the R script, the feature vector is ...
+# [
+#   GEO_WEIGHT * normalized x-index,
+#   GEO_WEIGHT * normalized y-index,
+#   normalized weighted priority
+# ]
+# where weighted priority is a weighted sum of the percentile rank of each
+# priority condition (the forsys "PCP" value), and normalization maps values
+# to [0, 1].
+class KMeansClusteredStands(ClusteredStands):
+    REQUIRES_CONTIGUOUS_CLUSTERS = False
+
+    # How much emphasis to place on pixel location relative to weighted
+    # priority.
+    GEO_WEIGHT = 2
+    # Controls random state initialization.
+    SEED = 42
+    # Number of pixels in each mini-batch.
+    BATCH_SIZE = 4096
+
+    def _get_features(self,
+                      pixel_dist_to_condition_values:
+                      dict[int, dict[int, dict[str, float]]],
+                      mask: list[list[bool]],
+                      priority_weights: dict[str, float],
+                      pixel_index_weight: float) -> list[list[float]]:
+        positions = np.argwhere(mask)
+        weighted_priorities = np.zeros(len(positions))
+        for p in priority_weights.keys():
+            values = np.array([pixel_dist_to_condition_values[x][y][p]
+                               for x, y in positions.tolist()])
+            weighted_priorities = weighted_priorities + \
+                priority_weights[p] * self._get_percentile_rank(values)
+        return np.column_stack((
+            self.GEO_WEIGHT * self._normalize(positions[:, 0]),
+            self.GEO_WEIGHT * self._normalize(positions[:, 1]),
+            self._normalize(weighted_priorities))).tolist()
+
+    def _cluster(self, features: np.ndarray,
+                 connectivity: sparse.spmatrix,
+                 num_clusters: int) -> np.ndarray:
+        kmeans = MiniBatchKMeans(
+            n_clusters=num_clusters, random_state=self.SEED,
+            batch_size=self.BATCH_SIZE, n_init=3).fit(features)
+        return kmeans.labels_
+
+    # Returns the percentile rank of each value, from 0 (lowest) to 1
+    # (highest). Ties share the lowest rank.
+    def _get_percentile_rank(self, values: np.ndarray) -> np.ndarray:
+        if len(values) <= 1:
+            return np.zeros(len(values))
+        return (rankdata(values, method='min') - 1) / (len(values) - 1)
+
+    # Linearly maps values onto [0, 1].
+    def _normalize(self, values: np.ndarray) -> np.ndarray:
+        value_range = np.max(values) - np.min(values)
+        if value_range == 0:
+            return np.zeros(len(values))
+        return (values - np.min(values)) / value_range
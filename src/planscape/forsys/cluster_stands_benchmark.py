@@ -0,0 +1,110 @@
+import argparse
+import time
+
+import numpy as np
+
+from scipy.sparse.csgraph import connected_components
+from sklearn.feature_extraction.image import grid_to_graph
+
+from forsys.cluster_stands import (ClusteredStands,
+                                   RegionGrowingClusteredStands,
+                                   TiledClusteredStands)
+
+
+# Compares stand clustering engines on synthetic rasters.
+# For each engine and raster size, reports ...
+#   ... runtime in seconds
+#   ... inertia: the sum of squared distances between feature vectors and
+#       their cluster's mean feature vector (lower is better)
+#   ... the number of clusters that aren't contiguous (should be 0)
+#
+# Usage (from src/planscape):
+#   python -m forsys.cluster_stands_benchmark --sizes 50 100 200
+def _generate_raster(
+        size: int, num_priorities: int,
+        rng: np.random.Generator) -> dict[int, dict[int, dict[str, float]]]:
+    # Smooth condition scores resemble real condition rasters more than white
+    # noise does; a handful of holes simulates missing condition values.
+    xs, ys = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    values = {}
+    for p in range(num_priorities):
+        fx, fy, phase = rng.uniform(1, 4), rng.uniform(1, 4), rng.uniform(0, 6)
+        v = 0.5 + 0.4 * np.sin(fx * xs / size * np.pi + phase) * \
+            np.cos(fy * ys / size * np.pi) + rng.normal(0, 0.05, xs.shape)
+        values['p%d' % p] = np.clip(v, 0, 1)
+    holes = rng.random(xs.shape) < 0.02
+
+    x_to_y_to_condition_to_value = {}
+    for x in range(size):
+        x_to_y_to_condition_to_value[x] = {}
+        for y in range(size):
+            if holes[x, y]:
+                continue
+            x_to_y_to_condition_to_value[x][y] = {
+                p: float(values[p][x, y]) for p in values.keys()}
+    return x_to_y_to_condition_to_value
+
+
+# Computes inertia and the number of non-contiguous clusters.
+def _evaluate(clustered_stands: ClusteredStands, size: int) -> tuple[float,
+                                                                     int]:
+    features = np.array(clustered_stands._features)
+    mask = clustered_stands._mask
+    index = np.full(mask.shape, -1)
+    index[mask] = np.arange(np.sum(mask))
+
+    inertia = 0.0
+    num_noncontiguous = 0
+    for stands in clustered_stands.clusters_to_stands.values():
+        rows = np.array([index[x, y] for x, y in stands])
+        f = features[rows]
+        inertia = inertia + float(np.sum((f - f.mean(axis=0)) ** 2))
+
+        cluster_mask = np.full(mask.shape, False)
+        for x, y in stands:
+            cluster_mask[x, y] = True
+        graph = grid_to_graph(size, size, mask=cluster_mask)
+        if connected_components(graph)[0] > 1:
+            num_noncontiguous = num_noncontiguous + 1
+    return inertia, num_noncontiguous
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks stand clustering engines.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[50, 100],
+                        help='Raster widths (rasters are square).')
+    parser.add_argument('--stands_per_cluster', type=int, default=20,
+                        help='Sets num_clusters to num stands / this value.')
+    parser.add_argument('--num_priorities', type=int, default=3)
+    parser.add_argument('--pixel_index_weight', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    engines = [ClusteredStands, RegionGrowingClusteredStands,
+               TiledClusteredStands]
+    print('%-30s %8s %9s %10s %12s %14s' % (
+        'engine', 'size', 'clusters', 'seconds', 'inertia',
+        'noncontiguous'))
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        raster = _generate_raster(size, args.num_priorities, rng)
+        priority_weights = {
+            'p%d' % p: float(p + 1) for p in range(args.num_priorities)}
+        num_stands = sum(len(raster[x]) for x in raster.keys())
+        num_clusters = max(1, num_stands // args.stands_per_cluster)
+        for engine in engines:
+            start = time.perf_counter()
+            clustered_stands = engine(
+                raster, size, size, priority_weights,
+                args.pixel_index_weight, num_clusters)
+            seconds = time.perf_counter() - start
+            inertia, num_noncontiguous = _evaluate(clustered_stands, size)
+            print('%-30s %8d %9d %10.3f %12.3f %14d' % (
+                engine.__name__, size,
+                len(clustered_stands.clusters_to_stands), seconds, inertia,
+                num_noncontiguous))
+
+
+if __name__ == '__main__':
+    main()
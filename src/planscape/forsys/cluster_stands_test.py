@@ -1,5 +1,14 @@
+import numpy as np
+
+from django.core.cache import cache
 from django.test import TestCase
-from forsys.cluster_stands import ClusteredStands
+from forsys.cluster_stands import (ClusteredStands,
+                                   KMeansClusteredStands,
+                                   MergeTreeClusteredStands,
+                                   RegionGrowingClusteredStands,
+                                   TiledClusteredStands)
+from scipy.sparse.csgraph import connected_components
+from sklearn.feature_extraction.image import grid_to_graph
 
 
 class ClusterStandsTest(TestCase):
@@ -416,3 +425,330 @@ class ClusterStandsTest(TestCase):
         self.assertEqual(
             str(context.exception),
             "expected len(priorities) == len(conditions)")
+
+
+class RegionGrowingClusteredStandsTest(TestCase):
+    def test_clusters_pixels(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.1}},
+            1: {0: {'foo': 0.1}},
+            2: {0: {'foo': 0.9}},
+            3: {0: {'foo': 0.9}},
+        }
+        priority_weights = {
+            'foo': 10
+        }
+        clustered_stands = RegionGrowingClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=4, pixel_height=1,
+            priority_weights=priority_weights, pixel_index_weight=0,
+            num_clusters=2)
+        self.assertDictEqual(clustered_stands.clusters_to_stands,
+                             {0: [(0, 0), (1, 0)],
+                              1: [(2, 0), (3, 0)]})
+
+    def test_seeds_every_connected_component(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.5},  1: {'foo': 0.2}},
+            2: {0: {'foo': 0.3},  1: {'foo': 0.6}},
+        }
+        priority_weights = {
+            'foo': 10
+        }
+        clustered_stands = RegionGrowingClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=3, pixel_height=2,
+            priority_weights=priority_weights, pixel_index_weight=0,
+            num_clusters=2)
+        self.assertDictEqual(clustered_stands.clusters_to_stands,
+                             {0: [(0, 0), (0, 1)],
+                              1: [(2, 0), (2, 1)]})
+
+    def test_returns_num_clusters_contiguous_clusters(self) -> None:
+        rng = np.random.default_rng(0)
+        pixel_dist_to_condition_values = {}
+        for x in range(20):
+            pixel_dist_to_condition_values[x] = {}
+            for y in range(15):
+                # Carves out a vertical gap, splitting the image in two.
+                if x == 10 and y > 0:
+                    continue
+                pixel_dist_to_condition_values[x][y] = {
+                    'foo': float(rng.random()), 'bar': float(rng.random())}
+        priority_weights = {
+            'foo': 1,
+            'bar': 2
+        }
+        clustered_stands = RegionGrowingClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=20, pixel_height=15,
+            priority_weights=priority_weights, pixel_index_weight=0.01,
+            num_clusters=25)
+
+        clusters = clustered_stands.clusters_to_stands
+        self.assertEqual(len(clusters), 25)
+        self.assertEqual(sum([len(clusters[c]) for c in clusters.keys()]),
+                         20 * 15 - 14)
+        for c in clusters.keys():
+            mask = np.full((20, 15), False)
+            for x, y in clusters[c]:
+                mask[x, y] = True
+            self.assertEqual(
+                connected_components(grid_to_graph(20, 15, mask=mask))[0], 1)
+
+    def test_handles_more_clusters_than_stands(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.5},  1: {'foo': 0.2}},
+            1: {0: {'foo': 0.45}, 1: {'foo': 0.2}},
+        }
+        priority_weights = {
+            'foo': 10
+        }
+        clustered_stands = RegionGrowingClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=2, pixel_height=2,
+            priority_weights=priority_weights, pixel_index_weight=0,
+            num_clusters=10)
+        self.assertEqual(clustered_stands.cluster_status_message,
+                         "num desired clusters >= num stands")
+
+    def test_raises_connectivity_error(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.5},  1: {'foo': 0.2}},
+            2: {0: {'foo': 0.3},  1: {'foo': 0.6}},
+        }
+        priority_weights = {
+            'foo': 10
+        }
+        with self.assertRaises(Exception) as context:
+            RegionGrowingClusteredStands(
+                pixel_dist_to_condition_values, pixel_width=3, pixel_height=2,
+                priority_weights=priority_weights, pixel_index_weight=0,
+                num_clusters=1)
+        self.assertEqual(
+            str(context.exception),
+            "It's impossible to cluster pixels into 1 clusters - due to missing condition values, the smallest possible number of clusters is 2")
+
+
+class MergeTreeClusteredStandsTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        rng = np.random.default_rng(0)
+        self.pixel_dist_to_condition_values = {}
+        for x in range(12):
+            self.pixel_dist_to_condition_values[x] = {}
+            for y in range(10):
+                self.pixel_dist_to_condition_values[x][y] = {
+                    'foo': float(rng.random()), 'bar': float(rng.random())}
+        self.priority_weights = {
+            'foo': 1,
+            'bar': 2
+        }
+
+    def _get_clusters_as_sets(
+            self, clusters_to_stands: dict[int, list[tuple[int, int]]]
+    ) -> set[frozenset[tuple[int, int]]]:
+        return set([frozenset(stands)
+                    for stands in clusters_to_stands.values()])
+
+    def test_matches_clustered_stands(self) -> None:
+        for num_clusters in [1, 7, 30, 100]:
+            expected = ClusteredStands(
+                self.pixel_dist_to_condition_values, pixel_width=12,
+                pixel_height=10, priority_weights=self.priority_weights,
+                pixel_index_weight=0.01, num_clusters=num_clusters)
+            clustered_stands = MergeTreeClusteredStands(
+                self.pixel_dist_to_condition_values, pixel_width=12,
+                pixel_height=10, priority_weights=self.priority_weights,
+                pixel_index_weight=0.01, num_clusters=num_clusters)
+            self.assertEqual(
+                len(clustered_stands.clusters_to_stands), num_clusters)
+            self.assertSetEqual(
+                self._get_clusters_as_sets(
+                    clustered_stands.clusters_to_stands),
+                self._get_clusters_as_sets(expected.clusters_to_stands))
+
+    def test_caches_merge_tree(self) -> None:
+        clustered_stands = MergeTreeClusteredStands(
+            self.pixel_dist_to_condition_values, pixel_width=12,
+            pixel_height=10, priority_weights=self.priority_weights,
+            pixel_index_weight=0.01, num_clusters=10)
+        key = clustered_stands._get_cache_key(
+            np.array(clustered_stands._features), clustered_stands._mask)
+        self.assertEqual(len(cache.get(key)), 12 * 10 - 1)
+
+        # Changing weights changes features and, thus, the cache key.
+        self.priority_weights['foo'] = 5
+        other = MergeTreeClusteredStands(
+            self.pixel_dist_to_condition_values, pixel_width=12,
+            pixel_height=10, priority_weights=self.priority_weights,
+            pixel_index_weight=0.01, num_clusters=10)
+        self.assertNotEqual(
+            other._get_cache_key(np.array(other._features), other._mask), key)
+
+    def test_cuts_cached_merge_tree(self) -> None:
+        # Nodes 3 = {0, 1}, 4 = {2, 3}.
+        children = np.array([[0, 1], [2, 3]])
+        clustered_stands = MergeTreeClusteredStands(
+            self.pixel_dist_to_condition_values, pixel_width=12,
+            pixel_height=10, priority_weights=self.priority_weights,
+            pixel_index_weight=0.01, num_clusters=10)
+        self.assertListEqual(
+            list(clustered_stands._cut_merge_tree(children, 3, 1)),
+            [0, 0, 0])
+        self.assertListEqual(
+            list(clustered_stands._cut_merge_tree(children, 3, 2)),
+            [0, 0, 1])
+        self.assertListEqual(
+            list(clustered_stands._cut_merge_tree(children, 3, 3)),
+            [0, 1, 2])
+
+
+# Uses small tiles so that test inputs span several tiles.
+class SmallTileClusteredStands(TiledClusteredStands):
+    TILE_SIZE = 6
+    TILE_OVERLAP = 2
+    MAX_WORKERS = 1
+
+
+class TiledClusteredStandsTest(TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        self.pixel_dist_to_condition_values = {}
+        for x in range(20):
+            self.pixel_dist_to_condition_values[x] = {}
+            for y in range(15):
+                # Carves out a vertical gap, splitting the image in two.
+                if x == 10 and y > 0:
+                    continue
+                self.pixel_dist_to_condition_values[x][y] = {
+                    'foo': float(rng.random()), 'bar': float(rng.random())}
+        self.priority_weights = {
+            'foo': 1,
+            'bar': 2
+        }
+
+    def _assert_contiguous_clusters(
+            self, clusters_to_stands: dict[int, list[tuple[int, int]]],
+            num_clusters: int) -> None:
+        self.assertEqual(len(clusters_to_stands), num_clusters)
+        self.assertEqual(
+            sum([len(clusters_to_stands[c])
+                 for c in clusters_to_stands.keys()]),
+            20 * 15 - 14)
+        for c in clusters_to_stands.keys():
+            mask = np.full((20, 15), False)
+            for x, y in clusters_to_stands[c]:
+                mask[x, y] = True
+            self.assertEqual(
+                connected_components(grid_to_graph(20, 15, mask=mask))[0], 1)
+
+    def test_returns_num_clusters_contiguous_clusters(self) -> None:
+        for num_clusters in [2, 9, 40]:
+            clustered_stands = SmallTileClusteredStands(
+                self.pixel_dist_to_condition_values, pixel_width=20,
+                pixel_height=15, priority_weights=self.priority_weights,
+                pixel_index_weight=0.01, num_clusters=num_clusters)
+            self._assert_contiguous_clusters(
+                clustered_stands.clusters_to_stands, num_clusters)
+
+    def test_clusters_tiles_in_process_pool(self) -> None:
+        class PooledSmallTileClusteredStands(SmallTileClusteredStands):
+            MAX_WORKERS = 2
+
+        clustered_stands = PooledSmallTileClusteredStands(
+            self.pixel_dist_to_condition_values, pixel_width=20,
+            pixel_height=15, priority_weights=self.priority_weights,
+            pixel_index_weight=0.01, num_clusters=9)
+        expected = SmallTileClusteredStands(
+            self.pixel_dist_to_condition_values, pixel_width=20,
+            pixel_height=15, priority_weights=self.priority_weights,
+            pixel_index_weight=0.01, num_clusters=9)
+        self.assertDictEqual(clustered_stands.clusters_to_stands,
+                             expected.clusters_to_stands)
+
+    def test_merges_clusters_across_seams(self) -> None:
+        # Two uniform halves, split at x = 8, which doesn't line up with tile
+        # boundaries at x = 6 and x = 12.
+        pixel_dist_to_condition_values = {}
+        for x in range(18):
+            pixel_dist_to_condition_values[x] = {}
+            for y in range(4):
+                pixel_dist_to_condition_values[x][y] = {
+                    'foo': 0.1 if x < 8 else 0.9}
+        clustered_stands = SmallTileClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=18, pixel_height=4,
+            priority_weights={'foo': 1}, pixel_index_weight=0,
+            num_clusters=2)
+        self.assertSetEqual(
+            set([frozenset(stands) for stands in
+                 clustered_stands.clusters_to_stands.values()]),
+            set([frozenset([(x, y) for x in range(8) for y in range(4)]),
+                 frozenset([(x, y) for x in range(8, 18)
+                            for y in range(4)])]))
+
+    def test_falls_back_to_ward_for_a_single_tile(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.5},  1: {'foo': 0.2}},
+            1: {0: {'foo': 0.45}, 1: {'foo': 0.2}},
+            2: {0: {'foo': 0.3},  1: {'foo': 0.6}},
+        }
+        clustered_stands = TiledClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=3, pixel_height=2,
+            priority_weights={'foo': 10}, pixel_index_weight=0,
+            num_clusters=5)
+        self.assertDictEqual(clustered_stands.clusters_to_stands,
+                             {0: [(0, 1), (1, 1)],
+                              1: [(2, 0)],
+                              2: [(2, 1)],
+                              3: [(1, 0)],
+                              4: [(0, 0)]})
+
+
+class KMeansClusteredStandsTest(TestCase):
+    def test_clusters_pixels(self) -> None:
+        # Two groups of similar values, far apart from each other.
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.1}},
+            1: {0: {'foo': 0.15}},
+            2: {0: {'foo': 0.12}},
+            8: {0: {'foo': 0.9}},
+            9: {0: {'foo': 0.95}},
+        }
+        clustered_stands = KMeansClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=10, pixel_height=1,
+            priority_weights={'foo': 1}, pixel_index_weight=0,
+            num_clusters=2)
+        self.assertSetEqual(
+            set([frozenset(stands) for stands in
+                 clustered_stands.clusters_to_stands.values()]),
+            set([frozenset([(0, 0), (1, 0), (2, 0)]),
+                 frozenset([(8, 0), (9, 0)])]))
+
+    def test_allows_fewer_clusters_than_connected_components(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.5},  1: {'foo': 0.2}},
+            2: {0: {'foo': 0.3},  1: {'foo': 0.6}},
+        }
+        clustered_stands = KMeansClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=3, pixel_height=2,
+            priority_weights={'foo': 10}, pixel_index_weight=0,
+            num_clusters=1)
+        self.assertDictEqual(clustered_stands.clusters_to_stands,
+                             {0: [(0, 0), (0, 1), (2, 0), (2, 1)]})
+
+    def test_computes_normalized_features(self) -> None:
+        pixel_dist_to_condition_values = {
+            0: {0: {'foo': 0.5, 'bar': 0.1}, 1: {'foo': 0.2, 'bar': 0.1}},
+            1: {0: {'foo': 0.5, 'bar': 0.3}},
+            2: {1: {'foo': 0.3, 'bar': 0.2}},
+        }
+        clustered_stands = KMeansClusteredStands(
+            pixel_dist_to_condition_values, pixel_width=3, pixel_height=2,
+            priority_weights={'foo': 1, 'bar': 3}, pixel_index_weight=0,
+            num_clusters=2)
+        # Percentile ranks for foo are [2/3, 0, 2/3, 1/3], and for bar, they
+        # are [0, 0, 1, 2/3]. With l1-normalized weights, weighted
+        # priorities are [1/6, 0, 11/12, 7/12].
+        np.testing.assert_array_almost_equal(
+            clustered_stands._features,
+            [[0, 0, 2 / 11],
+             [0, 2, 0],
+             [1, 0, 1],
+             [2, 2, 7 / 11]])
@@ -1,7 +1,9 @@
+import copy
 from enum import IntEnum
 
 from boundary.models import BoundaryDetails
-from conditions.models import BaseCondition
+from conditions.catalog import get_condition_name
+from conditions.raster_utils import get_raster_geo, get_stored_raster_geo
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
 from django.http import HttpRequest, QueryDict
@@ -17,6 +19,9 @@ from planscape import settings
 # ForsysGenerationRequestParamsType.
 # Parameter value is expected to be an integer.
 _URL_REQUEST_PARAMS_TYPE = "request_type"
+# URL parameter name for RankingEngine.
+# Parameter value is expected to be an integer.
+_URL_RANKING_ENGINE = "ranking_engine"
 
 
 class ForsysRankingRequestParamsType(IntEnum):
@@ -33,12 +38,28 @@ class ForsysGenerationRequestParamsType(IntEnum):
     MIDDLE_FORK_HUC12S_WITH_DEFAULTS = 5  # MiddleForkForsysGenerationParams
 
 
+# How projects are ranked.
+class RankingEngine(IntEnum):
+    # forsys::run, via rpy2.
+    R = 0
+    # forsys.ranking_engine, a NumPy port of the R ranking scripts.
+    PYTHON = 1
+
+
 # Whether and how to cluster before running Patchmax for project area
 # generation.
 class ClusterAlgorithmType(IntEnum):
     NONE = 0
     HIERARCHICAL_IN_PYTHON = 1
     KMEANS_IN_R = 2
+    # Seeded region growing; scales to much larger planning areas than
+    # HIERARCHICAL_IN_PYTHON.
+    REGION_GROWING_IN_PYTHON = 3
+    # Ward clustering on overlapping tiles in a process pool, with clusters
+    # along tile seams merged afterwards.
+    TILED_HIERARCHICAL_IN_PYTHON = 4
+    # Mini-batch k-means; an in-process equivalent of KMEANS_IN_R.
+    KMEANS_IN_PYTHON = 5
 
 
 class ClusterAlgorithmRequestParams():
@@ -51,6 +72,10 @@ class ClusterAlgorithmRequestParams():
     # parameters for ClusteredStands. It controls the extent to which we favor
     # rounder, smaller clusters.
     _URL_CLUSTER_PIXEL_INDEX_WEIGHT = 'cluster_pixel_index_weight'
+    # For HIERARCHICAL_IN_PYTHON clustering: if true, the full Ward merge tree
+    # is cached so that later requests differing only in num_clusters skip
+    # re-clustering.
+    _URL_CLUSTER_CACHE_MERGE_TREE = 'cluster_cache_merge_tree'
 
     # Constants that act as default values when parsing url parameters.
     # By default, no clustering occurs.
@@ -58,6 +83,7 @@ class ClusterAlgorithmRequestParams():
     # TODO: select default parameter values.
     _DEFAULT_NUM_CLUSTERS = 500
     _DEFAULT_CLUSTER_PIXEL_INDEX_WEIGHT = 0.01
+    _DEFAULT_CLUSTER_CACHE_MERGE_TREE = False
 
     # Cluster algorithm type.
     cluster_algorithm_type: ClusterAlgorithmType
@@ -66,6 +92,8 @@ class ClusterAlgorithmRequestParams():
     # Cluster pixel index weight - this controls the roundness and size of
     # clusters, if enabled.
     pixel_index_weight: float
+    # Whether to cache the Ward merge tree (see MergeTreeClusteredStands).
+    cache_merge_tree: bool
 
     def __init__(self, params: QueryDict) -> None:
         self._read_url_params_with_defaults(params)
@@ -81,6 +109,74 @@ class ClusterAlgorithmRequestParams():
             self._URL_CLUSTER_PIXEL_INDEX_WEIGHT, self._DEFAULT_CLUSTER_PIXEL_INDEX_WEIGHT))
         if self.pixel_index_weight < 0:
             raise Exception("expected cluster_pixel_index_weight to be > 0")
+        self.cache_merge_tree = str(params.get(
+            self._URL_CLUSTER_CACHE_MERGE_TREE,
+            self._DEFAULT_CLUSTER_CACHE_MERGE_TREE)).lower() in ('true', '1')
+
+
+# How project areas are generated.
+class ProjectAreaGeneratorType(IntEnum):
+    # Patchmax (in R), via generate_projects_for_a_single_scenario.R.
+    PATCHMAX = 0
+    # Greedy growth of contiguous project areas from seed stands (see
+    # forsys.project_area_generator).
+    GREEDY_IN_PYTHON = 1
+
+
+class ProjectAreaGeneratorRequestParams():
+    # Constants for parsing url parameters.
+    # Generator types are listed in enum, ProjectAreaGeneratorType.
+    _URL_GENERATOR_TYPE = 'project_area_generator_type'
+    # The following only apply to GREEDY_IN_PYTHON; Patchmax parameters are
+    # set in generate_projects_for_a_single_scenario.R.
+    # The maximum area of a project area, in km-squared.
+    _URL_MAX_PROJECT_AREA = 'max_project_area'
+    # The number of project areas to generate.
+    _URL_NUM_PROJECTS = 'num_projects'
+    # The fraction of eligible stands (those with the highest scores) to grow
+    # project areas from.
+    _URL_SEED_FRACTION = 'seed_fraction'
+    # The maximum fraction of a project area's maximum area that may be
+    # covered by stands ineligible for treatment.
+    _URL_EXCLUSION_LIMIT = 'exclusion_limit'
+
+    # Constants that act as default values when parsing url parameters.
+    # Defaults match the Patchmax parameters in
+    # generate_projects_for_a_single_scenario.R.
+    _DEFAULT_GENERATOR_TYPE = ProjectAreaGeneratorType.PATCHMAX
+    _DEFAULT_MAX_PROJECT_AREA = 20
+    _DEFAULT_NUM_PROJECTS = 3
+    _DEFAULT_SEED_FRACTION = 0.01
+    _DEFAULT_EXCLUSION_LIMIT = 0.1
+
+    generator_type: ProjectAreaGeneratorType
+    max_project_area: float
+    num_projects: int
+    seed_fraction: float
+    exclusion_limit: float
+
+    def __init__(self, params: QueryDict) -> None:
+        self._read_url_params_with_defaults(params)
+
+    def _read_url_params_with_defaults(self, params: QueryDict) -> None:
+        self.generator_type = ProjectAreaGeneratorType(int(params.get(
+            self._URL_GENERATOR_TYPE, self._DEFAULT_GENERATOR_TYPE)))
+        self.max_project_area = float(params.get(
+            self._URL_MAX_PROJECT_AREA, self._DEFAULT_MAX_PROJECT_AREA))
+        if self.max_project_area <= 0:
+            raise Exception("expected max_project_area to be > 0")
+        self.num_projects = int(params.get(
+            self._URL_NUM_PROJECTS, self._DEFAULT_NUM_PROJECTS))
+        if self.num_projects <= 0:
+            raise Exception("expected num_projects to be > 0")
+        self.seed_fraction = float(params.get(
+            self._URL_SEED_FRACTION, self._DEFAULT_SEED_FRACTION))
+        if self.seed_fraction <= 0 or self.seed_fraction > 1:
+            raise Exception("expected seed_fraction to be in (0, 1]")
+        self.exclusion_limit = float(params.get(
+            self._URL_EXCLUSION_LIMIT, self._DEFAULT_EXCLUSION_LIMIT))
+        if self.exclusion_limit < 0 or self.exclusion_limit > 1:
+            raise Exception("expected exclusion_limit to be in [0, 1]")
 
 
 # TODO: incorporate this with RankingRequestParams, too.
@@ -223,17 +319,35 @@ class ForsysRankingRequestParams():
     # Project areas to be ranked. A project area may consist of multiple
     # disjoint polygons. The dict is keyed by project ID.
     project_areas: dict[int, MultiPolygon]
+    # Project areas in the raster SRS, and whether they are valid, keyed by
+    # project ID, if these were read along with project_areas (e.g. from
+    # ProjectArea rows). Otherwise, None, and project areas are reprojected
+    # and validated when needed.
+    raster_project_areas: dict[int, tuple[GEOSGeometry, bool | None]] | None
     # Global constraints applied to the entire set of projects.
     max_area_in_km2: float | None  # unit: km squared
     max_cost_in_usd: float | None  # unit: USD
+    # How projects are ranked.
+    ranking_engine: RankingEngine
 
     def __init__(self):
         self.region = None
         self.priorities = None
         self.priority_weights = None
         self.project_areas = None
+        self.raster_project_areas = None
         self.max_area_in_km2 = None
         self.max_cost_in_usd = None
+        self.ranking_engine = RankingEngine.R
+
+    # Returns a project area in the raster SRS and whether it is valid (None
+    # if unknown).
+    def get_raster_project_area(
+            self, proj_id: int) -> tuple[GEOSGeometry, bool | None]:
+        if self.raster_project_areas is not None and \
+                proj_id in self.raster_project_areas:
+            return self.raster_project_areas[proj_id]
+        return get_raster_geo(self.project_areas[proj_id]), None
 
 
 # Looks up forsys ranking parameters from DB.
@@ -252,15 +366,16 @@ class ForsysRankingRequestParamsFromDb(ForsysRankingRequestParams):
             self.region = project.plan.region_name
 
             self.priorities = [
-                BaseCondition.objects.get(
-                    id=c.condition_dataset_id).condition_name
-                for c in project.priorities.all()]
+                get_condition_name(c.pk) for c in project.priorities.all()]
             # TODO: add logic for reading priority weights from db.
             self.priority_weights = [1 for p in self.priorities]
 
             self.project_areas = {}
+            self.raster_project_areas = {}
             for area in project_areas:
                 self.project_areas[area.pk] = area.project_area
+                self.raster_project_areas[area.pk] = get_stored_raster_geo(
+                    area)
         except Exception as e:
             raise Exception("Ill-formed request: " + str(e))
 
@@ -323,9 +438,15 @@ class ForsysGenerationRequestParams():
     priority_weights: list[float]
     # Planning area geometry. Projects are generated within the planning area.
     planning_area: MultiPolygon
+    # The planning area in the raster SRS, and whether it is valid, if these
+    # were read along with the planning area (e.g. from a Plan). Otherwise,
+    # None, and the planning area is reprojected and validated when needed.
+    raster_planning_area: tuple[GEOSGeometry, bool | None] | None
     # Parameters informing clustering prior to running Patchmax project area
     # generation.
     cluster_params: ClusterAlgorithmRequestParams
+    # Parameters selecting and configuring the project area generator.
+    generator_params: ProjectAreaGeneratorRequestParams
     # Parameters informing whether Planscape will read and write to the DB.
     db_params: DbRequestParams
     # Parameters informing whether a stand can be included in a project area.
@@ -336,7 +457,9 @@ class ForsysGenerationRequestParams():
         self.priorities = None
         self.priority_weights = None
         self.planning_area = None
+        self.raster_planning_area = None
         self.cluster_params = None
+        self.generator_params = None
         self.db_params = None
         self.stand_eligibility_params = None
 
@@ -347,6 +470,13 @@ class ForsysGenerationRequestParams():
             priority_weights[self.priorities[i]] = self.priority_weights[i]
         return priority_weights
 
+    # Returns the planning area in the raster SRS and whether it is valid
+    # (None if unknown).
+    def get_raster_planning_area(self) -> tuple[GEOSGeometry, bool | None]:
+        if self.raster_planning_area is not None:
+            return self.raster_planning_area
+        return get_raster_geo(self.planning_area), None
+
 
 # Looks up forsys generation parameters from URL parameters.
 # Also provides default values if any url parameters are missing.
@@ -368,6 +498,7 @@ class ForsysGenerationRequestParamsFromUrlWithDefaults(
         ForsysGenerationRequestParams.__init__(self)
 
         self.cluster_params = ClusterAlgorithmRequestParams(params)
+        self.generator_params = ProjectAreaGeneratorRequestParams(params)
 
         request = HttpRequest()
         request.GET = params
@@ -392,11 +523,18 @@ class ForsysGenerationRequestParamsFromUrlWithDefaults(
 # are set via url parameters)
 class ForsysGenerationRequestParamsFromDb(
         ForsysGenerationRequestParamsFromUrlWithDefaults):
+    # Project areas may only be generated for scenarios in these states;
+    # other scenarios are either queued, being processed, or done.
+    _VALID_SCENARIO_STATUSES = [Scenario.ScenarioStatus.INITIALIZED,
+                                Scenario.ScenarioStatus.FAILED]
+
     def __init__(self, request: HttpRequest) -> None:
         ForsysGenerationRequestParams.__init__(self)
 
         # TODO: pass cluster parameters via DB.
         self.cluster_params = ClusterAlgorithmRequestParams(request.GET)
+        # TODO: pass project area generator parameters via DB.
+        self.generator_params = ProjectAreaGeneratorRequestParams(request.GET)
 
         self.db_params = DbRequestParamsForGenerationFromDb(request)
 
@@ -408,13 +546,13 @@ class ForsysGenerationRequestParamsFromDb(
         self._read_db_params()
 
     def _validate_scenario(self, scenario: Scenario):
-        status = scenario.status
-        if not (status == Scenario.ScenarioStatus.INITIALIZED or
-                status == Scenario.ScenarioStatus.FAILED):
+        if scenario.status not in self._VALID_SCENARIO_STATUSES:
             raise Exception(
                 "scenario status for scenario ID, %d" % (scenario.pk) +
-                ", is %s (expected Initialized or Failed)" %
-                (scenario.get_status_display()))
+                ", is %s (expected %s)" % (
+                    scenario.get_status_display(),
+                    " or ".join([s.label
+                                 for s in self._VALID_SCENARIO_STATUSES])))
 
         # TODO: the model for scenario.project should be null=False.
         if scenario.project is None:
@@ -433,6 +571,7 @@ class ForsysGenerationRequestParamsFromDb(
             raise Exception(
                 "geometry missing for plan ID, %d, for scenario ID, %d" %
                 (plan.pk, self.db_write_params.scenario.pk))
+        self.raster_planning_area = get_stored_raster_geo(plan)
 
         self.priorities, self.priority_weights = self._get_weighted_priorities(
             scenario)
@@ -443,7 +582,7 @@ class ForsysGenerationRequestParamsFromDb(
         priorities = []
         priority_weights = []
         for w in ScenarioWeightedPriority.objects.filter(scenario=scenario):
-            priorities.append(w.priority.condition_dataset.condition_name)
+            priorities.append(get_condition_name(w.priority_id))
             priority_weights.append(w.weight)
         if len(priorities) == 0:
             raise Exception(
@@ -452,6 +591,18 @@ class ForsysGenerationRequestParamsFromDb(
         return priorities, priority_weights
 
 
+# Looks up forsys generation parameters from DB for a queued GenerationJob
+# (see forsys.generation_jobs).
+# By the time a job runs, its scenario has been marked as Processing, and
+# output is always written to the DB.
+class ForsysGenerationRequestParamsFromJob(ForsysGenerationRequestParamsFromDb):
+    _VALID_SCENARIO_STATUSES = [Scenario.ScenarioStatus.PROCESSING]
+
+    def __init__(self, request: HttpRequest) -> None:
+        ForsysGenerationRequestParamsFromDb.__init__(self, request)
+        self.db_params.write_to_db = True
+
+
 # Sets planning area from HUC-12 boundary names.
 # Sets default priorities to th ones used for experimenting with realistic data.
 class ForsysGenerationRequestParamsFromHuc12(
@@ -543,11 +694,14 @@ def get_ranking_request_params(
     type = ForsysRankingRequestParamsType(
         int(params.get(_URL_REQUEST_PARAMS_TYPE, 0)))
     if type == ForsysRankingRequestParamsType.DATABASE:
-        return ForsysRankingRequestParamsFromDb(params)
+        ranking_params = ForsysRankingRequestParamsFromDb(params)
     elif type == ForsysRankingRequestParamsType.ALL_DEFAULTS:
-        return ForsysRankingRequestParamsFromUrlWithDefaults(params)
+        ranking_params = ForsysRankingRequestParamsFromUrlWithDefaults(params)
     else:
         raise Exception("ranking request type was not recognized")
+    ranking_params.ranking_engine = RankingEngine(
+        int(params.get(_URL_RANKING_ENGINE, RankingEngine.R)))
+    return ranking_params
 
 
 # Returns ForsysGenerationRequestParams based on url parameter value for the
@@ -574,3 +728,59 @@ def get_generation_request_params(
         return MiddleForkForsysGenerationParams(params)
     else:
         raise Exception("generation request type was not recognized")
+
+
+# Parameters for generating project areas for several variants of a single
+# generation request, e.g. to compare priority weightings for a planning area.
+# Variants share the base request's region, priorities, and planning area, so
+# raster data only needs to be fetched once. Each variant may override priority
+# weights and cluster and project area generator url parameters.
+# Variants are given as url-encoded query strings, e.g.
+#   variant=priority_weights%3D1%26priority_weights%3D5&variant=...
+# Batch output isn't written to the DB (db_params.write_to_db is ignored).
+class ForsysGenerationBatchRequestParams():
+    # Constants for parsing url parameters.
+    _URL_VARIANT = 'variant'
+
+    # Bounds the work done per request.
+    _MAX_NUM_VARIANTS = 16
+
+    # Generation parameters for each variant, in url parameter order.
+    variants: list[ForsysGenerationRequestParams]
+
+    def __init__(self, request: HttpRequest) -> None:
+        base = get_generation_request_params(request)
+
+        variants = request.GET.getlist(self._URL_VARIANT)
+        if len(variants) == 0 or len(variants) > self._MAX_NUM_VARIANTS:
+            raise Exception(
+                "expected 1 to %d variants, instead, %d were given" %
+                (self._MAX_NUM_VARIANTS, len(variants)))
+        self.variants = [self._get_variant(base, request.GET, QueryDict(v))
+                         for v in variants]
+
+    # Returns a copy of base, with priority weights, cluster parameters, and
+    # project area generator parameters read from overrides (falling back to
+    # params).
+    def _get_variant(self, base: ForsysGenerationRequestParams,
+                     params: QueryDict, overrides: QueryDict
+                     ) -> ForsysGenerationRequestParams:
+        merged = params.copy()
+        for key in overrides.keys():
+            merged.setlist(key, overrides.getlist(key))
+
+        variant = copy.copy(base)
+        weights_key = ForsysGenerationRequestParamsFromUrlWithDefaults.\
+            _URL_PRIORITY_WEIGHTS
+        if weights_key in overrides.keys():
+            variant.priority_weights = [
+                float(w) for w in overrides.getlist(weights_key)]
+            if len(variant.priority_weights) != len(variant.priorities):
+                raise Exception(
+                    "expected %d priority weights, instead, %d were given" %
+                    (len(variant.priorities), len(variant.priority_weights)))
+        variant.cluster_params = ClusterAlgorithmRequestParams(merged)
+        variant.generator_params = ProjectAreaGeneratorRequestParams(merged)
+        variant.stand_eligibility_params = copy.copy(
+            base.stand_eligibility_params)
+        return variant
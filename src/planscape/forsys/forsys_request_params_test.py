@@ -10,6 +10,9 @@ from django.test import TestCase
 from forsys.forsys_request_params import (ClusterAlgorithmType,
                                           ClusterAlgorithmRequestParams,
                                           ClusterAlgorithmRequestParams,
+                                          ForsysGenerationBatchRequestParams,
+                                          ProjectAreaGeneratorType,
+                                          RankingEngine,
                                           get_generation_request_params,
                                           get_ranking_request_params)
 from plan.models import (Plan, Project, ProjectArea,
@@ -67,6 +70,13 @@ class TestClusterAlgorithmRequestParams(TestCase):
             str(context.exception),
             'expected cluster_pixel_index_weight to be > 0')
 
+    def test_reads_cache_merge_tree_from_url_params(self):
+        params = ClusterAlgorithmRequestParams(QueryDict(''))
+        self.assertFalse(params.cache_merge_tree)
+        params = ClusterAlgorithmRequestParams(
+            QueryDict('cluster_cache_merge_tree=true'))
+        self.assertTrue(params.cache_merge_tree)
+
 
 class TestForsysRankingRequestParamsFromUrlWithDefaults(TestCase):
     def test_reads_default_url_params(self):
@@ -114,6 +124,15 @@ class TestForsysRankingRequestParamsFromUrlWithDefaults(TestCase):
         params = get_ranking_request_params(qd)
         self.assertEqual(params.region, 'foo')
 
+    def test_reads_ranking_engine_from_url_params(self):
+        qd = QueryDict('request_type=1')
+        params = get_ranking_request_params(qd)
+        self.assertEqual(params.ranking_engine, RankingEngine.R)
+
+        qd = QueryDict('request_type=1&ranking_engine=1')
+        params = get_ranking_request_params(qd)
+        self.assertEqual(params.ranking_engine, RankingEngine.PYTHON)
+
     def test_reads_priorities_from_url_params(self):
         qd = QueryDict(
             'request_type=1' +
@@ -349,6 +368,53 @@ class TestForsysGenerationRequestParamsFromUrlWithDefaults(TestCase):
             'User matching query does not exist.')
 
 
+class TestForsysGenerationBatchRequestParams(TestCase):
+    def test_reads_variants_from_url_params(self):
+        request = HttpRequest()
+        request.GET = QueryDict(
+            'request_type=1&priorities=foo&priorities=bar' +
+            '&cluster_algorithm_type=3' +
+            '&variant=priority_weights%3D5%26priority_weights%3D1' +
+            '&variant=cluster_algorithm_type%3D0' +
+            '%26project_area_generator_type%3D1')
+        params = ForsysGenerationBatchRequestParams(request)
+
+        self.assertEqual(len(params.variants), 2)
+        a, b = params.variants
+        self.assertListEqual(a.priority_weights, [5, 1])
+        self.assertEqual(a.cluster_params.cluster_algorithm_type,
+                         ClusterAlgorithmType.REGION_GROWING_IN_PYTHON)
+        self.assertEqual(a.generator_params.generator_type,
+                         ProjectAreaGeneratorType.PATCHMAX)
+        self.assertListEqual(b.priority_weights, [1, 1])
+        self.assertEqual(b.cluster_params.cluster_algorithm_type,
+                         ClusterAlgorithmType.NONE)
+        self.assertEqual(b.generator_params.generator_type,
+                         ProjectAreaGeneratorType.GREEDY_IN_PYTHON)
+        # Variants share the planning area.
+        self.assertIs(a.planning_area, b.planning_area)
+
+    def test_raises_error_for_missing_variants(self):
+        request = HttpRequest()
+        request.GET = QueryDict('request_type=1')
+        with self.assertRaises(Exception) as context:
+            ForsysGenerationBatchRequestParams(request)
+        self.assertEqual(
+            str(context.exception),
+            'expected 1 to 16 variants, instead, 0 were given')
+
+    def test_raises_error_for_wrong_num_priority_weights(self):
+        request = HttpRequest()
+        request.GET = QueryDict(
+            'request_type=1&priorities=foo&priorities=bar' +
+            '&variant=priority_weights%3D5')
+        with self.assertRaises(Exception) as context:
+            ForsysGenerationBatchRequestParams(request)
+        self.assertEqual(
+            str(context.exception),
+            'expected 2 priority weights, instead, 1 were given')
+
+
 class TestForsysGenerationRequestParamsFromDb(TestCase):
     def setUp(self) -> None:
         self.region = 'sierra_cascade_inyo'
@@ -0,0 +1,295 @@
+import json
+from enum import IntEnum
+from typing import Iterator
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (HttpResponse, JsonResponse, QueryDict,
+                         StreamingHttpResponse)
+from forsys.get_forsys_inputs import ForsysInputHeaders
+
+
+# How geometries (the forsys input geometry column and project area
+# geometries) are encoded in responses.
+class GeometryFormat(IntEnum):
+    WKT = 0
+    # WKB is hex-encoded in text formats (JSON and NDJSON) and raw bytes in
+    # binary formats (msgpack and Arrow).
+    WKB = 1
+    GEOJSON = 2
+
+
+# How responses are serialized.
+class ResponseFormat(IntEnum):
+    JSON = 0
+    # Newline-delimited JSON, streamed one record (a scenario, a ranked project,
+    # or a forsys input row) per line.
+    NDJSON = 1
+    MSGPACK = 2
+    # An Arrow IPC stream of ranked projects. Other fields are JSON-encoded in
+    # schema metadata under b'metadata'; if requested, the forsys input table
+    # is a nested Arrow IPC stream in schema metadata under b'input'.
+    ARROW = 3
+
+
+# Content types for each response format.
+_CONTENT_TYPES = {
+    ResponseFormat.JSON: 'application/json',
+    ResponseFormat.NDJSON: 'application/x-ndjson',
+    ResponseFormat.MSGPACK: 'application/msgpack',
+    ResponseFormat.ARROW: 'application/vnd.apache.arrow.stream',
+}
+
+# Keys in a ranked project for each geometry format.
+_PROJECT_GEOMETRY_KEYS = {
+    GeometryFormat.WKT: 'geo_wkt',
+    GeometryFormat.WKB: 'geo_wkb',
+    GeometryFormat.GEOJSON: 'geo_json',
+}
+
+
+# Request parameters controlling the contents and encoding of forsys endpoint
+# responses.
+# By default, responses are unchanged: JSON, with WKT geometries and the forsys
+# input table included.
+class ForsysResponseParams():
+    # Constants for parsing url parameters.
+    # If false, the forsys input table is left out of the response. This is
+    # typically the bulk of the response, since it holds one geometry per
+    # stand.
+    _URL_INCLUDE_INPUT = 'include_input'
+    # Geometry formats are listed in enum, GeometryFormat.
+    _URL_GEOMETRY_FORMAT = 'geometry_format'
+    # If > 0, geometries are simplified (preserving topology) with this
+    # tolerance, in units of the geometry's coordinates.
+    _URL_GEOMETRY_SIMPLIFY_TOLERANCE = 'geometry_simplify_tolerance'
+    # Response formats are listed in enum, ResponseFormat.
+    _URL_RESPONSE_FORMAT = 'response_format'
+
+    # Constants that act as default values when parsing url parameters.
+    _DEFAULT_INCLUDE_INPUT = True
+    _DEFAULT_GEOMETRY_FORMAT = GeometryFormat.WKT
+    _DEFAULT_GEOMETRY_SIMPLIFY_TOLERANCE = 0
+    _DEFAULT_RESPONSE_FORMAT = ResponseFormat.JSON
+
+    # Whether to include the forsys input table.
+    include_input: bool
+    # Geometry format.
+    geometry_format: GeometryFormat
+    # Geometry simplification tolerance (0 for no simplification).
+    geometry_simplify_tolerance: float
+    # Response format.
+    response_format: ResponseFormat
+
+    def __init__(self, params: QueryDict) -> None:
+        self._read_url_params_with_defaults(params)
+
+    def _read_url_params_with_defaults(self, params: QueryDict) -> None:
+        self.include_input = str(params.get(
+            self._URL_INCLUDE_INPUT,
+            self._DEFAULT_INCLUDE_INPUT)).lower() in ('true', '1')
+        self.geometry_format = GeometryFormat(int(params.get(
+            self._URL_GEOMETRY_FORMAT, self._DEFAULT_GEOMETRY_FORMAT)))
+        self.geometry_simplify_tolerance = float(params.get(
+            self._URL_GEOMETRY_SIMPLIFY_TOLERANCE,
+            self._DEFAULT_GEOMETRY_SIMPLIFY_TOLERANCE))
+        if self.geometry_simplify_tolerance < 0:
+            raise Exception(
+                "expected geometry_simplify_tolerance to be >= 0")
+        self.response_format = ResponseFormat(int(params.get(
+            self._URL_RESPONSE_FORMAT, self._DEFAULT_RESPONSE_FORMAT)))
+
+    # Whether geometries need to be re-encoded at all.
+    def converts_geometries(self) -> bool:
+        return self.geometry_format != GeometryFormat.WKT or \
+            self.geometry_simplify_tolerance > 0
+
+
+# Converts a WKT geometry to the requested format.
+def _convert_geometry(wkt: str, params: ForsysResponseParams,
+                      binary: bool) -> str | bytes | dict:
+    geo = GEOSGeometry(wkt)
+    if params.geometry_simplify_tolerance > 0:
+        geo = geo.simplify(params.geometry_simplify_tolerance,
+                           preserve_topology=True)
+    if params.geometry_format == GeometryFormat.WKB:
+        return bytes(geo.wkb) if binary else str(geo.hex, 'ascii')
+    if params.geometry_format == GeometryFormat.GEOJSON:
+        # Arrow columns are typed, so GeoJSON stays a string there.
+        return geo.json if binary else json.loads(geo.json)
+    return geo.wkt
+
+
+# Returns the scenarios in a forsys response, keyed by scenario name.
+# Single-scenario responses (under 'output' or 'output_scenario') are keyed by
+# None.
+def _get_scenarios(forsys: dict) -> dict[str | None, dict]:
+    if 'output_scenarios' in forsys.keys():
+        return forsys['output_scenarios']
+    for key in ('output', 'output_scenario'):
+        if key in forsys.keys():
+            return {None: forsys[key]}
+    return {}
+
+
+# Returns a copy of scenario with ranked project geometries converted.
+# Other fields are shared with the original.
+def _convert_scenario(scenario: dict, params: ForsysResponseParams,
+                      binary: bool) -> dict:
+    if not params.converts_geometries():
+        return scenario
+    ranked_projects = []
+    for p in scenario['ranked_projects']:
+        p = dict(p)
+        if 'geo_wkt' in p.keys():
+            p[_PROJECT_GEOMETRY_KEYS[params.geometry_format]] = \
+                _convert_geometry(p.pop('geo_wkt'), params, binary)
+        ranked_projects.append(p)
+    converted = dict(scenario)
+    converted['ranked_projects'] = ranked_projects
+    return converted
+
+
+# Returns a copy of the forsys input table with geometries converted.
+# Other columns are shared with the original.
+def _convert_input(forsys_input: dict[str, list],
+                   params: ForsysResponseParams,
+                   binary: bool) -> dict[str, list]:
+    geo_header = ForsysInputHeaders.FORSYS_GEO_WKT_HEADER
+    if not params.converts_geometries() or \
+            geo_header not in forsys_input.keys():
+        return forsys_input
+    converted = dict(forsys_input)
+    converted[geo_header] = [_convert_geometry(wkt, params, binary)
+                             for wkt in forsys_input[geo_header]]
+    return converted
+
+
+# Applies include_input and geometry options to a response of the form
+#   {'forsys': {'input': ..., <output>: ...}, ...}
+# without modifying the original response.
+def _convert_response(response: dict, params: ForsysResponseParams,
+                      binary: bool) -> dict:
+    forsys = dict(response['forsys'])
+    if not params.include_input:
+        forsys.pop('input', None)
+    elif 'input' in forsys.keys():
+        forsys['input'] = _convert_input(forsys['input'], params, binary)
+
+    if 'output_scenarios' in forsys.keys():
+        forsys['output_scenarios'] = {
+            k: _convert_scenario(s, params, binary)
+            for k, s in forsys['output_scenarios'].items()}
+    for key in ('output', 'output_scenario'):
+        if key in forsys.keys():
+            forsys[key] = _convert_scenario(forsys[key], params, binary)
+
+    converted = dict(response)
+    converted['forsys'] = forsys
+    return converted
+
+
+# Yields NDJSON records for a converted response. Each record has a 'record'
+# field: 'scenario' (a scenario without its ranked projects),
+# 'ranked_project', 'input' (a forsys input row), or, for other top-level
+# fields of the response (e.g. 'db'), the field name.
+def _iterate_ndjson_records(response: dict) -> Iterator[str]:
+    encoder = DjangoJSONEncoder()
+    forsys = response['forsys']
+    for name, scenario in _get_scenarios(forsys).items():
+        record = {'record': 'scenario'}
+        if name is not None:
+            record['scenario'] = name
+        record.update({k: v for k, v in scenario.items()
+                       if k != 'ranked_projects'})
+        yield encoder.encode(record) + '\n'
+        for p in scenario['ranked_projects']:
+            record = {'record': 'ranked_project'}
+            if name is not None:
+                record['scenario'] = name
+            record.update(p)
+            yield encoder.encode(record) + '\n'
+
+    if 'input' in forsys.keys():
+        columns = list(forsys['input'].keys())
+        values = [forsys['input'][c] for c in columns]
+        for row in zip(*values):
+            record = {'record': 'input'}
+            record.update(zip(columns, row))
+            yield encoder.encode(record) + '\n'
+
+    for key in response.keys():
+        if key == 'forsys':
+            continue
+        record = {'record': key}
+        record.update(response[key])
+        yield encoder.encode(record) + '\n'
+
+
+# Converts numpy scalars and arrays, which msgpack can't pack natively.
+def _msgpack_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError("cannot serialize %s" % type(obj))
+
+
+def _serialize_msgpack(response: dict) -> bytes:
+    return msgpack.packb(response, use_bin_type=True,
+                         default=_msgpack_default)
+
+
+def _serialize_arrow(response: dict) -> bytes:
+    def to_ipc_stream(table: pa.Table) -> bytes:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    forsys = response['forsys']
+    rows = []
+    metadata = {'scenarios': {}}
+    for name, scenario in _get_scenarios(forsys).items():
+        for p in scenario['ranked_projects']:
+            row = {'scenario': name}
+            row.update(p)
+            rows.append(row)
+        metadata['scenarios']['' if name is None else name] = {
+            k: v for k, v in scenario.items() if k != 'ranked_projects'}
+    for key in response.keys():
+        if key != 'forsys':
+            metadata[key] = response[key]
+
+    schema_metadata = {
+        b'metadata': json.dumps(metadata, cls=DjangoJSONEncoder).encode()}
+    if 'input' in forsys.keys():
+        schema_metadata[b'input'] = to_ipc_stream(
+            pa.Table.from_pydict(forsys['input']))
+    table = pa.Table.from_pylist(rows)
+    return to_ipc_stream(table.replace_schema_metadata(schema_metadata))
+
+
+# Returns an HttpResponse for a forsys endpoint response of the form
+#   {'forsys': {'input': ..., <output>: ...}, ...}
+# formatted according to params.
+def create_forsys_response(response: dict,
+                           params: ForsysResponseParams) -> HttpResponse:
+    response_format = params.response_format
+    binary = response_format in (ResponseFormat.MSGPACK, ResponseFormat.ARROW)
+    response = _convert_response(response, params, binary)
+
+    if response_format == ResponseFormat.JSON:
+        return JsonResponse(response)
+    if response_format == ResponseFormat.NDJSON:
+        return StreamingHttpResponse(
+            _iterate_ndjson_records(response),
+            content_type=_CONTENT_TYPES[response_format])
+    if response_format == ResponseFormat.MSGPACK:
+        return HttpResponse(_serialize_msgpack(response),
+                            content_type=_CONTENT_TYPES[response_format])
+    return HttpResponse(_serialize_arrow(response),
+                        content_type=_CONTENT_TYPES[response_format])
@@ -0,0 +1,163 @@
+import json
+
+import msgpack
+import pyarrow as pa
+from django.contrib.gis.geos import GEOSGeometry
+from django.http import QueryDict
+from django.test import TestCase
+from forsys.forsys_response import (ForsysResponseParams, GeometryFormat,
+                                    ResponseFormat, create_forsys_response)
+
+
+class ForsysResponseParamsTest(TestCase):
+    def test_reads_default_params(self):
+        params = ForsysResponseParams(QueryDict(''))
+        self.assertTrue(params.include_input)
+        self.assertEqual(params.geometry_format, GeometryFormat.WKT)
+        self.assertEqual(params.geometry_simplify_tolerance, 0)
+        self.assertEqual(params.response_format, ResponseFormat.JSON)
+        self.assertFalse(params.converts_geometries())
+
+    def test_reads_params(self):
+        params = ForsysResponseParams(QueryDict(
+            'include_input=false&geometry_format=1&' +
+            'geometry_simplify_tolerance=0.5&response_format=1'))
+        self.assertFalse(params.include_input)
+        self.assertEqual(params.geometry_format, GeometryFormat.WKB)
+        self.assertEqual(params.geometry_simplify_tolerance, 0.5)
+        self.assertEqual(params.response_format, ResponseFormat.NDJSON)
+        self.assertTrue(params.converts_geometries())
+
+    def test_fails_for_negative_simplify_tolerance(self):
+        with self.assertRaises(Exception) as context:
+            ForsysResponseParams(QueryDict('geometry_simplify_tolerance=-1'))
+        self.assertEqual(
+            str(context.exception),
+            "expected geometry_simplify_tolerance to be >= 0")
+
+    def test_fails_for_unknown_response_format(self):
+        self.assertRaises(Exception, ForsysResponseParams,
+                          QueryDict('response_format=9'))
+
+
+class CreateForsysResponseTest(TestCase):
+    def setUp(self) -> None:
+        self.square = 'POLYGON ((0 0, 0 1, 1 1, 1 0, 0 0))'
+        self.response = {
+            'forsys': {
+                'input': {'stand_id': [1, 2],
+                          'geo': [self.square, self.square]},
+                'output': {
+                    'priority_weights': {'p': 1},
+                    'ranked_projects': [
+                        {'id': 1, 'weighted_priority_scores': {'p': 0.5},
+                         'total_score': 0.5, 'rank': 1,
+                         'geo_wkt': self.square},
+                    ],
+                    'cumulative_ranked_project_area': [1.0],
+                    'cumulative_ranked_project_cost': [2.0],
+                }
+            },
+            'db': {'scenario_id': '3'},
+        }
+
+    def _create(self, url_params: str):
+        return create_forsys_response(
+            self.response, ForsysResponseParams(QueryDict(url_params)))
+
+    def test_returns_json_by_default(self):
+        response = self._create('')
+        self.assertEqual(json.loads(response.content), self.response)
+
+    def test_leaves_out_input(self):
+        response = json.loads(self._create('include_input=0').content)
+        self.assertNotIn('input', response['forsys'].keys())
+        self.assertEqual(response['forsys']['output'],
+                         self.response['forsys']['output'])
+        # The original response is unchanged.
+        self.assertIn('input', self.response['forsys'].keys())
+
+    def test_returns_hex_wkb(self):
+        response = json.loads(self._create('geometry_format=1').content)
+        project = response['forsys']['output']['ranked_projects'][0]
+        self.assertNotIn('geo_wkt', project.keys())
+        self.assertTrue(
+            GEOSGeometry(project['geo_wkb']).equals(GEOSGeometry(self.square)))
+        self.assertTrue(GEOSGeometry(response['forsys']['input']['geo'][0])
+                        .equals(GEOSGeometry(self.square)))
+        self.assertEqual(
+            self.response['forsys']['output']['ranked_projects'][0]['geo_wkt'],
+            self.square)
+
+    def test_returns_simplified_geojson(self):
+        self.response['forsys']['output']['ranked_projects'][0]['geo_wkt'] = \
+            'POLYGON ((0 0, 0 1, 0.5 1.01, 1 1, 1 0, 0 0))'
+        response = json.loads(self._create(
+            'geometry_format=2&geometry_simplify_tolerance=0.1').content)
+        project = response['forsys']['output']['ranked_projects'][0]
+        self.assertEqual(project['geo_json']['type'], 'Polygon')
+        self.assertEqual(len(project['geo_json']['coordinates'][0]), 5)
+
+    def test_returns_ndjson(self):
+        response = self._create('response_format=1&include_input=false')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in
+                   b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([r['record'] for r in records],
+                         ['scenario', 'ranked_project', 'db'])
+        self.assertEqual(records[0]['cumulative_ranked_project_area'], [1.0])
+        self.assertNotIn('ranked_projects', records[0].keys())
+        self.assertEqual(records[1]['id'], 1)
+        self.assertEqual(records[2]['scenario_id'], '3')
+
+    def test_returns_ndjson_input_rows(self):
+        response = self._create('response_format=1')
+        records = [json.loads(line) for line in
+                   b''.join(response.streaming_content).splitlines()]
+        input_records = [r for r in records if r['record'] == 'input']
+        self.assertEqual(input_records, [
+            {'record': 'input', 'stand_id': 1, 'geo': self.square},
+            {'record': 'input', 'stand_id': 2, 'geo': self.square}])
+
+    def test_returns_msgpack(self):
+        response = self._create('response_format=2')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.response)
+
+    def test_returns_msgpack_with_raw_wkb(self):
+        response = msgpack.unpackb(self._create(
+            'response_format=2&geometry_format=1').content)
+        project = response['forsys']['output']['ranked_projects'][0]
+        self.assertIsInstance(project['geo_wkb'], bytes)
+        self.assertTrue(GEOSGeometry(memoryview(project['geo_wkb'])).equals(
+            GEOSGeometry(self.square)))
+
+    def test_returns_arrow(self):
+        response = self._create('response_format=3&geometry_format=1')
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.apache.arrow.stream')
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column('id').to_pylist(), [1])
+        self.assertEqual(table.column('rank').to_pylist(), [1])
+        self.assertEqual(table.column('total_score').to_pylist(), [0.5])
+        self.assertEqual(table.column('scenario').to_pylist(), [None])
+        self.assertTrue(GEOSGeometry(memoryview(
+            table.column('geo_wkb').to_pylist()[0])).equals(
+            GEOSGeometry(self.square)))
+
+        metadata = json.loads(table.schema.metadata[b'metadata'])
+        self.assertEqual(
+            metadata['scenarios']['']['cumulative_ranked_project_area'],
+            [1.0])
+        self.assertEqual(metadata['db'], {'scenario_id': '3'})
+
+        forsys_input = pa.ipc.open_stream(
+            table.schema.metadata[b'input']).read_all()
+        self.assertEqual(forsys_input.column('stand_id').to_pylist(), [1, 2])
+        self.assertEqual(len(forsys_input.column('geo')), 2)
+
+    def test_returns_arrow_without_input(self):
+        table = pa.ipc.open_stream(self._create(
+            'response_format=3&include_input=false').content).read_all()
+        self.assertNotIn(b'input', table.schema.metadata.keys())
+        self.assertEqual(table.column('geo_wkt').to_pylist(), [self.square])
@@ -0,0 +1,140 @@
+import logging
+from datetime import timedelta
+from typing import Callable
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from forsys.forsys_request_params import (
+    ForsysGenerationRequestParams, ForsysGenerationRequestParamsFromDb,
+    ForsysGenerationRequestParamsFromJob)
+from plan.models import GenerationJob, Scenario
+
+logger = logging.getLogger(__name__)
+
+# A job that fails is retried after RETRY_DELAY_IN_SECONDS, then after twice
+# that, and so on, until it has been attempted GenerationJob.max_attempts
+# times.
+RETRY_DELAY_IN_SECONDS = 30
+
+# A job that has been Processing for longer than this is assumed to have been
+# abandoned by a crashed worker and may be claimed again.
+DEFAULT_STALE_AFTER_IN_SECONDS = 3600
+
+
+# Queues project area generation for the scenario in params.
+# The scenario is marked as Pending; this fails if the scenario isn't
+# Initialized or Failed (e.g. because another request queued it first).
+def submit_generation_job(
+        params: ForsysGenerationRequestParamsFromDb,
+        url_params: QueryDict) -> GenerationJob:
+    scenario = params.db_params.scenario
+    with transaction.atomic():
+        num_updated = Scenario.objects.filter(
+            pk=scenario.pk,
+            status__in=[Scenario.ScenarioStatus.INITIALIZED,
+                        Scenario.ScenarioStatus.FAILED]).update(
+            status=Scenario.ScenarioStatus.PENDING,
+            updated_time=timezone.now())
+        if num_updated == 0:
+            raise Exception(
+                "scenario ID, %d, was queued by another request" %
+                (scenario.pk))
+        job = GenerationJob.objects.create(
+            scenario=scenario, params=url_params.urlencode())
+    scenario.status = Scenario.ScenarioStatus.PENDING
+    return job
+
+
+# Claims the oldest runnable job and marks it and its scenario as Processing.
+# Returns None if no job is runnable.
+# Rows locked by other workers are skipped rather than waited on, so any
+# number of workers may poll the queue concurrently.
+# Stale jobs that have used up their attempts (e.g. because they keep
+# crashing their worker) are marked as Failed rather than reclaimed.
+def claim_generation_job(
+        stale_after_in_seconds: float = DEFAULT_STALE_AFTER_IN_SECONDS
+) -> GenerationJob | None:
+    now = timezone.now()
+    stale = Q(status=Scenario.ScenarioStatus.PROCESSING,
+              claimed_time__lt=now - timedelta(
+                  seconds=stale_after_in_seconds))
+    with transaction.atomic():
+        _fail_exhausted_stale_jobs(stale, now)
+        job = GenerationJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Scenario.ScenarioStatus.PENDING, run_after__lte=now) |
+            (stale & Q(attempts__lt=F('max_attempts')))).order_by(
+            'run_after', 'id').first()
+        if job is None:
+            return None
+        job.status = Scenario.ScenarioStatus.PROCESSING
+        job.attempts = job.attempts + 1
+        job.claimed_time = now
+        job.save()
+        Scenario.objects.filter(pk=job.scenario_id).update(
+            status=Scenario.ScenarioStatus.PROCESSING, updated_time=now)
+    return job
+
+
+# Runs a claimed job by replaying its URL parameters through generate, which
+# is expected to run project area generation and write output to the DB.
+# On failure, the job is either re-queued (with a delay) or, if it has used up
+# its attempts, marked as Failed along with its scenario.
+def run_generation_job(
+        job: GenerationJob,
+        generate: Callable[[ForsysGenerationRequestParams], object]) -> None:
+    try:
+        request = HttpRequest()
+        request.GET = QueryDict(job.params)
+        owner = job.scenario.owner
+        request.user = AnonymousUser() if owner is None else owner
+        generate(ForsysGenerationRequestParamsFromJob(request))
+    except Exception as e:
+        logger.error('generation job %d error: %s' % (job.pk, str(e)))
+        _fail_generation_job(job, str(e))
+        return
+
+    job.status = Scenario.ScenarioStatus.SUCCESS
+    job.error = None
+    job.finished_time = timezone.now()
+    job.save()
+    Scenario.objects.filter(pk=job.scenario_id).update(
+        status=Scenario.ScenarioStatus.SUCCESS, updated_time=timezone.now())
+
+
+# Marks stale jobs (matching the stale filter) that have used up their
+# attempts, and their scenarios, as Failed.
+def _fail_exhausted_stale_jobs(stale: Q, now) -> None:
+    jobs = GenerationJob.objects.select_for_update(skip_locked=True).filter(
+        stale, attempts__gte=F('max_attempts'))
+    job_ids = []
+    scenario_ids = []
+    for job_id, scenario_id in jobs.values_list('id', 'scenario_id'):
+        job_ids.append(job_id)
+        scenario_ids.append(scenario_id)
+    if len(job_ids) == 0:
+        return
+    logger.error('generation jobs %s abandoned after their last attempt' %
+                 (job_ids))
+    GenerationJob.objects.filter(pk__in=job_ids).update(
+        status=Scenario.ScenarioStatus.FAILED, finished_time=now,
+        error='worker stopped responding on the last attempt')
+    Scenario.objects.filter(pk__in=scenario_ids).update(
+        status=Scenario.ScenarioStatus.FAILED, updated_time=now)
+
+
+def _fail_generation_job(job: GenerationJob, error: str) -> None:
+    job.error = error
+    if job.attempts < job.max_attempts:
+        status = Scenario.ScenarioStatus.PENDING
+        job.run_after = timezone.now() + timedelta(
+            seconds=RETRY_DELAY_IN_SECONDS * 2 ** (job.attempts - 1))
+    else:
+        status = Scenario.ScenarioStatus.FAILED
+        job.finished_time = timezone.now()
+    job.status = status
+    job.save()
+    Scenario.objects.filter(pk=job.scenario_id).update(
+        status=status, updated_time=timezone.now())
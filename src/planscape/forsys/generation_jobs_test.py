@@ -0,0 +1,149 @@
+import json
+from datetime import timedelta
+
+from conditions.models import BaseCondition, Condition
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import GEOSGeometry
+from django.http import HttpRequest, QueryDict
+from django.test import TestCase
+from django.utils import timezone
+from forsys.forsys_request_params import ForsysGenerationRequestParamsFromDb
+from forsys.generation_jobs import (claim_generation_job, run_generation_job,
+                                    submit_generation_job)
+from plan.models import (GenerationJob, Plan, Project, Scenario,
+                         ScenarioWeightedPriority)
+
+
+class GenerationJobTest(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='testuser')
+        self.user.set_password('12345')
+        self.user.save()
+
+        geometry = {'type': 'MultiPolygon',
+                    'coordinates': [[[[1, 2], [2, 3], [3, 4], [1, 2]]]]}
+        plan = Plan.objects.create(
+            owner=self.user, name="plan", region_name='sierra_cascade_inyo',
+            geometry=GEOSGeometry(json.dumps(geometry)))
+        project = Project.objects.create(owner=self.user, plan=plan)
+        self.scenario = Scenario.objects.create(
+            owner=self.user, plan=plan, project=project,
+            status=Scenario.ScenarioStatus.INITIALIZED)
+
+        base_condition = BaseCondition.objects.create(
+            condition_name='foo', region_name='sierra_cascade_inyo',
+            condition_level=1)
+        condition = Condition.objects.create(condition_dataset=base_condition)
+        ScenarioWeightedPriority.objects.create(
+            scenario=self.scenario, priority=condition, weight=2)
+
+    def _submit(self, url_params: str) -> GenerationJob:
+        request = HttpRequest()
+        request.GET = QueryDict(url_params)
+        request.user = self.user
+        params = ForsysGenerationRequestParamsFromDb(request)
+        return submit_generation_job(params, request.GET)
+
+    def _get_status(self, model) -> Scenario.ScenarioStatus:
+        model.refresh_from_db()
+        return model.status
+
+    def test_submits_job(self):
+        job = self._submit('scenario_id=%d&num_clusters=10' % self.scenario.pk)
+        self.assertEqual(job.scenario.pk, self.scenario.pk)
+        self.assertEqual(QueryDict(job.params)['num_clusters'], '10')
+        self.assertEqual(self._get_status(job),
+                         Scenario.ScenarioStatus.PENDING)
+        self.assertEqual(self._get_status(self.scenario),
+                         Scenario.ScenarioStatus.PENDING)
+
+    def test_fails_to_submit_queued_scenario(self):
+        self._submit('scenario_id=%d' % self.scenario.pk)
+        with self.assertRaises(Exception) as context:
+            self._submit('scenario_id=%d' % self.scenario.pk)
+        self.assertRegex(
+            str(context.exception),
+            "scenario status for scenario ID, [0-9]+, " +
+            r"is Pending \(expected Initialized or Failed\)")
+        self.assertEqual(GenerationJob.objects.count(), 1)
+
+    def test_claims_job_once(self):
+        job = self._submit('scenario_id=%d' % self.scenario.pk)
+
+        claimed_job = claim_generation_job()
+        self.assertEqual(claimed_job.pk, job.pk)
+        self.assertEqual(claimed_job.attempts, 1)
+        self.assertEqual(self._get_status(job),
+                         Scenario.ScenarioStatus.PROCESSING)
+        self.assertEqual(self._get_status(self.scenario),
+                         Scenario.ScenarioStatus.PROCESSING)
+
+        self.assertIsNone(claim_generation_job())
+
+    def test_reclaims_stale_job(self):
+        job = self._submit('scenario_id=%d' % self.scenario.pk)
+        claim_generation_job()
+        GenerationJob.objects.filter(pk=job.pk).update(
+            claimed_time=timezone.now() - timedelta(hours=2))
+
+        claimed_job = claim_generation_job(stale_after_in_seconds=3600)
+        self.assertEqual(claimed_job.pk, job.pk)
+        self.assertEqual(claimed_job.attempts, 2)
+
+    def test_fails_stale_job_without_attempts_left(self):
+        job = self._submit('scenario_id=%d' % self.scenario.pk)
+        claim_generation_job()
+        GenerationJob.objects.filter(pk=job.pk).update(
+            attempts=job.max_attempts,
+            claimed_time=timezone.now() - timedelta(hours=2))
+
+        self.assertIsNone(claim_generation_job(stale_after_in_seconds=3600))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Scenario.ScenarioStatus.FAILED)
+        self.assertEqual(job.attempts, job.max_attempts)
+        self.assertIsNotNone(job.finished_time)
+        self.assertEqual(self._get_status(self.scenario),
+                         Scenario.ScenarioStatus.FAILED)
+
+    def test_runs_job(self):
+        self._submit('scenario_id=%d&num_clusters=10' % self.scenario.pk)
+        job = claim_generation_job()
+
+        received_params = []
+        run_generation_job(job, lambda params: received_params.append(params))
+
+        self.assertEqual(len(received_params), 1)
+        self.assertEqual(received_params[0].priorities, ['foo'])
+        self.assertEqual(received_params[0].priority_weights, [2])
+        self.assertEqual(received_params[0].cluster_params.num_clusters, 10)
+        self.assertTrue(received_params[0].db_params.write_to_db)
+        self.assertEqual(self._get_status(job),
+                         Scenario.ScenarioStatus.SUCCESS)
+        self.assertEqual(self._get_status(self.scenario),
+                         Scenario.ScenarioStatus.SUCCESS)
+
+    def test_retries_failed_job(self):
+        self._submit('scenario_id=%d' % self.scenario.pk)
+
+        def fail(params):
+            raise Exception("patchmax failed")
+
+        job = claim_generation_job()
+        run_generation_job(job, fail)
+        self.assertEqual(self._get_status(job),
+                         Scenario.ScenarioStatus.PENDING)
+        self.assertEqual(self._get_status(self.scenario),
+                         Scenario.ScenarioStatus.PENDING)
+        self.assertEqual(job.error, "patchmax failed")
+        # The retry is delayed.
+        self.assertIsNone(claim_generation_job())
+
+        for attempt in range(job.max_attempts - 1):
+            GenerationJob.objects.filter(pk=job.pk).update(
+                run_after=timezone.now())
+            run_generation_job(claim_generation_job(), fail)
+        self.assertEqual(self._get_status(job),
+                         Scenario.ScenarioStatus.FAILED)
+        self.assertEqual(self._get_status(self.scenario),
+                         Scenario.ScenarioStatus.FAILED)
+        self.assertEqual(job.attempts, job.max_attempts)
@@ -1,8 +1,12 @@
-from conditions.raster_utils import (compute_condition_stats_from_raster,
-                                     get_raster_geo)
+from conditions.raster_utils import compute_condition_stats_from_raster
 from django.contrib.gis.geos import Polygon
-from forsys.cluster_stands import ClusteredStands
-from forsys.forsys_request_params import (ClusterAlgorithmType,
+from forsys.cluster_stands import (ClusteredStands,
+                                   KMeansClusteredStands,
+                                   MergeTreeClusteredStands,
+                                   RegionGrowingClusteredStands,
+                                   TiledClusteredStands)
+from forsys.forsys_request_params import (ClusterAlgorithmRequestParams,
+                                          ClusterAlgorithmType,
                                           ForsysGenerationRequestParams,
                                           ForsysRankingRequestParams,
                                           StandEligibilityParams)
@@ -11,6 +15,7 @@ from forsys.raster_condition_fetcher import (RasterConditionFetcher,
                                              get_conditions)
 from forsys.raster_condition_treatment_eligibility_selector import (
     RasterConditionTreatmentEligibilitySelector)
+from forsys.stage_timer import stage
 from planscape import settings
 
 
@@ -110,7 +115,7 @@ class ForsysRankingInput():
             headers, priorities)
 
         for proj_id in project_areas.keys():
-            geo = get_raster_geo(project_areas[proj_id])
+            geo, is_valid = params.get_raster_project_area(proj_id)
 
             self.forsys_input[headers.FORSYS_PROJECT_ID_HEADER].append(proj_id)
             # The entire project area is represented by a single stand.
@@ -120,7 +125,7 @@ class ForsysRankingInput():
             for c in conditions:
                 name = c.condition_dataset.condition_name
                 stats = compute_condition_stats_from_raster(
-                    geo, c.raster_name)
+                    geo, c.raster_name, is_valid)
                 if stats['count'] == 0:
                     raise Exception(
                         "no score was retrieved for condition, %s" % name)
@@ -160,6 +165,14 @@ class ForsysGenerationInput():
     # Dictionary keys are dataframe headers. Dictionary values are lists
     # corresponding to columns below each dataframe header.
     forsys_input: dict[str, list]
+    # Maps each stand ID in forsys_input to the (x-pixel, y-pixel) positions
+    # of the raster pixels it covers.
+    # Along with raster_topleft_coords, this lets project area geometries be
+    # rebuilt from pixels rather than from stand WKT.
+    stand_id_to_pixels: dict[int, list[tuple[int, int]]]
+    # The coordinates (in settings.CRS_FOR_RASTERS) of the top-left corner of
+    # pixel (0, 0).
+    raster_topleft_coords: tuple[float, float]
 
     # ----- Intermediate data -----
     # This fetches raw raster data and merges/reformats it.
@@ -168,40 +181,49 @@ class ForsysGenerationInput():
     # of pixels to treat and a list of pixels to pass through.
     _treatment_eligibility_selector: RasterConditionTreatmentEligibilitySelector
 
+    # If condition_fetcher is given (see fetch_conditions), raster data isn't
+    # fetched again.
     def __init__(
             self, params: ForsysGenerationRequestParams,
-            headers: ForsysInputHeaders) -> None:
-        region = params.region
+            headers: ForsysInputHeaders,
+            condition_fetcher: RasterConditionFetcher | None = None) -> None:
         priorities = params.priorities
-        planning_area = params.planning_area
 
-        geo = get_raster_geo(planning_area)
+        if condition_fetcher is None:
+            condition_fetcher = self.fetch_conditions([params])
+        self._condition_fetcher = condition_fetcher
 
-        self._condition_fetcher = RasterConditionFetcher(
-            region, priorities, self._get_attributes_to_retrieve(
-                params.stand_eligibility_params),
-            geo)
-
-        self._treatment_eligibility_selector = \
-            RasterConditionTreatmentEligibilitySelector(
-                self._condition_fetcher.data, priorities,
-                params.stand_eligibility_params, self.BUILDINGS_KEY,
-                self.ROAD_PROXIMITY_KEY, self.SLOPE_KEY)
+        with stage('eligibility') as timing:
+            self._treatment_eligibility_selector = \
+                RasterConditionTreatmentEligibilitySelector(
+                    self._condition_fetcher.data, priorities,
+                    params.stand_eligibility_params, self.BUILDINGS_KEY,
+                    self.ROAD_PROXIMITY_KEY, self.SLOPE_KEY)
+            timing.rows = sum([len(ys) for ys in self.
+                               _treatment_eligibility_selector.
+                               pixels_to_treat.values()])
 
         self.forsys_input = self._initialize_headers(headers, priorities)
+        self.stand_id_to_pixels = {}
+        self.raster_topleft_coords = self._condition_fetcher.topleft_coords
         next_stand_id = 0
         included_clustered_stands = False
-        if params.cluster_params.cluster_algorithm_type == \
-                ClusterAlgorithmType.HIERARCHICAL_IN_PYTHON:
-            # TODO: instead of calling get_values_eligible_for_treatment,
-            # change ClusteredStands to process RasterConditionFetcher data.
-            clustered_stands = ClusteredStands(
-                self.get_values_eligible_for_treatment(priorities),
-                self._condition_fetcher.width,
-                self._condition_fetcher.height,
-                params.get_priority_weights_dict(),
-                params.cluster_params.pixel_index_weight,
-                params.cluster_params.num_clusters)
+        clustered_stands_class = self._get_clustered_stands_class(
+            params.cluster_params)
+        if clustered_stands_class is not None:
+            with stage('clustering') as timing:
+                # TODO: instead of calling get_values_eligible_for_treatment,
+                # change ClusteredStands to process RasterConditionFetcher
+                # data.
+                clustered_stands = clustered_stands_class(
+                    self.get_values_eligible_for_treatment(priorities),
+                    self._condition_fetcher.width,
+                    self._condition_fetcher.height,
+                    params.get_priority_weights_dict(),
+                    params.cluster_params.pixel_index_weight,
+                    params.cluster_params.num_clusters)
+                if clustered_stands.clusters_to_stands is not None:
+                    timing.rows = len(clustered_stands.clusters_to_stands)
             if clustered_stands.cluster_status_message is None:
                 next_stand_id = \
                     self._append_clustered_stands_to_treat_to_input_df(
@@ -222,15 +244,68 @@ class ForsysGenerationInput():
             self._treatment_eligibility_selector.pixels_to_pass_through,
             self.forsys_input, next_stand_id)
 
-    def _get_attributes_to_retrieve(self, params: StandEligibilityParams
+    # Returns the python stand clustering class for the given cluster
+    # parameters, or None if clustering isn't done in python.
+    def _get_clustered_stands_class(
+            self, cluster_params: ClusterAlgorithmRequestParams
+    ) -> type[ClusteredStands] | None:
+        cluster_algorithm_type = cluster_params.cluster_algorithm_type
+        if cluster_algorithm_type == \
+                ClusterAlgorithmType.HIERARCHICAL_IN_PYTHON:
+            if cluster_params.cache_merge_tree:
+                return MergeTreeClusteredStands
+            return ClusteredStands
+        if cluster_algorithm_type == \
+                ClusterAlgorithmType.REGION_GROWING_IN_PYTHON:
+            return RegionGrowingClusteredStands
+        if cluster_algorithm_type == \
+                ClusterAlgorithmType.TILED_HIERARCHICAL_IN_PYTHON:
+            return TiledClusteredStands
+        if cluster_algorithm_type == ClusterAlgorithmType.KMEANS_IN_PYTHON:
+            return KMeansClusteredStands
+        return None
+
+    # Fetches raster data for one or more generation runs that share a region,
+    # priorities, and planning area (e.g. variants of a batch request).
+    # Land attributes needed by any run's stand eligibility parameters are
+    # fetched, so the returned fetcher can be passed to the constructor for
+    # each run.
+    @classmethod
+    def fetch_conditions(
+            cls, params_list: list[ForsysGenerationRequestParams]
+    ) -> RasterConditionFetcher:
+        params = params_list[0]
+        attributes = []
+        for p in params_list:
+            if p.region != params.region or \
+                    p.priorities != params.priorities or \
+                    p.planning_area != params.planning_area:
+                raise Exception(
+                    "expected runs to share a region, priorities, and " +
+                    "planning area")
+            for a in cls._get_attributes_to_retrieve(
+                    p.stand_eligibility_params):
+                if a not in attributes:
+                    attributes.append(a)
+
+        with stage('raster_fetch') as timing:
+            geo, is_valid = params.get_raster_planning_area()
+
+            condition_fetcher = RasterConditionFetcher(
+                params.region, params.priorities, attributes, geo, is_valid)
+            timing.rows = condition_fetcher.width * condition_fetcher.height
+        return condition_fetcher
+
+    @classmethod
+    def _get_attributes_to_retrieve(cls, params: StandEligibilityParams
                                     ) -> list[str]:
         attributes = []
         if params.filter_by_buildings:
-            attributes.append(self.BUILDINGS_KEY)
+            attributes.append(cls.BUILDINGS_KEY)
         if params.filter_by_road_proximity:
-            attributes.append(self.ROAD_PROXIMITY_KEY)
+            attributes.append(cls.ROAD_PROXIMITY_KEY)
         if params.filter_by_slope:
-            attributes.append(self.SLOPE_KEY)
+            attributes.append(cls.SLOPE_KEY)
         return attributes
 
     def _initialize_headers(self, headers: ForsysInputHeaders,
@@ -278,6 +353,7 @@ class ForsysGenerationInput():
                     stand_id, settings.RASTER_PIXEL_AREA,
                     settings.RASTER_PIXEL_AREA *
                     self.TREATMENT_COST_PER_KM_SQUARED, pixel_geo.wkt, True)
+                self.stand_id_to_pixels[stand_id] = [(x, y)]
                 stand_id = stand_id + 1
         return stand_id
 
@@ -312,6 +388,7 @@ class ForsysGenerationInput():
                     settings.RASTER_PIXEL_AREA *
                     self.TREATMENT_COST_PER_KM_SQUARED,
                     pixel_geo.wkt, False)
+                self.stand_id_to_pixels[stand_id] = [(x, y)]
                 stand_id = stand_id + 1
         return stand_id
 
@@ -371,6 +448,7 @@ class ForsysGenerationInput():
                 settings.RASTER_PIXEL_AREA *
                 self.TREATMENT_COST_PER_KM_SQUARED *
                 num_stands, merge_polygons(geos, 0).wkt, True)
+            self.stand_id_to_pixels[stand_id] = list(stands)
             stand_id = stand_id + 1
         return stand_id
 
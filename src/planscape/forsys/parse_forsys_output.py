@@ -3,9 +3,12 @@ import rpy2
 import numpy as np
 
 from django.contrib.gis.gdal import CoordTransform, SpatialReference
-from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
+from django.contrib.gis.geos import (GeometryCollection, GEOSGeometry,
+                                     MultiPolygon, Polygon)
 from forsys.merge_polygons import merge_polygons
 from planscape import settings
+from rasterio.features import shapes
+from rasterio.transform import Affine
 from typing import TypedDict
 
 
@@ -36,6 +39,93 @@ class Scenario(TypedDict):
     cumulative_ranked_project_cost: list[float]
 
 
+# Converts a forsys output dataframe into a dictionary mapping column names to
+# numpy arrays.
+# The dataframe is either an R dataframe (if forsys ran in-process) or an
+# already-converted dictionary (if forsys ran in forsys.r_worker_pool).
+def _convert_dataframe_to_dict(
+        df: "rpy2.robjects.vectors.DataFrame | dict[str, np.ndarray]"
+) -> dict[str, np.ndarray]:
+    if isinstance(df, dict):
+        return {key: np.asarray(df[key]) for key in df.keys()}
+    return {key: np.asarray(df.rx2(key)) for key in df.names}
+
+
+# Applies global constraints to projects listed in order of rank.
+# As in a sequential pass, a project is skipped if adding it would push the
+# cumulative area past max_area or the cumulative cost past max_cost; later
+# projects may still be selected.
+# Cumulative sums are computed with numpy; python only loops over skipped
+# projects.
+# Returns the indices of selected projects along with the cumulative area and
+# cost of selected projects.
+def _select_projects_within_constraints(
+        areas: np.ndarray, costs: np.ndarray, max_area: float | None,
+        max_cost: float | None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    max_area = np.inf if max_area is None else max_area
+    max_cost = np.inf if max_cost is None else max_cost
+    candidates = np.arange(len(areas))
+    selected = [candidates[:0]]
+    area_sum = 0
+    cost_sum = 0
+    while len(candidates) > 0:
+        # Cumulative sums start from the running totals so that float
+        # accumulation happens in the same order as a sequential pass.
+        cumulative_areas = np.cumsum(
+            np.concatenate(([area_sum], areas[candidates])))[1:]
+        cumulative_costs = np.cumsum(
+            np.concatenate(([cost_sum], costs[candidates])))[1:]
+        exceeds = (cumulative_areas > max_area) | (cumulative_costs > max_cost)
+        if not np.any(exceeds):
+            selected.append(candidates)
+            break
+        j = int(np.argmax(exceeds))
+        selected.append(candidates[:j])
+        if j > 0:
+            area_sum = cumulative_areas[j - 1]
+            cost_sum = cumulative_costs[j - 1]
+        # Projects that don't fit on their own will never fit, since totals
+        # only increase.
+        candidates = candidates[j + 1:]
+        candidates = candidates[
+            (area_sum + areas[candidates] <= max_area) &
+            (cost_sum + costs[candidates] <= max_cost)]
+
+    selected = np.concatenate(selected).astype(int)
+    return (selected, np.cumsum(areas[selected]),
+            np.cumsum(costs[selected]))
+
+
+# Computes the contribution of each priority (columns) to each project's score
+# (rows), along with total scores.
+# Totals are accumulated priority by priority to match the order of a
+# sequential sum.
+def _get_weighted_contributions(
+        impacts: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray,
+                                                           np.ndarray]:
+    contributions = impacts * weights
+    total_scores = np.zeros(len(contributions))
+    for i in range(contributions.shape[1]):
+        total_scores = total_scores + contributions[:, i]
+    return contributions, total_scores
+
+
+# Builds RankedProject dictionaries for the given rows.
+def _create_ranked_projects(
+        priorities: list[str], ids: np.ndarray, ranks: np.ndarray,
+        contributions: np.ndarray,
+        total_scores: np.ndarray) -> list[RankedProject]:
+    contributions = contributions.tolist()
+    total_scores = total_scores.tolist()
+    return [{
+        'id': id,
+        'weighted_priority_scores': dict(zip(priorities, contributions[i])),
+        'rank': rank,
+        'total_score': total_scores[i],
+    } for i, (id, rank) in enumerate(zip(ids.astype(int).tolist(),
+                                           ranks.astype(int).tolist()))]
+
+
 # Transforms the output of a Forsys scenario set run into a more
 # easily-interpreted version.
 class ForsysRankingOutputForMultipleScenarios():
@@ -98,22 +188,12 @@ class ForsysRankingOutputForMultipleScenarios():
         self._max_area = max_area
         self._max_cost = max_cost
 
-        self.scenarios = {}
-        for i in range(len(self._forsys_project_output_df[project_id_header])):
-            scenario_weights, scenario_str = self._get_scenario(i)
-
-            if scenario_str in self.scenarios.keys():
-                self._append_ranked_project_to_existing_scenario(
-                    scenario_str, scenario_weights, i)
-            else:
-                self._append_ranked_project_to_new_scenario(
-                    scenario_str, scenario_weights, i)
+        self.scenarios = self._get_scenarios()
 
     def _save_raw_forsys_project_output_as_dict(
             self, raw_forsys_output: "rpy2.robjects.vectors.DataFrame") -> None:
-        rdf = raw_forsys_output[self._PROJECT_OUTPUT_INDEX]
-        self._forsys_project_output_df = {
-            key: np.asarray(rdf.rx2(key)) for key in rdf.names}
+        self._forsys_project_output_df = _convert_dataframe_to_dict(
+            raw_forsys_output[self._PROJECT_OUTPUT_INDEX])
 
     def _check_header_name(self, header) -> None:
         if header not in self._forsys_project_output_df.keys():
@@ -144,75 +224,62 @@ class ForsysRankingOutputForMultipleScenarios():
         return " ".join([self._WEIGHT_STRFORMAT % (k, weights[k])
                          for k in weights.keys()])
 
-    def _get_scenario(self, ind: int) -> tuple[dict, str]:
-        weights = {
-            self._priorities[i]: int(self._forsys_project_output_df[
-                self._priority_weight_headers[i]][ind])
-            for i in range(len(self._priorities))
-        }
-        return weights, self._get_weights_str(weights)
-
-    def _create_ranked_project(
-            self, scenario_weights: dict, ind: int) -> RankedProject:
-        project: RankedProject = {
-            'id': int(
-                self._forsys_project_output_df[self._project_id_header][ind]),
-            'weighted_priority_scores': {},
-            'rank': int(
-                self._forsys_project_output_df[self._TREATMENT_RANK_HEADER][ind]),
-            'total_score': 0,
-        }
-        for i in range(len(self._priorities)):
-            p = self._priorities[i]
-            contribution = self._forsys_project_output_df[
-                self._priority_contribution_headers[i]
-            ][ind] * scenario_weights[p]
-            project['weighted_priority_scores'][p] = contribution
-            project['total_score'] = project['total_score'] + contribution
-        return project
-
-    def _append_ranked_project_to_existing_scenario(
-            self, scenario_str: str, scenario_weights: dict, i: int) -> None:
-        scenario = self.scenarios[scenario_str]
-        ranked_projects = scenario['ranked_projects']
-        scenario_ind = len(ranked_projects)
-
-        cumulative_area = scenario['cumulative_ranked_project_area'][
-            scenario_ind - 1] + self._forsys_project_output_df[
-            self._area_contribution_header][i]
-        if self._max_area is not None and self._max_area < cumulative_area:
-            return
-
-        cumulative_cost = scenario['cumulative_ranked_project_cost'][
-            scenario_ind - 1] + self._forsys_project_output_df[
-            self._cost_contribution_header][i]
-        if self._max_cost is not None and self._max_cost < cumulative_cost:
-            return
-
-        ranked_projects.append(self._create_ranked_project(
-            scenario_weights, i))
-        scenario['cumulative_ranked_project_area'].append(cumulative_area)
-        scenario['cumulative_ranked_project_cost'].append(cumulative_cost)
-
-    def _append_ranked_project_to_new_scenario(
-            self, scenario_str: str, scenario_weights: dict, i: int) -> None:
-        area = self._forsys_project_output_df[self._area_contribution_header][
-            i]
-        if self._max_area is not None and self._max_area < area:
-            return
-        cost = self._forsys_project_output_df[self._cost_contribution_header][
-            i]
-        if self._max_cost is not None and self._max_cost < cost:
-            return
-
-        scenario: Scenario = {
-            'priority_weights': scenario_weights,
-            'ranked_projects': [self._create_ranked_project(
-                scenario_weights, i)],
-            'cumulative_ranked_project_area': [area],
-            'cumulative_ranked_project_cost': [cost],
-        }
-        self.scenarios[scenario_str] = scenario
+    # Groups projects by scenario weights and builds a Scenario for each
+    # group.
+    # Scenarios are listed in the order of their first selected project.
+    def _get_scenarios(self) -> dict[str, Scenario]:
+        df = self._forsys_project_output_df
+        if len(df[self._project_id_header]) == 0:
+            return {}
+        weights = np.column_stack(
+            [df[h] for h in self._priority_weight_headers]).astype(int)
+        impacts = np.column_stack(
+            [df[h] for h in self._priority_contribution_headers])
+        contributions, total_scores = _get_weighted_contributions(
+            impacts, weights)
+        areas = np.asarray(df[self._area_contribution_header])
+        costs = np.asarray(df[self._cost_contribution_header])
+        ids = np.asarray(df[self._project_id_header])
+        ranks = np.asarray(df[self._TREATMENT_RANK_HEADER])
+
+        # Encodes each row of weights as a single integer so that grouping
+        # is a 1-D np.unique call.
+        offset_weights = weights - np.min(weights, axis=0)
+        keys = np.ravel_multi_index(
+            offset_weights.T, np.max(offset_weights, axis=0) + 1)
+        _, first_rows, group_labels = np.unique(
+            keys, return_index=True, return_inverse=True)
+        unique_weights = weights[first_rows]
+        group_labels = group_labels.reshape(-1)
+        # A stable sort keeps the original project order within each group.
+        order = np.argsort(group_labels, kind='stable')
+        group_starts = np.searchsorted(
+            group_labels[order], np.arange(len(unique_weights) + 1))
+
+        scenarios_by_first_row = []
+        for g in range(len(unique_weights)):
+            rows = order[group_starts[g]:group_starts[g + 1]]
+            selected, cumulative_areas, cumulative_costs = \
+                _select_projects_within_constraints(
+                    areas[rows], costs[rows], self._max_area, self._max_cost)
+            if len(selected) == 0:
+                continue
+            rows = rows[selected]
+            scenario_weights = dict(
+                zip(self._priorities, unique_weights[g].tolist()))
+            scenario: Scenario = {
+                'priority_weights': scenario_weights,
+                'ranked_projects': _create_ranked_projects(
+                    self._priorities, ids[rows], ranks[rows],
+                    contributions[rows], total_scores[rows]),
+                'cumulative_ranked_project_area': cumulative_areas.tolist(),
+                'cumulative_ranked_project_cost': cumulative_costs.tolist(),
+            }
+            scenarios_by_first_row.append((rows[0], scenario))
+
+        scenarios_by_first_row.sort(key=lambda s: s[0])
+        return {self._get_weights_str(scenario['priority_weights']): scenario
+                for _, scenario in scenarios_by_first_row}
 
 
 # Transforms the output of a Forsys scenario run into a more
@@ -277,18 +344,12 @@ class ForsysRankingOutputForASingleScenario():
         self._max_area = max_area
         self._max_cost = max_cost
 
-        self.scenario = Scenario(
-            {'priority_weights': priority_weights, 'ranked_projects': [],
-             'cumulative_ranked_project_area': [],
-             'cumulative_ranked_project_cost': []})
-        for i in range(len(self._forsys_project_output_df[project_id_header])):
-            self._append_ranked_project_to_scenario(priority_weights, i)
+        self.scenario = self._get_scenario(priority_weights)
 
     def _save_raw_forsys_project_output_as_dict(
             self, raw_forsys_output: "rpy2.robjects.vectors.DataFrame") -> None:
-        rdf = raw_forsys_output[self._PROJECT_OUTPUT_INDEX]
-        self._forsys_project_output_df = {
-            key: np.asarray(rdf.rx2(key)) for key in rdf.names}
+        self._forsys_project_output_df = _convert_dataframe_to_dict(
+            raw_forsys_output[self._PROJECT_OUTPUT_INDEX])
 
     def _check_header_name(self, header) -> None:
         if header not in self._forsys_project_output_df.keys():
@@ -311,57 +372,28 @@ class ForsysRankingOutputForASingleScenario():
         self._project_id_header = project_id_header
         self._check_header_name(self._project_id_header)
 
-    def _create_ranked_project(
-            self, scenario_weights: dict[str, float],
-            ind: int) -> RankedProject:
-        project: RankedProject = {
-            'id': int(
-                self._forsys_project_output_df[self._project_id_header][ind]),
-            'weighted_priority_scores': {},
-            'rank': int(
-                self._forsys_project_output_df[self._TREATMENT_RANK_HEADER][ind]),
-            'total_score': 0,
-        }
-        for i in range(len(self._priorities)):
-            p = self._priorities[i]
-            contribution = self._forsys_project_output_df[
-                self._priority_contribution_headers[i]
-            ][ind] * scenario_weights[p]
-            project['weighted_priority_scores'][p] = contribution
-            project['total_score'] = project['total_score'] + contribution
-        return project
-
-    # TODO: merge logic in _append_ranked_project_to_scenario
-    # _append_ranked_project_to_new_scenario, and
-    # _append_ranked_project_to_existing_scenario into a single function.
-    def _append_ranked_project_to_scenario(
-            self, priority_weights: dict[str, float],
-            i: int) -> None:
-        ranked_projects = self.scenario['ranked_projects']
-        scenario_ind = len(ranked_projects)
-
-        cumulative_area = self._forsys_project_output_df[
-            self._area_contribution_header][i]
-        if scenario_ind > 0:
-            cumulative_area = cumulative_area + \
-                self.scenario['cumulative_ranked_project_area'][scenario_ind - 1]
-        if self._max_area is not None and self._max_area < cumulative_area:
-            return
-
-        cumulative_cost = self._forsys_project_output_df[
-            self._cost_contribution_header][i]
-        if scenario_ind > 0:
-            cumulative_cost = cumulative_cost + \
-                self.scenario['cumulative_ranked_project_cost'][scenario_ind - 1]
-        if self._max_cost is not None and self._max_cost < cumulative_cost:
-            return
-
-        ranked_projects.append(self._create_ranked_project(
-            priority_weights, i))
-        self.scenario['cumulative_ranked_project_area'].append(
-            cumulative_area)
-        self.scenario['cumulative_ranked_project_cost'].append(
-            cumulative_cost)
+    # Builds a Scenario from projects that satisfy global constraints.
+    def _get_scenario(self, priority_weights: dict[str, float]) -> Scenario:
+        df = self._forsys_project_output_df
+        impacts = np.column_stack(
+            [df[h] for h in self._priority_contribution_headers])
+        weights = np.array([priority_weights[p] for p in self._priorities])
+        selected, cumulative_areas, cumulative_costs = \
+            _select_projects_within_constraints(
+                np.asarray(df[self._area_contribution_header]),
+                np.asarray(df[self._cost_contribution_header]),
+                self._max_area, self._max_cost)
+        contributions, total_scores = _get_weighted_contributions(
+            impacts[selected], weights)
+        return Scenario(
+            {'priority_weights': priority_weights,
+             'ranked_projects': _create_ranked_projects(
+                 self._priorities,
+                 np.asarray(df[self._project_id_header])[selected],
+                 np.asarray(df[self._TREATMENT_RANK_HEADER])[selected],
+                 contributions, total_scores),
+             'cumulative_ranked_project_area': cumulative_areas.tolist(),
+             'cumulative_ranked_project_cost': cumulative_costs.tolist()})
 
 
 # Transforms the output of a Forsys scenario run into a more
@@ -377,36 +409,56 @@ class ForsysGenerationOutputForASingleScenario(
 
     # This is used when parsing the raw forsys output's stand output dataframe.
     _geo_wkt_header: str
+    _stand_id_header: str | None
 
     # The raw forsys output consists of 3 R dataframes.
     # The "stand output" dataframe is converted into a dictionary of lists so
     # that it's easier to process in Python.
     _forsys_stand_output_df: dict[str, list]
 
+    # If stand_id_to_pixels and raster_topleft_coords are given (see
+    # ForsysGenerationInput), project area geometries are built by
+    # polygonizing the pixels of each project's stands; stand_id_header must
+    # then name the stand ID column. Otherwise, they're built by merging the
+    # stand geometries in the geo_wkt_header column.
     def __init__(
             self, raw_forsys_output: "rpy2.robjects.vectors.ListVector",
             priority_weights: dict[str, float],
             project_id_header: str, area_header: str, cost_header: str,
-            geo_wkt_header: str):
+            geo_wkt_header: str, stand_id_header: str | None = None,
+            stand_id_to_pixels:
+            dict[int, list[tuple[int, int]]] | None = None,
+            raster_topleft_coords: tuple[float, float] | None = None):
         ForsysRankingOutputForASingleScenario.__init__(
             self, raw_forsys_output, priority_weights, None, None,
             project_id_header, area_header, cost_header)
 
         self._save_raw_forsys_stand_output_as_dict(raw_forsys_output)
-        if geo_wkt_header not in self._forsys_stand_output_df.keys():
-            raise Exception(
-                "header, %s, is not a forsys output header" % geo_wkt_header)
         self._geo_wkt_header = geo_wkt_header
-
-        project_area_geometries = self._get_project_area_geometries(
-            self._forsys_stand_output_df)
+        self._stand_id_header = stand_id_header
+
+        if stand_id_to_pixels is not None and \
+                raster_topleft_coords is not None:
+            if stand_id_header not in self._forsys_stand_output_df.keys():
+                raise Exception(
+                    "header, %s, is not a forsys output header" %
+                    stand_id_header)
+            project_area_geometries = self._polygonize_project_areas(
+                self._forsys_stand_output_df, stand_id_to_pixels,
+                raster_topleft_coords)
+        else:
+            if geo_wkt_header not in self._forsys_stand_output_df.keys():
+                raise Exception(
+                    "header, %s, is not a forsys output header" %
+                    geo_wkt_header)
+            project_area_geometries = self._get_project_area_geometries(
+                self._forsys_stand_output_df)
         self._populate_geo_wkt_in_ranked_projects(project_area_geometries)
 
     def _save_raw_forsys_stand_output_as_dict(
             self, raw_forsys_output: "rpy2.robjects.vectors.DataFrame") -> None:
-        rdf = raw_forsys_output[self._STAND_OUTPUT_INDEX]
-        self._forsys_stand_output_df = {
-            key: np.asarray(rdf.rx2(key)) for key in rdf.names}
+        self._forsys_stand_output_df = _convert_dataframe_to_dict(
+            raw_forsys_output[self._STAND_OUTPUT_INDEX])
 
     def _get_project_area_geometries(
         self, stand_output_df: dict[str, list]
@@ -443,6 +495,100 @@ class ForsysGenerationOutputForASingleScenario(
             merged_polygons[id] = geo
         return merged_polygons
 
+    # Builds project area geometries from the raster pixels of each project's
+    # stands.
+    # All projects are burned into a single label raster (label = project
+    # index + 1), which is polygonized in one pass; all geometries are then
+    # reprojected to settings.DEFAULT_CRS in one batch.
+    def _polygonize_project_areas(
+            self, stand_output_df: dict[str, list],
+            stand_id_to_pixels: dict[int, list[tuple[int, int]]],
+            raster_topleft_coords: tuple[float, float]
+    ) -> dict[int, Polygon | MultiPolygon]:
+        project_ids = np.asarray(
+            stand_output_df[self._project_id_header]).astype(int)
+        stand_ids = np.asarray(
+            stand_output_df[self._stand_id_header]).astype(int)
+        unique_project_ids, project_labels = np.unique(
+            project_ids, return_inverse=True)
+        if len(unique_project_ids) == 0:
+            return {}
+
+        xs = []
+        ys = []
+        labels = []
+        pixel_stand_ids = []
+        for stand_id, label in zip(stand_ids.tolist(),
+                                   project_labels.reshape(-1).tolist()):
+            if stand_id not in stand_id_to_pixels.keys():
+                raise Exception(
+                    "stand, %d, has no pixels" % stand_id)
+            for x, y in stand_id_to_pixels[stand_id]:
+                xs.append(x)
+                ys.append(y)
+                labels.append(label + 1)
+                pixel_stand_ids.append(stand_id)
+        xs = np.array(xs)
+        ys = np.array(ys)
+        xmin = np.min(xs)
+        ymin = np.min(ys)
+        label_raster = np.zeros(
+            (np.max(ys) - ymin + 1, np.max(xs) - xmin + 1), dtype=np.int32)
+        self._validate_disjoint_stands(
+            (ys - ymin) * label_raster.shape[1] + (xs - xmin),
+            np.array(pixel_stand_ids), xs, ys)
+        label_raster[ys - ymin, xs - xmin] = labels
+
+        scale_x, scale_y = settings.CRS_9822_SCALE
+        transform = Affine(
+            scale_x, 0, raster_topleft_coords[0] + scale_x * xmin,
+            0, scale_y, raster_topleft_coords[1] + scale_y * ymin)
+        label_to_polygons = {}
+        for geojson, label in shapes(
+                label_raster, mask=label_raster > 0, connectivity=4,
+                transform=transform):
+            rings = geojson['coordinates']
+            label_to_polygons.setdefault(int(label), []).append(
+                Polygon(rings[0], *rings[1:]))
+
+        geos = []
+        for label in range(1, len(unique_project_ids) + 1):
+            polygons = label_to_polygons[label]
+            geos.append(polygons[0] if len(polygons) == 1
+                        else MultiPolygon(*polygons))
+        collection = GeometryCollection(*geos)
+        collection.transform(
+            CoordTransform(
+                SpatialReference(settings.CRS_9822_PROJ4),
+                SpatialReference(settings.DEFAULT_CRS)))
+
+        merged_polygons = {}
+        for id, geo in zip(unique_project_ids.tolist(), collection):
+            geo.srid = settings.DEFAULT_CRS
+            merged_polygons[id] = geo
+        return merged_polygons
+
+    # Raises an error if two stands claim the same pixel; otherwise, one
+    # stand's project would overwrite the other's in the label raster.
+    # pixel_indices are pixels' indices in the label raster; pixel_stand_ids
+    # are the stands claiming them; xs and ys are their pixel coordinates.
+    def _validate_disjoint_stands(
+            self, pixel_indices: np.ndarray, pixel_stand_ids: np.ndarray,
+            xs: np.ndarray, ys: np.ndarray) -> None:
+        # A stand may list a pixel more than once.
+        claims, first = np.unique(
+            np.stack([pixel_indices, pixel_stand_ids]), axis=1,
+            return_index=True)
+        claimed_pixels, counts = np.unique(claims[0], return_counts=True)
+        if np.all(counts == 1):
+            return
+        pixel = claimed_pixels[np.argmax(counts > 1)]
+        i = first[claims[0] == pixel]
+        raise ValueError(
+            "pixel, (%d, %d), is claimed by more than one stand: %s" %
+            (xs[i[0]], ys[i[0]],
+             ", ".join(str(s) for s in sorted(pixel_stand_ids[i].tolist()))))
+
     def _populate_geo_wkt_in_ranked_projects(
             self,
             project_area_geometries: dict[int, Polygon | MultiPolygon]) -> None:
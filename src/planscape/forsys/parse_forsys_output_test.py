@@ -1,7 +1,7 @@
 import rpy2.robjects as ro
 
 from django.contrib.gis.gdal import CoordTransform, SpatialReference
-from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
 from django.test import TestCase
 from forsys.merge_polygons_test import MergePolygonsTest
 from forsys.parse_forsys_output import (
@@ -615,6 +615,61 @@ class TestForsysGenerationOutputForASingleScenario(MergePolygonsTest):
             str(context.exception),
             'header, geometry, is not a forsys output header')
 
+    def test_polygonizes_stand_pixels(self) -> None:
+        raw_forsys_output = self._get_raw_forsys_output()
+        # Pixel, (x, y), spans pixel coordinates (x, y) to (x + 1, y + 1).
+        stand_id_to_pixels = {
+            5: [(0, 0), (1, 0)],
+            7: [(0, 1)],
+            9: [(2, 2)],
+            1: [(3, 0)],
+        }
+        parsed_output = ForsysGenerationOutputForASingleScenario(
+            raw_forsys_output, {"p1": 1, "p2": 2},
+            "proj_id", "area", "cost", "geo_wkt", "stand_id",
+            stand_id_to_pixels, (self.xorig, self.yorig))
+
+        geos = {p['id']: GEOSGeometry(p['geo_wkt'])
+                for p in parsed_output.scenario['ranked_projects']}
+        self.assertTrue(geos[2].equals(self._create_polygon_in_default_crs(
+            ((0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2), (0, 0)))))
+        self.assertTrue(geos[1].equals(self._create_polygon_in_default_crs(
+            ((2, 2), (3, 2), (3, 3), (2, 3), (2, 2)))))
+        self.assertTrue(geos[3].equals(self._create_polygon_in_default_crs(
+            ((3, 0), (4, 0), (4, 1), (3, 1), (3, 0)))))
+
+    def test_fails_if_stands_share_pixels(self) -> None:
+        raw_forsys_output = self._get_raw_forsys_output()
+        stand_id_to_pixels = {
+            5: [(0, 0), (1, 0)],
+            7: [(0, 1)],
+            9: [(2, 2)],
+            1: [(1, 0)],
+        }
+
+        with self.assertRaises(ValueError) as context:
+            ForsysGenerationOutputForASingleScenario(
+                raw_forsys_output, {"p1": 1, "p2": 2},
+                "proj_id", "area", "cost", "geo_wkt", "stand_id",
+                stand_id_to_pixels, (self.xorig, self.yorig))
+
+        self.assertEqual(
+            str(context.exception),
+            "pixel, (1, 0), is claimed by more than one stand: 1, 5")
+
+    def test_fails_if_stand_id_header_is_wrong(self) -> None:
+        raw_forsys_output = self._get_raw_forsys_output()
+
+        with self.assertRaises(Exception) as context:
+            ForsysGenerationOutputForASingleScenario(
+                raw_forsys_output, {"p1": 1, "p2": 2},
+                "proj_id", "area", "cost", "geo_wkt", "stand",
+                {5: [(0, 0)]}, (self.xorig, self.yorig))
+
+        self.assertEqual(
+            str(context.exception),
+            'header, stand, is not a forsys output header')
+
     def _create_polygon_in_default_crs(
             self, coordinates: tuple[tuple[int, int]]) -> MultiPolygon:
         geo = MergePolygonsTest._create_polygon(
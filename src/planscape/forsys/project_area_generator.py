@@ -0,0 +1,273 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from forsys.forsys_request_params import ProjectAreaGeneratorRequestParams
+from forsys.get_forsys_inputs import ForsysInputHeaders
+
+# Output formats from forsys::run.
+_TREATMENT_IMPACT_STRFORMAT = "ETrt_%s"
+_TREATMENT_RANK_HEADER = "treatment_rank"
+
+
+# Returns a (stands x stands) sparse adjacency matrix in which stands are
+# adjacent if any of their pixels share an edge.
+# stand_ids lists the stand ID of each row of the forsys input; matrix indices
+# are row indices.
+def get_stand_adjacency(
+        stand_ids: list[int],
+        stand_id_to_pixels: dict[int, list[tuple[int, int]]]
+) -> sparse.csr_matrix:
+    num_stands = len(stand_ids)
+    xs = []
+    ys = []
+    rows = []
+    for row, stand_id in enumerate(stand_ids):
+        pixels = stand_id_to_pixels.get(stand_id, [])
+        xs.extend(x for x, _ in pixels)
+        ys.extend(y for _, y in pixels)
+        rows.extend([row] * len(pixels))
+    if len(rows) == 0:
+        return sparse.csr_matrix((num_stands, num_stands))
+
+    xs = np.array(xs)
+    ys = np.array(ys)
+    grid = np.full((np.max(xs) - np.min(xs) + 1, np.max(ys) - np.min(ys) + 1),
+                   -1)
+    grid[xs - np.min(xs), ys - np.min(ys)] = rows
+
+    pairs = []
+    for a, b in ((grid[:-1, :], grid[1:, :]), (grid[:, :-1], grid[:, 1:])):
+        a = a.reshape(-1)
+        b = b.reshape(-1)
+        keep = (a >= 0) & (b >= 0) & (a != b)
+        pairs.append((a[keep], b[keep]))
+    a = np.concatenate([p[0] for p in pairs] + [p[1] for p in pairs])
+    b = np.concatenate([p[1] for p in pairs] + [p[0] for p in pairs])
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(a), dtype=bool), (a, b)), shape=(num_stands, num_stands))
+    adjacency.sum_duplicates()
+    return adjacency
+
+
+# Computes a score for each stand: the weighted sum of each priority's PCP (as
+# in generate_projects_for_a_single_scenario.R). Stands ineligible for
+# treatment score 0.
+def get_stand_scores(priority_values: np.ndarray, priority_weights: np.ndarray,
+                     eligible: np.ndarray) -> np.ndarray:
+    sums = np.sum(priority_values, axis=0)
+    pcp = np.divide(priority_values * 100, sums,
+                    out=np.zeros_like(priority_values), where=sums != 0)
+    scores = np.zeros(len(priority_values))
+    for i in range(priority_values.shape[1]):
+        scores = scores + pcp[:, i] * priority_weights[i]
+    return np.where(eligible, scores, 0)
+
+
+# Grows a contiguous project area from seed, one stand at a time, always
+# adding the highest-scoring available neighbor (ties go to the lower index)
+# that keeps the project area within max_area and its ineligible area within
+# max_excluded_area. Growth stops when no neighbor fits.
+# indptr and indices are the CSR arrays of the stand adjacency matrix.
+# Returns the project area's stand indices and total score.
+def _grow_project_area(
+        seed: int, indptr: np.ndarray, indices: np.ndarray,
+        scores: np.ndarray, areas: np.ndarray, eligible: np.ndarray,
+        available: np.ndarray, max_area: float,
+        max_excluded_area: float) -> tuple[np.ndarray, float]:
+    stands = [seed]
+    area = areas[seed]
+    excluded_area = 0.0
+    visited = {seed}
+    frontier = []
+    current = seed
+    while True:
+        for neighbor in indices[indptr[current]:indptr[current + 1]]:
+            neighbor = int(neighbor)
+            if neighbor in visited or not available[neighbor]:
+                continue
+            visited.add(neighbor)
+            heapq.heappush(frontier, (-scores[neighbor], neighbor))
+
+        current = None
+        while len(frontier) > 0:
+            _, candidate = heapq.heappop(frontier)
+            if area + areas[candidate] > max_area:
+                continue
+            if not eligible[candidate]:
+                if excluded_area + areas[candidate] > max_excluded_area:
+                    continue
+                excluded_area = excluded_area + areas[candidate]
+            current = candidate
+            break
+        if current is None:
+            break
+        stands.append(current)
+        area = area + areas[current]
+
+    stands = np.array(stands)
+    return stands, float(np.sum(scores[stands]))
+
+
+# Grows project areas from each seed in seeds.
+def _grow_project_areas(
+        seeds: list[int], indptr: np.ndarray, indices: np.ndarray,
+        scores: np.ndarray, areas: np.ndarray, eligible: np.ndarray,
+        available: np.ndarray, max_area: float,
+        max_excluded_area: float) -> list[tuple[np.ndarray, float]]:
+    return [_grow_project_area(s, indptr, indices, scores, areas, eligible,
+                               available, max_area, max_excluded_area)
+            for s in seeds]
+
+
+# Generates project areas in-process, as an alternative to Patchmax.
+#   1. Stands are scored by the weighted sum of each priority's PCP;
+#      ineligible stands score 0 but may still join project areas (up to the
+#      exclusion limit) to connect eligible stands.
+#   2. The highest-scoring eligible stands (seed_fraction of them) are used as
+#      seeds. A project area is grown from every seed (see
+#      _grow_project_area); seeds are split across worker processes.
+#   3. The highest-scoring project area is selected and its stands are
+#      removed. Only project areas that overlapped it are regrown, and the
+#      step repeats until num_projects project areas are selected or no seeds
+#      remain.
+# Output has the same format as converted forsys::run output (see
+# forsys.r_worker_pool), so forsys.parse_forsys_output parses it the same way
+# as Patchmax output.
+class ProjectAreaGenerator():
+    # Maximum number of worker processes. If None, os.cpu_count() is used. If
+    # 1, project areas are grown in the calling process.
+    MAX_WORKERS = None
+    # Seeds are grown in the calling process if there are fewer than this many
+    # seeds per worker; otherwise, process start-up dominates.
+    MIN_SEEDS_PER_WORKER = 64
+
+    # Indices (into forsys input rows) of each selected project area's stands,
+    # in order of selection.
+    project_areas: list[np.ndarray]
+    # The score of each selected project area.
+    project_area_scores: list[float]
+    # Output in the format of converted forsys::run output.
+    forsys_output: list[dict[str, np.ndarray]]
+
+    def __init__(self, forsys_input: dict[str, list],
+                 headers: ForsysInputHeaders, priority_weights: list[float],
+                 params: ProjectAreaGeneratorRequestParams,
+                 stand_id_to_pixels: dict[int, list[tuple[int, int]]]):
+        stand_ids = list(forsys_input[headers.FORSYS_STAND_ID_HEADER])
+        areas = np.asarray(forsys_input[headers.FORSYS_AREA_HEADER],
+                           dtype=float)
+        eligible = np.asarray(
+            forsys_input[headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER],
+            dtype=float).reshape(-1) > 0
+        priority_values = np.column_stack(
+            [np.asarray(forsys_input[h], dtype=float)
+             for h in headers.priority_headers]).reshape(
+                 len(stand_ids), len(headers.priority_headers))
+        scores = get_stand_scores(
+            priority_values, np.asarray(priority_weights, dtype=float),
+            eligible)
+        adjacency = get_stand_adjacency(stand_ids, stand_id_to_pixels)
+
+        self.project_areas, self.project_area_scores = \
+            self._select_project_areas(
+                adjacency, scores, areas, eligible, params)
+        self.forsys_output = self._create_output(forsys_input, headers)
+
+    def _select_project_areas(
+            self, adjacency: sparse.csr_matrix, scores: np.ndarray,
+            areas: np.ndarray, eligible: np.ndarray,
+            params: ProjectAreaGeneratorRequestParams
+    ) -> tuple[list[np.ndarray], list[float]]:
+        max_area = params.max_project_area
+        max_excluded_area = params.exclusion_limit * max_area
+        available = np.full(len(scores), True)
+
+        candidates = np.flatnonzero(eligible & (areas <= max_area))
+        num_seeds = int(np.ceil(params.seed_fraction * len(candidates)))
+        # A stable sort on negated scores breaks ties by stand order.
+        seeds = candidates[np.argsort(-scores[candidates], kind='stable')][
+            :num_seeds].tolist()
+        seed_ranks = {s: i for i, s in enumerate(seeds)}
+
+        args = (adjacency.indptr, adjacency.indices, scores, areas, eligible)
+        patches = dict(zip(seeds, self._grow(
+            seeds, *args, available, max_area, max_excluded_area)))
+
+        project_areas = []
+        project_area_scores = []
+        while len(project_areas) < params.num_projects and len(patches) > 0:
+            # Ties go to the higher-ranked seed.
+            seed = max(patches.keys(),
+                       key=lambda s: (patches[s][1], -seed_ranks[s]))
+            stands, score = patches.pop(seed)
+            project_areas.append(stands)
+            project_area_scores.append(score)
+            available[stands] = False
+
+            for s in list(patches.keys()):
+                if not available[s]:
+                    del patches[s]
+            stale = [s for s in patches.keys()
+                     if not np.all(available[patches[s][0]])]
+            patches.update(zip(stale, self._grow(
+                stale, *args, available, max_area, max_excluded_area)))
+        return project_areas, project_area_scores
+
+    # Grows project areas from seeds, in worker processes if there are enough
+    # seeds.
+    def _grow(self, seeds: list[int], *args) -> list[tuple[np.ndarray,
+                                                           float]]:
+        max_workers = min(self.MAX_WORKERS or os.cpu_count() or 1,
+                          len(seeds) // self.MIN_SEEDS_PER_WORKER)
+        if max_workers <= 1:
+            return _grow_project_areas(seeds, *args)
+
+        chunk_size = int(np.ceil(len(seeds) / max_workers))
+        chunks = [seeds[i:i + chunk_size]
+                  for i in range(0, len(seeds), chunk_size)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                _grow_project_areas, chunks,
+                *[[a] * len(chunks) for a in args])
+            return [r for chunk in results for r in chunk]
+
+    # Builds forsys::run output for selected project areas. Project IDs are
+    # 1, 2, ... in order of selection, which is also the order of rank.
+    # Project-level outputs (ETrt_*) are summed over stands eligible for
+    # treatment, as with Patchmax's stand_threshold.
+    def _create_output(
+            self, forsys_input: dict[str, list],
+            headers: ForsysInputHeaders) -> list[dict[str, np.ndarray]]:
+        eligible = np.asarray(
+            forsys_input[headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER],
+            dtype=float).reshape(-1) > 0
+        rows = np.concatenate(
+            self.project_areas + [np.array([], dtype=int)]).astype(int)
+        proj_ids = np.concatenate(
+            [np.full(len(stands), i + 1)
+             for i, stands in enumerate(self.project_areas)] +
+            [np.array([], dtype=int)]).astype(int)
+
+        stand_output = {headers.FORSYS_PROJECT_ID_HEADER: proj_ids}
+        for h in (headers.FORSYS_STAND_ID_HEADER,
+                  headers.FORSYS_GEO_WKT_HEADER):
+            if h in forsys_input.keys():
+                stand_output[h] = np.asarray(forsys_input[h])[rows]
+
+        num_projects = len(self.project_areas)
+        project_output = {
+            headers.FORSYS_PROJECT_ID_HEADER: np.arange(1, num_projects + 1),
+            _TREATMENT_RANK_HEADER: np.arange(1, num_projects + 1),
+        }
+        for h in headers.priority_headers + [headers.FORSYS_AREA_HEADER,
+                                             headers.FORSYS_COST_HEADER]:
+            values = np.where(
+                eligible, np.asarray(forsys_input[h], dtype=float), 0)
+            project_output[_TREATMENT_IMPACT_STRFORMAT % h] = np.array(
+                [float(np.sum(values[stands]))
+                 for stands in self.project_areas])
+        return [stand_output, project_output, {}]
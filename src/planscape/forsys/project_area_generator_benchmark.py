@@ -0,0 +1,170 @@
+import argparse
+import os
+import time
+
+import django
+import numpy as np
+
+from scipy.sparse.csgraph import connected_components
+
+# Generator parameters and input headers live alongside Django models.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'planscape.settings')
+django.setup()
+
+from django.http import QueryDict
+from forsys.cluster_stands_benchmark import _generate_raster
+from forsys.forsys_request_params import ProjectAreaGeneratorRequestParams
+from forsys.get_forsys_inputs import ForsysInputHeaders
+from forsys.project_area_generator import (ProjectAreaGenerator,
+                                           get_stand_adjacency,
+                                           get_stand_scores)
+from forsys.r_worker_pool import _convert_from_r, _convert_to_r
+
+
+# Compares project area generators on synthetic rasters (one stand per
+# pixel).
+# For each generator and raster size, reports ...
+#   ... runtime in seconds
+#   ... the total score of generated project areas (the sum of stand scores,
+#       as computed by project_area_generator.get_stand_scores)
+#   ... the total score as a fraction of an upper bound: the best stands that
+#       fit in num_projects * max_project_area, ignoring contiguity
+#   ... the number of project areas that aren't contiguous (should be 0)
+#
+# Patchmax is only run if --with_patchmax is set; it requires R with the
+# forsys and patchmax packages.
+#
+# Usage (from src/planscape):
+#   python -m forsys.project_area_generator_benchmark --sizes 50 100 200
+def _get_forsys_input(
+        raster: dict[int, dict[int, dict[str, float]]],
+        headers: ForsysInputHeaders, pixel_area: float
+) -> tuple[dict[str, list], dict[int, list[tuple[int, int]]]]:
+    forsys_input = {
+        headers.FORSYS_STAND_ID_HEADER: [],
+        headers.FORSYS_PROJECT_ID_HEADER: [],
+        headers.FORSYS_AREA_HEADER: [],
+        headers.FORSYS_COST_HEADER: [],
+        headers.FORSYS_GEO_WKT_HEADER: [],
+        headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER: [],
+    }
+    for h in headers.priority_headers + headers.condition_headers:
+        forsys_input[h] = []
+    stand_id_to_pixels = {}
+    for x in raster.keys():
+        for y in raster[x].keys():
+            stand_id = len(stand_id_to_pixels)
+            stand_id_to_pixels[stand_id] = [(x, y)]
+            forsys_input[headers.FORSYS_STAND_ID_HEADER].append(stand_id)
+            forsys_input[headers.FORSYS_PROJECT_ID_HEADER].append(0)
+            forsys_input[headers.FORSYS_AREA_HEADER].append(pixel_area)
+            forsys_input[headers.FORSYS_COST_HEADER].append(pixel_area)
+            forsys_input[headers.FORSYS_GEO_WKT_HEADER].append(
+                'POLYGON ((%d %d, %d %d, %d %d, %d %d, %d %d))' % (
+                    x, y, x + 1, y, x + 1, y + 1, x, y + 1, x, y))
+            forsys_input[headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER].append(
+                1.0)
+            for p, v in raster[x][y].items():
+                forsys_input[headers.get_priority_header(p)].append(v)
+                forsys_input[headers.get_condition_header(p)].append(v)
+    return forsys_input, stand_id_to_pixels
+
+
+# Generates project areas with Patchmax, via
+# generate_projects_for_a_single_scenario.R.
+# Returns the forsys input row indices of each project area's stands.
+def _run_patchmax(forsys_input: dict[str, list], headers: ForsysInputHeaders,
+                  priority_weights: list[float]) -> list[np.ndarray]:
+    import rpy2.robjects as robjects
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    robjects.r.source(os.path.join(
+        base_dir, 'forsys/generate_projects_for_a_single_scenario.R'))
+    output = _convert_from_r(
+        robjects.globalenv['generate_projects_for_a_single_scenario'](*[
+            _convert_to_r(a) for a in [
+                forsys_input, headers.priority_headers,
+                headers.condition_headers, priority_weights,
+                headers.FORSYS_STAND_ID_HEADER,
+                headers.FORSYS_PROJECT_ID_HEADER,
+                headers.FORSYS_AREA_HEADER, headers.FORSYS_COST_HEADER,
+                headers.FORSYS_GEO_WKT_HEADER,
+                headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER, "", "", False]]))
+    stand_output = output[0]
+    stand_ids = np.asarray(
+        stand_output[headers.FORSYS_STAND_ID_HEADER]).astype(int)
+    proj_ids = np.asarray(
+        stand_output[headers.FORSYS_PROJECT_ID_HEADER]).astype(int)
+    # Stand IDs are row indices of the forsys input.
+    return [stand_ids[proj_ids == id] for id in np.unique(proj_ids)]
+
+
+def _evaluate(project_areas: list[np.ndarray], scores: np.ndarray,
+              adjacency) -> tuple[float, int]:
+    total_score = 0.0
+    num_noncontiguous = 0
+    for stands in project_areas:
+        total_score = total_score + float(np.sum(scores[stands]))
+        if connected_components(adjacency[stands][:, stands])[0] > 1:
+            num_noncontiguous = num_noncontiguous + 1
+    return total_score, num_noncontiguous
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks project area generators.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[50, 100],
+                        help='Raster widths (rasters are square).')
+    parser.add_argument('--num_priorities', type=int, default=3)
+    parser.add_argument('--pixel_area', type=float, default=0.09,
+                        help='Stand area, in km-squared.')
+    parser.add_argument('--url_params', default='',
+                        help='ProjectAreaGeneratorRequestParams url params, ' +
+                        'e.g. "max_project_area=20&num_projects=3".')
+    parser.add_argument('--with_patchmax', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    params = ProjectAreaGeneratorRequestParams(QueryDict(args.url_params))
+    priorities = ['p%d' % p for p in range(args.num_priorities)]
+    headers = ForsysInputHeaders(priorities)
+    priority_weights = [float(p + 1) for p in range(args.num_priorities)]
+
+    print('%-20s %8s %9s %10s %12s %10s %14s' % (
+        'generator', 'size', 'projects', 'seconds', 'score', 'of_bound',
+        'noncontiguous'))
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        raster = _generate_raster(size, args.num_priorities, rng)
+        forsys_input, stand_id_to_pixels = _get_forsys_input(
+            raster, headers, args.pixel_area)
+        scores = get_stand_scores(
+            np.column_stack([forsys_input[h]
+                             for h in headers.priority_headers]),
+            np.array(priority_weights),
+            np.full(len(stand_id_to_pixels), True))
+        adjacency = get_stand_adjacency(
+            forsys_input[headers.FORSYS_STAND_ID_HEADER], stand_id_to_pixels)
+        num_bound_stands = int(
+            params.num_projects * params.max_project_area // args.pixel_area)
+        bound = float(np.sum(np.sort(scores)[::-1][:num_bound_stands]))
+
+        generators = {
+            'greedy_in_python': lambda: ProjectAreaGenerator(
+                forsys_input, headers, priority_weights, params,
+                stand_id_to_pixels).project_areas}
+        if args.with_patchmax:
+            generators['patchmax'] = lambda: _run_patchmax(
+                forsys_input, headers, priority_weights)
+        for name, generate in generators.items():
+            start = time.perf_counter()
+            project_areas = generate()
+            seconds = time.perf_counter() - start
+            total_score, num_noncontiguous = _evaluate(
+                project_areas, scores, adjacency)
+            print('%-20s %8d %9d %10.3f %12.3f %10.3f %14d' % (
+                name, size, len(project_areas), seconds, total_score,
+                total_score / bound if bound > 0 else 0, num_noncontiguous))
+
+
+if __name__ == '__main__':
+    main()
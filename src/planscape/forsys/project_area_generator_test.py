@@ -0,0 +1,169 @@
+import numpy as np
+
+from django.http import QueryDict
+from django.test import TestCase
+from forsys.forsys_request_params import ProjectAreaGeneratorRequestParams
+from forsys.get_forsys_inputs import ForsysInputHeaders
+from forsys.parse_forsys_output import ForsysRankingOutputForASingleScenario
+from forsys.project_area_generator import (ProjectAreaGenerator,
+                                           get_stand_adjacency,
+                                           get_stand_scores)
+
+
+class GetStandAdjacencyTest(TestCase):
+    def test_connects_stands_sharing_pixel_edges(self):
+        # Stand 10 covers the left column of a 2x2 grid; stands 11 and 12
+        # cover the right column. Stand 13 is isolated.
+        stand_id_to_pixels = {10: [(0, 0), (0, 1)], 11: [(1, 0)],
+                              12: [(1, 1)], 13: [(5, 5)]}
+        adjacency = get_stand_adjacency([10, 11, 12, 13], stand_id_to_pixels)
+        self.assertListEqual(adjacency.toarray().astype(int).tolist(), [
+            [0, 1, 1, 0],
+            [1, 0, 1, 0],
+            [1, 1, 0, 0],
+            [0, 0, 0, 0]])
+
+    def test_ignores_diagonal_pixels(self):
+        adjacency = get_stand_adjacency(
+            [0, 1], {0: [(0, 0)], 1: [(1, 1)]})
+        self.assertEqual(adjacency.nnz, 0)
+
+
+class GetStandScoresTest(TestCase):
+    def test_weights_percent_of_total(self):
+        scores = get_stand_scores(
+            np.array([[1, 0], [3, 2], [0, 2]], dtype=float),
+            np.array([1, 2]), np.array([True, True, False]))
+        self.assertListEqual(scores.tolist(), [25, 175, 0])
+
+
+class ProjectAreaGeneratorTest(TestCase):
+    def setUp(self) -> None:
+        self.headers = ForsysInputHeaders(['foo'])
+        self.size = 6
+        # A 6x6 grid with a high-scoring 2x2 block in the top-left corner and a
+        # medium-scoring 2x2 block in the bottom-right corner.
+        values = np.full((self.size, self.size), 0.1)
+        values[0:2, 0:2] = 1
+        values[4:6, 4:6] = 0.5
+        self.forsys_input = self._get_forsys_input(
+            values, np.full((self.size, self.size), True))
+
+    def _get_forsys_input(self, values: np.ndarray,
+                          eligible: np.ndarray) -> dict[str, list]:
+        forsys_input = {
+            self.headers.FORSYS_STAND_ID_HEADER: [],
+            self.headers.FORSYS_PROJECT_ID_HEADER: [],
+            self.headers.FORSYS_AREA_HEADER: [],
+            self.headers.FORSYS_COST_HEADER: [],
+            self.headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER: [],
+            'p_foo': [],
+        }
+        self.stand_id_to_pixels = {}
+        for x in range(values.shape[0]):
+            for y in range(values.shape[1]):
+                stand_id = len(self.stand_id_to_pixels)
+                self.stand_id_to_pixels[stand_id] = [(x, y)]
+                forsys_input[self.headers.FORSYS_STAND_ID_HEADER].append(
+                    stand_id)
+                forsys_input[self.headers.FORSYS_PROJECT_ID_HEADER].append(0)
+                forsys_input[self.headers.FORSYS_AREA_HEADER].append(1.0)
+                forsys_input[self.headers.FORSYS_COST_HEADER].append(10.0)
+                forsys_input[
+                    self.headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER].append(
+                        1.0 if eligible[x, y] else 0.0)
+                forsys_input['p_foo'].append(
+                    float(values[x, y]) if eligible[x, y] else 0.0)
+        return forsys_input
+
+    def _get_params(
+            self, url_params: str) -> ProjectAreaGeneratorRequestParams:
+        return ProjectAreaGeneratorRequestParams(QueryDict(
+            'project_area_generator_type=1&seed_fraction=1&' + url_params))
+
+    def _get_pixels(self, stands: np.ndarray) -> list[tuple[int, int]]:
+        return sorted(self.stand_id_to_pixels[int(s)][0] for s in stands)
+
+    def test_generates_project_areas_in_order_of_score(self):
+        generator = ProjectAreaGenerator(
+            self.forsys_input, self.headers, [1],
+            self._get_params('max_project_area=4&num_projects=2'),
+            self.stand_id_to_pixels)
+        self.assertEqual(len(generator.project_areas), 2)
+        self.assertListEqual(
+            self._get_pixels(generator.project_areas[0]),
+            [(0, 0), (0, 1), (1, 0), (1, 1)])
+        self.assertListEqual(
+            self._get_pixels(generator.project_areas[1]),
+            [(4, 4), (4, 5), (5, 4), (5, 5)])
+        self.assertGreater(generator.project_area_scores[0],
+                           generator.project_area_scores[1])
+
+    def test_respects_max_project_area(self):
+        generator = ProjectAreaGenerator(
+            self.forsys_input, self.headers, [1],
+            self._get_params('max_project_area=2.5&num_projects=3'),
+            self.stand_id_to_pixels)
+        for stands in generator.project_areas:
+            self.assertEqual(len(stands), 2)
+        # Project areas don't overlap.
+        all_stands = np.concatenate(generator.project_areas)
+        self.assertEqual(len(all_stands), len(np.unique(all_stands)))
+
+    def test_limits_ineligible_stands(self):
+        # Two high-scoring stands separated by an ineligible stand.
+        values = np.zeros((1, 3))
+        values[0, 0] = 1
+        values[0, 2] = 1
+        eligible = np.array([[True, False, True]])
+        forsys_input = self._get_forsys_input(values, eligible)
+
+        generator = ProjectAreaGenerator(
+            forsys_input, self.headers, [1],
+            self._get_params('max_project_area=3&exclusion_limit=0.5'),
+            self.stand_id_to_pixels)
+        self.assertEqual(len(generator.project_areas[0]), 3)
+
+        generator = ProjectAreaGenerator(
+            forsys_input, self.headers, [1],
+            self._get_params('max_project_area=3&exclusion_limit=0'),
+            self.stand_id_to_pixels)
+        self.assertEqual(len(generator.project_areas[0]), 1)
+
+    def test_grows_seeds_in_parallel(self):
+        params = self._get_params('max_project_area=4&num_projects=3')
+        expected = ProjectAreaGenerator(
+            self.forsys_input, self.headers, [1], params,
+            self.stand_id_to_pixels).project_areas
+
+        class ParallelGenerator(ProjectAreaGenerator):
+            MAX_WORKERS = 2
+            MIN_SEEDS_PER_WORKER = 1
+
+        project_areas = ParallelGenerator(
+            self.forsys_input, self.headers, [1], params,
+            self.stand_id_to_pixels).project_areas
+        self.assertEqual(len(project_areas), len(expected))
+        for a, b in zip(project_areas, expected):
+            self.assertListEqual(a.tolist(), b.tolist())
+
+    def test_output_is_parseable(self):
+        generator = ProjectAreaGenerator(
+            self.forsys_input, self.headers, [1],
+            self._get_params('max_project_area=4&num_projects=2'),
+            self.stand_id_to_pixels)
+        scenario = ForsysRankingOutputForASingleScenario(
+            generator.forsys_output, {'p_foo': 1}, None, None,
+            self.headers.FORSYS_PROJECT_ID_HEADER,
+            self.headers.FORSYS_AREA_HEADER,
+            self.headers.FORSYS_COST_HEADER).scenario
+        self.assertListEqual(
+            [p['id'] for p in scenario['ranked_projects']], [1, 2])
+        self.assertAlmostEqual(
+            scenario['ranked_projects'][0]['total_score'], 4)
+        self.assertListEqual(scenario['cumulative_ranked_project_area'],
+                             [4, 8])
+        stand_output = generator.forsys_output[0]
+        self.assertListEqual(
+            stand_output[self.headers.FORSYS_PROJECT_ID_HEADER].tolist(),
+            [1] * 4 + [2] * 4)
@@ -0,0 +1,223 @@
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+from typing import Callable
+
+import numpy as np
+
+from multiprocessing.connection import Connection
+
+logger = logging.getLogger(__name__)
+
+# R scripts sourced by every worker at start-up, relative to settings.BASE_DIR.
+FORSYS_R_SCRIPTS = [
+    'forsys/rank_projects_for_multiple_scenarios.R',
+    'forsys/rank_projects_for_a_single_scenario.R',
+    'forsys/generate_projects_for_a_single_scenario.R',
+]
+
+
+# Converts a python job argument into an R object.
+#   - dictionaries of lists become R dataframes (as in
+#     forsys.views.convert_dictionary_of_lists_to_rdf)
+#   - lists of strings become StrVectors
+#   - other lists become FloatVectors
+#   - scalars are passed through as is
+def _convert_to_r(value):
+    import rpy2.robjects as robjects
+    if isinstance(value, dict):
+        data = {}
+        for key in value.keys():
+            if len(value[key]) == 0:
+                continue
+            el = value[key][0]
+            if isinstance(el, str):
+                data[key] = robjects.StrVector(value[key])
+            elif isinstance(el, float):
+                data[key] = robjects.FloatVector(value[key])
+            elif isinstance(el, int):
+                data[key] = robjects.IntVector(value[key])
+        return robjects.vectors.DataFrame(data)
+    if isinstance(value, list):
+        if len(value) > 0 and isinstance(value[0], str):
+            return robjects.StrVector(value)
+        return robjects.FloatVector(value)
+    return value
+
+
+# Converts R output, a list of R dataframes, into a list of dictionaries
+# mapping column names to numpy arrays.
+# forsys.parse_forsys_output accepts either format.
+def _convert_from_r(output) -> list[dict[str, np.ndarray]]:
+    return [{key: np.asarray(rdf.rx2(key)) for key in rdf.names}
+            for rdf in output]
+
+
+# The main loop of an R worker process.
+# Sources R scripts once, then runs jobs received over conn until conn is
+# closed. Each job is a (function name, args) tuple; each reply is either
+# ('ok', output) or ('error', message).
+def _run_worker(conn: Connection, base_dir: str, scripts: list[str],
+                max_memory_bytes: int) -> None:
+    if max_memory_bytes > 0:
+        resource.setrlimit(resource.RLIMIT_AS,
+                           (max_memory_bytes, max_memory_bytes))
+    import rpy2.robjects as robjects
+    for script in scripts:
+        robjects.r.source(os.path.join(base_dir, script))
+
+    while True:
+        try:
+            function_name, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            output = robjects.globalenv[function_name](
+                *[_convert_to_r(a) for a in args])
+            conn.send(('ok', _convert_from_r(output)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+# A long-lived R worker process and the parent's end of its pipe.
+class _RWorker():
+    process: multiprocessing.Process
+    conn: Connection
+    num_jobs: int
+
+    def __init__(self, context: multiprocessing.context.BaseContext,
+                 target: Callable, base_dir: str, scripts: list[str],
+                 max_memory_bytes: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=target,
+            args=(child_conn, base_dir, scripts, max_memory_bytes),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.num_jobs = 0
+
+    def stop(self) -> None:
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+# A pool of R worker processes that source forsys R scripts (and load their
+# libraries) once at start-up rather than once per call.
+# Since each worker has its own embedded R instance, up to num_workers forsys
+# runs proceed in parallel.
+#
+# Jobs are dispatched over pipes. A worker is killed and replaced if ...
+#   ... a job exceeds job_timeout_seconds
+#   ... the worker dies (e.g. by exceeding max_memory_bytes)
+#   ... the worker has run max_jobs_per_worker jobs (this bounds the impact of
+#       memory leaks in R)
+# Workers are spawned rather than forked so that they don't inherit the web
+# worker's state.
+# worker_target is the main loop of worker processes (tests substitute one
+# that doesn't need R); it has the signature of _run_worker.
+class RWorkerPool():
+    _base_dir: str
+    _scripts: list[str]
+    _job_timeout_seconds: float
+    _max_memory_bytes: int
+    _max_jobs_per_worker: int
+    _context: multiprocessing.context.BaseContext
+    _worker_target: Callable
+    # Workers that aren't running a job.
+    _idle_workers: queue.Queue
+
+    def __init__(self, num_workers: int, base_dir: str, scripts: list[str],
+                 job_timeout_seconds: float, max_memory_bytes: int,
+                 max_jobs_per_worker: int,
+                 worker_target: Callable = _run_worker):
+        if num_workers <= 0:
+            raise Exception("expected num_workers to be > 0")
+        self._base_dir = base_dir
+        self._scripts = scripts
+        self._job_timeout_seconds = job_timeout_seconds
+        self._max_memory_bytes = max_memory_bytes
+        self._max_jobs_per_worker = max_jobs_per_worker
+        self._context = multiprocessing.get_context('spawn')
+        self._worker_target = worker_target
+        self._idle_workers = queue.Queue()
+        for _ in range(num_workers):
+            self._idle_workers.put(self._start_worker())
+
+    # Calls R function, function_name, with args and returns its output as a
+    # list of dictionaries mapping column names to numpy arrays.
+    # Blocks until a worker is available.
+    def call(self, function_name: str,
+             *args) -> list[dict[str, np.ndarray]]:
+        worker = self._idle_workers.get()
+        # Whether worker finished the job; if not, it has been replaced by a
+        # fresh worker, which shouldn't count the job.
+        finished = False
+        try:
+            worker.conn.send((function_name, list(args)))
+            if not worker.conn.poll(self._job_timeout_seconds):
+                worker = self._replace_worker(worker)
+                raise Exception(
+                    "forsys job, %s, timed out after %d seconds" %
+                    (function_name, self._job_timeout_seconds))
+            status, output = worker.conn.recv()
+            finished = True
+        except (EOFError, OSError):
+            worker = self._replace_worker(worker)
+            raise Exception(
+                "forsys worker exited while running %s" % function_name)
+        finally:
+            if finished:
+                worker.num_jobs = worker.num_jobs + 1
+                if worker.num_jobs >= self._max_jobs_per_worker:
+                    worker = self._replace_worker(worker)
+            self._idle_workers.put(worker)
+
+        if status == 'error':
+            raise Exception(output)
+        return output
+
+    # Stops all idle workers.
+    def close(self) -> None:
+        while not self._idle_workers.empty():
+            self._idle_workers.get().stop()
+
+    def _start_worker(self) -> _RWorker:
+        return _RWorker(self._context, self._worker_target, self._base_dir,
+                        self._scripts, self._max_memory_bytes)
+
+    def _replace_worker(self, worker: _RWorker) -> _RWorker:
+        logger.warning('replacing forsys R worker, pid %d' %
+                       worker.process.pid)
+        worker.stop()
+        return self._start_worker()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Returns the process-wide R worker pool, starting it on first use.
+# Returns None if settings.FORSYS_R_WORKERS is 0, in which case callers run R
+# in-process.
+def get_r_worker_pool() -> RWorkerPool | None:
+    global _pool
+    # Imported here so that spawned workers, which import this module, don't
+    # load Django settings.
+    from planscape import settings
+    if settings.FORSYS_R_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = RWorkerPool(
+                settings.FORSYS_R_WORKERS, str(settings.BASE_DIR),
+                FORSYS_R_SCRIPTS, settings.FORSYS_R_JOB_TIMEOUT_SECONDS,
+                settings.FORSYS_R_WORKER_MAX_MEMORY_MB * 1024 * 1024,
+                settings.FORSYS_R_WORKER_MAX_JOBS)
+        return _pool
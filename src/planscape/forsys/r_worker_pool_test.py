@@ -0,0 +1,104 @@
+import os
+import time
+
+from django.test import TestCase
+from forsys.r_worker_pool import RWorkerPool
+
+
+# A worker main loop that stands in for forsys.r_worker_pool._run_worker
+# without needing R. Jobs are:
+#   - ('echo', args): replies with args
+#   - ('sleep', [seconds]): sleeps, then replies with seconds
+#   - ('fail', [message]): replies with an error
+#   - ('exit', []): exits without replying
+def _run_stub_worker(conn, base_dir, scripts, max_memory_bytes) -> None:
+    while True:
+        try:
+            function_name, args = conn.recv()
+        except EOFError:
+            return
+        if function_name == 'echo':
+            conn.send(('ok', args))
+        elif function_name == 'sleep':
+            time.sleep(args[0])
+            conn.send(('ok', args[0]))
+        elif function_name == 'fail':
+            conn.send(('error', args[0]))
+        elif function_name == 'exit':
+            os._exit(1)
+
+
+class RWorkerPoolTest(TestCase):
+    def setUp(self) -> None:
+        self.pool = self._create_pool(max_jobs_per_worker=100)
+
+    def tearDown(self) -> None:
+        self.pool.close()
+
+    def _create_pool(self, max_jobs_per_worker: int) -> RWorkerPool:
+        return RWorkerPool(
+            1, '', [], job_timeout_seconds=1, max_memory_bytes=0,
+            max_jobs_per_worker=max_jobs_per_worker,
+            worker_target=_run_stub_worker)
+
+    # Returns the pool's only (idle) worker.
+    def _get_worker(self, pool: RWorkerPool):
+        return pool._idle_workers.queue[0]
+
+    def test_dispatches_jobs(self):
+        pid = self._get_worker(self.pool).process.pid
+        self.assertEqual(self.pool.call('echo', 1, 'a'), [1, 'a'])
+        self.assertEqual(self.pool.call('echo', 2), [2])
+
+        worker = self._get_worker(self.pool)
+        self.assertEqual(worker.process.pid, pid)
+        self.assertEqual(worker.num_jobs, 2)
+
+    def test_raises_job_errors(self):
+        pid = self._get_worker(self.pool).process.pid
+        with self.assertRaises(Exception) as context:
+            self.pool.call('fail', 'patchmax failed')
+        self.assertEqual(str(context.exception), 'patchmax failed')
+        self.assertEqual(self._get_worker(self.pool).process.pid, pid)
+
+    def test_replaces_timed_out_worker(self):
+        worker = self._get_worker(self.pool)
+        with self.assertRaises(Exception) as context:
+            self.pool.call('sleep', 10)
+        self.assertEqual(
+            str(context.exception),
+            "forsys job, sleep, timed out after 1 seconds")
+        self.assertFalse(worker.process.is_alive())
+
+        new_worker = self._get_worker(self.pool)
+        self.assertNotEqual(new_worker.process.pid, worker.process.pid)
+        # The timed-out job isn't counted against the new worker.
+        self.assertEqual(new_worker.num_jobs, 0)
+        self.assertEqual(self.pool.call('echo', 1), [1])
+
+    def test_replaces_crashed_worker(self):
+        worker = self._get_worker(self.pool)
+        with self.assertRaises(Exception) as context:
+            self.pool.call('exit')
+        self.assertEqual(str(context.exception),
+                         "forsys worker exited while running exit")
+
+        new_worker = self._get_worker(self.pool)
+        self.assertNotEqual(new_worker.process.pid, worker.process.pid)
+        self.assertEqual(new_worker.num_jobs, 0)
+        self.assertEqual(self.pool.call('echo', 1), [1])
+
+    def test_recycles_worker_after_max_jobs(self):
+        pool = self._create_pool(max_jobs_per_worker=2)
+        try:
+            worker = self._get_worker(pool)
+            pool.call('echo', 1)
+            self.assertIs(self._get_worker(pool), worker)
+            pool.call('echo', 2)
+
+            new_worker = self._get_worker(pool)
+            self.assertNotEqual(new_worker.process.pid, worker.process.pid)
+            self.assertFalse(worker.process.is_alive())
+            self.assertEqual(new_worker.num_jobs, 0)
+        finally:
+            pool.close()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from conditions.models import ConditionRaster
+from django.core.cache import cache
+from django.db.models import Count, Max
+from forsys.forsys_request_params import ForsysRankingRequestParams
+from forsys.raster_condition_fetcher import get_conditions
+from planscape import settings
+
+_CACHE_KEY_PREFIX = 'forsys_ranking_'
+# Suffix for the key of the cross-process lock held while computing a result.
+_LOCK_KEY_SUFFIX = '_lock'
+# How long a process may hold the lock before others give up waiting and
+# compute the result themselves.
+_LOCK_TIMEOUT_IN_SECONDS = 10 * 60
+# How often waiting processes check for a result.
+_POLL_INTERVAL_IN_SECONDS = 0.2
+
+# Futures for results being computed by this process, keyed by cache key.
+_in_flight: dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+# Returns a version stamp for each raster in conditions.
+# Rasters have no explicit version, but re-ingesting a raster (via
+# raster2pgsql) replaces its tiles, which changes the tile count or the
+# largest tile ID.
+def _get_raster_versions(region: str,
+                         priorities: list[str]) -> list[list]:
+    raster_names = sorted([str(c.raster_name) for c in
+                           get_conditions(region, priorities)])
+    tiles = {t['name']: [t['num_tiles'], t['max_rid']] for t in
+             ConditionRaster.objects.filter(name__in=raster_names).values(
+                 'name').annotate(num_tiles=Count('rid'),
+                                  max_rid=Max('rid'))}
+    return [[name] + tiles.get(name, [0, None]) for name in raster_names]
+
+
+# Returns a cache key for a ranking request.
+# The key is a hash of every input the ranking depends on: the endpoint (since
+# single and multiple scenario responses differ), region, priorities and
+# weights, constraints, project area geometries, raster versions, and ranking
+# engine.
+def get_ranking_cache_key(endpoint: str,
+                          params: ForsysRankingRequestParams) -> str:
+    canonical = {
+        'endpoint': endpoint,
+        'region': params.region,
+        'priorities': params.priorities,
+        'priority_weights': [float(w) for w in params.priority_weights],
+        'max_area_in_km2': params.max_area_in_km2,
+        'max_cost_in_usd': params.max_cost_in_usd,
+        'project_areas': [
+            [int(id), params.project_areas[id].ewkb.hex()]
+            for id in sorted(params.project_areas.keys())],
+        'rasters': _get_raster_versions(params.region, params.priorities),
+        'ranking_engine': int(params.ranking_engine),
+    }
+    h = hashlib.sha256(json.dumps(canonical, sort_keys=True).encode())
+    return _CACHE_KEY_PREFIX + h.hexdigest()
+
+
+# Returns the result for key from the cache or, on a miss, from compute.
+#   - Results are cached for settings.FORSYS_RANKING_CACHE_TIMEOUT_SECONDS,
+#     unless they pickle to more than
+#     settings.FORSYS_RANKING_CACHE_MAX_ENTRY_BYTES.
+#   - Concurrent calls for the same key share a single call to compute:
+#     threads in this process wait on the first thread's result, and other
+#     processes wait (via a lock in the cache) for the result to be cached.
+#   - Exceptions raised by compute are propagated to every waiting caller and
+#     are not cached.
+def get_or_compute_ranking(key: str, compute: Callable[[], dict]) -> dict:
+    if settings.FORSYS_RANKING_CACHE_TIMEOUT_SECONDS <= 0:
+        return compute()
+
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _in_flight[key] = future
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = _compute_once_across_processes(key, compute)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+def _compute_once_across_processes(key: str,
+                                   compute: Callable[[], dict]) -> dict:
+    lock_key = key + _LOCK_KEY_SUFFIX
+    has_lock = cache.add(lock_key, True, _LOCK_TIMEOUT_IN_SECONDS)
+    if not has_lock:
+        deadline = time.monotonic() + _LOCK_TIMEOUT_IN_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL_IN_SECONDS)
+            result = cache.get(key)
+            if result is not None:
+                return result
+            # The other process failed or its result wasn't cacheable.
+            if cache.get(lock_key) is None:
+                break
+        has_lock = cache.add(lock_key, True, _LOCK_TIMEOUT_IN_SECONDS)
+
+    try:
+        result = compute()
+        if len(pickle.dumps(result)) <= \
+                settings.FORSYS_RANKING_CACHE_MAX_ENTRY_BYTES:
+            cache.set(key, result,
+                      settings.FORSYS_RANKING_CACHE_TIMEOUT_SECONDS)
+        return result
+    finally:
+        if has_lock:
+            cache.delete(lock_key)
@@ -0,0 +1,79 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from forsys.ranking_cache import get_or_compute_ranking
+from planscape import settings
+
+
+class GetOrComputeRankingTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.num_calls = 0
+
+    def _compute(self) -> dict:
+        self.num_calls = self.num_calls + 1
+        return {'forsys': {'output_scenario': {'ranked_projects': []}}}
+
+    def test_caches_result(self):
+        first = get_or_compute_ranking('key', self._compute)
+        second = get_or_compute_ranking('key', self._compute)
+        self.assertEqual(first, second)
+        self.assertEqual(self.num_calls, 1)
+
+    def test_distinguishes_keys(self):
+        get_or_compute_ranking('key1', self._compute)
+        get_or_compute_ranking('key2', self._compute)
+        self.assertEqual(self.num_calls, 2)
+
+    def test_skips_cache_if_disabled(self):
+        with mock.patch.object(
+                settings, 'FORSYS_RANKING_CACHE_TIMEOUT_SECONDS', 0):
+            get_or_compute_ranking('key', self._compute)
+            get_or_compute_ranking('key', self._compute)
+        self.assertEqual(self.num_calls, 2)
+
+    def test_skips_cache_for_large_results(self):
+        with mock.patch.object(
+                settings, 'FORSYS_RANKING_CACHE_MAX_ENTRY_BYTES', 10):
+            get_or_compute_ranking('key', self._compute)
+            get_or_compute_ranking('key', self._compute)
+        self.assertEqual(self.num_calls, 2)
+
+    def test_does_not_cache_exceptions(self):
+        def fail():
+            raise Exception("forsys failed")
+
+        with self.assertRaises(Exception) as context:
+            get_or_compute_ranking('key', fail)
+        self.assertEqual(str(context.exception), "forsys failed")
+        get_or_compute_ranking('key', self._compute)
+        self.assertEqual(self.num_calls, 1)
+
+    def test_shares_concurrent_computation(self):
+        started = threading.Event()
+
+        def slow_compute():
+            started.set()
+            time.sleep(0.2)
+            return self._compute()
+
+        results = []
+
+        def rank():
+            results.append(get_or_compute_ranking('key', slow_compute))
+
+        threads = [threading.Thread(target=rank) for _ in range(4)]
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self.num_calls, 1)
+        self.assertEqual(len(results), 4)
+        for r in results:
+            self.assertEqual(r, results[0])
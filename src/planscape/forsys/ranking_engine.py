@@ -0,0 +1,190 @@
+import itertools
+
+import numpy as np
+
+# A NumPy port of rank_projects_for_a_single_scenario.R and
+# rank_projects_for_multiple_scenarios.R.
+# Both R scripts call forsys::run without Patchmax, with proj_fixed_target set
+# to false and a target of 100% of project area; under those settings, every
+# stand is treated, and forsys::run only ...
+#   ... normalizes priorities (SPM or PCP, see below)
+#   ... combines normalized priorities into a weighted sum per stand
+#   ... sums stand-level values by project
+#   ... ranks projects by descending weighted sum
+# The functions below return output in the same format as the R functions
+# after conversion to python (see forsys.r_worker_pool), so that
+# forsys.parse_forsys_output parses both the same way.
+
+# Output formats from forsys::run.
+_TREATMENT_IMPACT_STRFORMAT = "ETrt_%s"
+_PRIORITY_WEIGHT_STRFORMAT = "Pr_%d_%s"
+_TREATMENT_RANK_HEADER = "treatment_rank"
+
+# The weights iterated over by rank_projects_for_multiple_scenarios.R
+# (scenario_weighting_values = "1 5 1": min, max, and step).
+_MIN_WEIGHT = 1
+_MAX_WEIGHT = 5
+_WEIGHT_STEP = 1
+
+
+# Scaled priority metric: values are scaled so that the maximum stand value is
+# 100 (forsys::calculate_spm).
+# Returns 0 for a priority whose maximum is 0; R would return NaN, which
+# makes forsys' ranking arbitrary.
+def _calculate_spm(values: np.ndarray) -> np.ndarray:
+    maxes = np.max(values, axis=0, initial=-np.inf)
+    return np.divide(values * 100, maxes, out=np.zeros_like(values),
+                     where=maxes != 0)
+
+
+# Percent of total: values are scaled so that stand values sum to 100
+# (forsys::calculate_pcp).
+# Returns 0 for a priority whose sum is 0 (see _calculate_spm).
+def _calculate_pcp(values: np.ndarray) -> np.ndarray:
+    sums = np.sum(values, axis=0)
+    return np.divide(values * 100, sums, out=np.zeros_like(values),
+                     where=sums != 0)
+
+
+# Returns the weight combinations iterated over by forsys::run given
+# scenario_weighting_values. As with R's expand.grid, the first priority's
+# weight varies fastest.
+def _get_weight_combinations(num_priorities: int) -> np.ndarray:
+    weights = np.arange(_MIN_WEIGHT, _MAX_WEIGHT + 1, _WEIGHT_STEP)
+    return np.array([w[::-1] for w in itertools.product(
+        weights, repeat=num_priorities)], dtype=float).reshape(
+            -1, num_priorities)
+
+
+# Reads stand-level columns from forsys input.
+# Returns sorted project IDs, each stand's index into project IDs, and a
+# (stands x fields) array of values.
+def _read_stands(
+        forsys_input: dict[str, list], proj_id_field: str,
+        fields: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    proj_ids, proj_indices = np.unique(
+        np.asarray(forsys_input[proj_id_field]), return_inverse=True)
+    values = np.column_stack(
+        [np.asarray(forsys_input[f], dtype=float) for f in fields]).reshape(
+            len(proj_indices), len(fields))
+    return proj_ids, proj_indices.reshape(-1), values
+
+
+# Computes weighted sums of normalized priorities for each stand, with one row
+# per weight combination. Sums are accumulated priority by priority, as in
+# forsys::combine_priorities.
+def _combine_priorities(normalized: np.ndarray,
+                        weights: np.ndarray) -> np.ndarray:
+    combined = np.zeros((weights.shape[0], normalized.shape[0]))
+    for i in range(normalized.shape[1]):
+        combined = combined + weights[:, i:i+1] * normalized[:, i]
+    return combined
+
+
+# Ranks projects for each weight combination, given stand-level combined
+# priorities (weight combinations x stands).
+# Returns a (weight combinations x projects) array of project indices in
+# order of rank.
+# Project scores are sorted in descending order with a stable sort. Since
+# projects are listed in order of ID, ties are broken by ascending project ID,
+# as in forsys::run (which sorts projects grouped by ID with dplyr::arrange).
+def _rank_projects(combined: np.ndarray, proj_indices: np.ndarray,
+                   num_projects: int) -> np.ndarray:
+    scores = np.zeros((combined.shape[0], num_projects))
+    np.add.at(scores, (slice(None), proj_indices), combined)
+    return np.argsort(-scores, axis=1, kind='stable')
+
+
+# Builds forsys::run output for the given rankings.
+# Project output has one row per (weight combination, project) pair, listed
+# by weight combination, then rank. If weights_header_priorities is set,
+# project output lists the weight of each priority (in Pr_<i>_<priority>
+# columns), as forsys::run does when iterating over weight combinations.
+# Stand output lists stand and project IDs. The subset output, a summary of
+# each scenario, is left empty since it isn't parsed.
+def _create_output(
+        forsys_input: dict[str, list], stand_id_field: str,
+        proj_id_field: str, output_fields: list[str], proj_ids: np.ndarray,
+        proj_indices: np.ndarray, outputs: np.ndarray, ranks: np.ndarray,
+        weights: np.ndarray,
+        weights_header_priorities: list[str] | None
+) -> list[dict[str, np.ndarray]]:
+    project_outputs = np.zeros((len(proj_ids), len(output_fields)))
+    np.add.at(project_outputs, proj_indices, outputs)
+
+    num_combinations, num_projects = ranks.shape
+    rows = ranks.reshape(-1)
+    project_output = {proj_id_field: proj_ids[rows]}
+    if weights_header_priorities is not None:
+        for i, p in enumerate(weights_header_priorities):
+            project_output[_PRIORITY_WEIGHT_STRFORMAT % (i + 1, p)] = \
+                np.repeat(weights[:, i], num_projects)
+    project_output[_TREATMENT_RANK_HEADER] = np.tile(
+        np.arange(1, num_projects + 1), num_combinations)
+    for i, f in enumerate(output_fields):
+        project_output[_TREATMENT_IMPACT_STRFORMAT % f] = \
+            project_outputs[rows, i]
+
+    stand_output = {
+        stand_id_field: np.asarray(forsys_input[stand_id_field]),
+        proj_id_field: np.asarray(forsys_input[proj_id_field]),
+    }
+    return [stand_output, project_output, {}]
+
+
+# Returns sorted project IDs and a (projects x priorities) array of project
+# scores, where each score is the sum of a priority's SPM across a project's
+# stands. Weighted sums of these scores rank projects as in
+# rank_projects_for_multiple_scenarios.
+def get_project_scores(
+        forsys_input: dict[str, list], priorities: list[str],
+        proj_id_field: str) -> tuple[np.ndarray, np.ndarray]:
+    proj_ids, proj_indices, values = _read_stands(
+        forsys_input, proj_id_field, priorities)
+    scores = np.zeros((len(proj_ids), len(priorities)))
+    np.add.at(scores, proj_indices, _calculate_spm(values))
+    return proj_ids, scores
+
+
+# Equivalent to rank_projects_for_a_single_scenario.R: ranks projects by the
+# weighted sum of each priority's PCP.
+def rank_projects_for_a_single_scenario(
+        forsys_input: dict[str, list], priorities: list[str],
+        priority_weights: list[float], stand_id_field: str,
+        proj_id_field: str, stand_area_field: str,
+        stand_cost_field: str) -> list[dict[str, np.ndarray]]:
+    if len(priorities) != len(priority_weights):
+        raise Exception("expected %d priority weights (got %d)" %
+                        (len(priorities), len(priority_weights)))
+    output_fields = priorities + [stand_area_field, stand_cost_field]
+    proj_ids, proj_indices, outputs = _read_stands(
+        forsys_input, proj_id_field, output_fields)
+    weights = np.array([priority_weights], dtype=float)
+
+    combined = _combine_priorities(
+        _calculate_pcp(outputs[:, :len(priorities)]), weights)
+    ranks = _rank_projects(combined, proj_indices, len(proj_ids))
+    return _create_output(
+        forsys_input, stand_id_field, proj_id_field, output_fields,
+        proj_ids, proj_indices, outputs, ranks, weights, None)
+
+
+# Equivalent to rank_projects_for_multiple_scenarios.R: for every combination
+# of integer weights from 1 to 5, ranks projects by the weighted sum of each
+# priority's SPM (forsys::run normalizes with SPM when given multiple
+# scenario_priorities).
+def rank_projects_for_multiple_scenarios(
+        forsys_input: dict[str, list], priorities: list[str],
+        stand_id_field: str, proj_id_field: str, stand_area_field: str,
+        stand_cost_field: str) -> list[dict[str, np.ndarray]]:
+    output_fields = priorities + [stand_area_field, stand_cost_field]
+    proj_ids, proj_indices, outputs = _read_stands(
+        forsys_input, proj_id_field, output_fields)
+    weights = _get_weight_combinations(len(priorities))
+
+    combined = _combine_priorities(
+        _calculate_spm(outputs[:, :len(priorities)]), weights)
+    ranks = _rank_projects(combined, proj_indices, len(proj_ids))
+    return _create_output(
+        forsys_input, stand_id_field, proj_id_field, output_fields,
+        proj_ids, proj_indices, outputs, ranks, weights, priorities)
@@ -0,0 +1,105 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from forsys import ranking_engine
+from forsys.r_worker_pool import _convert_from_r, _convert_to_r
+
+# Compares forsys.ranking_engine with the R ranking scripts on random
+# inputs. Requires R with the forsys package.
+# For each input size and ranking function, reports ...
+#   ... runtime in seconds for each engine
+#   ... the number of project output rows where project IDs or ranks differ
+#       (should be 0)
+#   ... the largest absolute difference in ETrt_* values (should be ~0)
+#
+# Usage (from src/planscape):
+#   python -m forsys.ranking_engine_equivalence --num_projects 10 100 1000
+
+_PRIORITIES = ['p_fire_dynamics', 'p_forest_resilience',
+               'p_species_diversity']
+_HEADERS = ['stand_id', 'proj_id', 'area', 'cost']
+
+
+def _generate_forsys_input(num_projects: int, stands_per_project: int,
+                           rng: np.random.Generator) -> dict[str, list]:
+    num_stands = num_projects * stands_per_project
+    forsys_input = {
+        'stand_id': list(range(1, num_stands + 1)),
+        'proj_id': rng.permutation(np.repeat(
+            np.arange(1, num_projects + 1), stands_per_project)).tolist(),
+        'area': rng.uniform(1, 100, num_stands).tolist(),
+        'cost': rng.uniform(1000, 10000, num_stands).tolist(),
+    }
+    for p in _PRIORITIES:
+        # Rounded values make ties likely, which exercises tie-breaking.
+        forsys_input[p] = np.round(rng.uniform(0, 1, num_stands), 2).tolist()
+    return forsys_input
+
+
+def _compare(r_output: list[dict], python_output: list[dict]) -> tuple[int,
+                                                                       float]:
+    r_project_output = r_output[1]
+    python_project_output = python_output[1]
+    mismatches = np.sum(
+        (np.asarray(r_project_output['proj_id']) !=
+         python_project_output['proj_id']) |
+        (np.asarray(r_project_output['treatment_rank']) !=
+         python_project_output['treatment_rank']))
+    max_difference = max(
+        float(np.max(np.abs(np.asarray(r_project_output[h]) -
+                            python_project_output[h]), initial=0))
+        for h in python_project_output.keys() if h.startswith('ETrt_'))
+    return int(mismatches), max_difference
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compares python and R project ranking.')
+    parser.add_argument('--num_projects', nargs='+', type=int,
+                        default=[10, 100])
+    parser.add_argument('--stands_per_project', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    import rpy2.robjects as robjects
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for script in ['forsys/rank_projects_for_a_single_scenario.R',
+                   'forsys/rank_projects_for_multiple_scenarios.R']:
+        robjects.r.source(os.path.join(base_dir, script))
+
+    weights = [float(i + 1) for i in range(len(_PRIORITIES))]
+    print('%-40s %8s %10s %10s %11s %12s' % (
+        'function', 'projects', 'r_seconds', 'py_seconds', 'mismatches',
+        'max_diff'))
+    for num_projects in args.num_projects:
+        rng = np.random.default_rng(args.seed)
+        forsys_input = _generate_forsys_input(
+            num_projects, args.stands_per_project, rng)
+        calls = {
+            'rank_projects_for_a_single_scenario': [
+                forsys_input, _PRIORITIES, weights] + _HEADERS,
+            'rank_projects_for_multiple_scenarios': [
+                forsys_input, _PRIORITIES] + _HEADERS,
+        }
+        for function_name, function_args in calls.items():
+            start = time.perf_counter()
+            r_output = _convert_from_r(robjects.globalenv[function_name](
+                *[_convert_to_r(a) for a in function_args]))
+            r_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            python_output = getattr(ranking_engine, function_name)(
+                *function_args)
+            python_seconds = time.perf_counter() - start
+
+            mismatches, max_difference = _compare(r_output, python_output)
+            print('%-40s %8d %10.3f %10.4f %11d %12.3g' % (
+                function_name, num_projects, r_seconds, python_seconds,
+                mismatches, max_difference))
+
+
+if __name__ == '__main__':
+    main()
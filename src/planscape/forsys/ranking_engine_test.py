@@ -0,0 +1,142 @@
+import numpy as np
+
+from django.test import TestCase
+from forsys.parse_forsys_output import (
+    ForsysRankingOutputForASingleScenario,
+    ForsysRankingOutputForMultipleScenarios)
+from forsys.ranking_engine import (rank_projects_for_a_single_scenario,
+                                   rank_projects_for_multiple_scenarios)
+
+
+# Forsys input for the project output fixtures in parse_forsys_output_test,
+# which were produced by the R ranking scripts.
+def _get_forsys_input() -> dict[str, list]:
+    return {
+        "stand_id": [1, 2, 3],
+        "proj_id": [1, 2, 3],
+        "p1": [0.5, 0.1, 0.3],
+        "p2": [0.1, 0.4, 0.1],
+        "area": [10, 11, 12],
+        "cost": [500, 600, 800],
+    }
+
+
+class RankProjectsForASingleScenarioTest(TestCase):
+    def test_matches_r_output(self) -> None:
+        output = rank_projects_for_a_single_scenario(
+            _get_forsys_input(), ["p1", "p2"], [1, 2], "stand_id", "proj_id",
+            "area", "cost")
+        project_output = output[1]
+        self.assertListEqual(project_output["proj_id"].tolist(), [2, 1, 3])
+        self.assertListEqual(
+            project_output["treatment_rank"].tolist(), [1, 2, 3])
+        self.assertListEqual(
+            project_output["ETrt_p1"].tolist(), [0.1, 0.5, 0.3])
+        self.assertListEqual(
+            project_output["ETrt_p2"].tolist(), [0.4, 0.1, 0.1])
+        self.assertListEqual(
+            project_output["ETrt_area"].tolist(), [11, 10, 12])
+        self.assertListEqual(
+            project_output["ETrt_cost"].tolist(), [600, 500, 800])
+
+    def test_normalizes_by_percent_of_total(self) -> None:
+        # Weighted by raw values, project 1 would rank first (0.5 + 0.1 vs.
+        # 0.1 + 0.4), but p2 has a smaller total, so its values count for
+        # more.
+        output = rank_projects_for_a_single_scenario(
+            _get_forsys_input(), ["p1", "p2"], [1, 1], "stand_id", "proj_id",
+            "area", "cost")
+        self.assertListEqual(output[1]["proj_id"].tolist(), [2, 1, 3])
+
+    def test_sums_stands_by_project(self) -> None:
+        forsys_input = {
+            "stand_id": [1, 2, 3, 4],
+            "proj_id": [7, 5, 7, 5],
+            "p1": [0.2, 0.3, 0.2, 0.3],
+            "area": [1, 2, 3, 4],
+            "cost": [10, 20, 30, 40],
+        }
+        output = rank_projects_for_a_single_scenario(
+            forsys_input, ["p1"], [1], "stand_id", "proj_id", "area", "cost")
+        project_output = output[1]
+        self.assertListEqual(project_output["proj_id"].tolist(), [5, 7])
+        self.assertListEqual(project_output["ETrt_area"].tolist(), [6, 4])
+        self.assertListEqual(project_output["ETrt_cost"].tolist(), [60, 40])
+
+    def test_breaks_ties_by_project_id(self) -> None:
+        forsys_input = {
+            "stand_id": [1, 2, 3],
+            "proj_id": [3, 1, 2],
+            "p1": [0.5, 0.5, 0.5],
+            "area": [1, 1, 1],
+            "cost": [1, 1, 1],
+        }
+        output = rank_projects_for_a_single_scenario(
+            forsys_input, ["p1"], [1], "stand_id", "proj_id", "area", "cost")
+        self.assertListEqual(output[1]["proj_id"].tolist(), [1, 2, 3])
+
+    def test_handles_all_zero_priorities(self) -> None:
+        forsys_input = _get_forsys_input()
+        forsys_input["p2"] = [0, 0, 0]
+        output = rank_projects_for_a_single_scenario(
+            forsys_input, ["p1", "p2"], [1, 1], "stand_id", "proj_id",
+            "area", "cost")
+        self.assertListEqual(output[1]["proj_id"].tolist(), [1, 3, 2])
+
+    def test_fails_given_wrong_number_of_weights(self) -> None:
+        with self.assertRaises(Exception) as context:
+            rank_projects_for_a_single_scenario(
+                _get_forsys_input(), ["p1", "p2"], [1], "stand_id",
+                "proj_id", "area", "cost")
+        self.assertEqual(str(context.exception),
+                         "expected 2 priority weights (got 1)")
+
+    def test_output_is_parseable(self) -> None:
+        output = rank_projects_for_a_single_scenario(
+            _get_forsys_input(), ["p1", "p2"], [1, 2], "stand_id", "proj_id",
+            "area", "cost")
+        scenario = ForsysRankingOutputForASingleScenario(
+            output, {"p1": 1, "p2": 2}, None, None, "proj_id", "area",
+            "cost").scenario
+        self.assertListEqual([p['id'] for p in scenario['ranked_projects']],
+                             [2, 1, 3])
+        self.assertListEqual(scenario['cumulative_ranked_project_area'],
+                             [11, 21, 33])
+
+
+class RankProjectsForMultipleScenariosTest(TestCase):
+    def test_matches_r_output(self) -> None:
+        output = rank_projects_for_multiple_scenarios(
+            _get_forsys_input(), ["p1", "p2"], "stand_id", "proj_id", "area",
+            "cost")
+        project_output = output[1]
+        # 5 weights for each of 2 priorities.
+        self.assertEqual(len(project_output["proj_id"]), 25 * 3)
+        # The first two weight combinations are (1, 1) and (2, 1).
+        self.assertListEqual(
+            project_output["Pr_1_p1"][:6].tolist(), [1, 1, 1, 2, 2, 2])
+        self.assertListEqual(
+            project_output["Pr_2_p2"][:6].tolist(), [1, 1, 1, 1, 1, 1])
+        self.assertListEqual(
+            project_output["treatment_rank"][:6].tolist(), [1, 2, 3, 1, 2, 3])
+
+        # Weights (1, 1) and (1, 2), as in the R output fixture.
+        rows = np.flatnonzero(project_output["Pr_1_p1"] == 1)
+        self.assertListEqual(project_output["proj_id"][rows[:6]].tolist(),
+                             [1, 2, 3, 2, 1, 3])
+        self.assertListEqual(project_output["ETrt_p1"][rows[:6]].tolist(),
+                             [0.5, 0.1, 0.3, 0.1, 0.5, 0.3])
+        self.assertListEqual(project_output["ETrt_area"][rows[:6]].tolist(),
+                             [10, 11, 12, 11, 10, 12])
+
+    def test_output_is_parseable(self) -> None:
+        output = rank_projects_for_multiple_scenarios(
+            _get_forsys_input(), ["p1", "p2"], "stand_id", "proj_id", "area",
+            "cost")
+        scenarios = ForsysRankingOutputForMultipleScenarios(
+            output, ["p1", "p2"], None, None, "proj_id", "area",
+            "cost").scenarios
+        self.assertEqual(len(scenarios), 25)
+        self.assertListEqual(
+            [p['id'] for p in scenarios['p1:1 p2:2']['ranked_projects']],
+            [2, 1, 3])
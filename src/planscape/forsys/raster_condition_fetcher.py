@@ -1,5 +1,6 @@
 import numpy as np
 
+from conditions.catalog import ConditionCatalog, get_condition_catalog
 from conditions.models import Condition
 from conditions.raster_utils import (ConditionPixelValues, RasterPixelValues,
                                      get_condition_values_from_raster,
@@ -10,18 +11,18 @@ from django.contrib.gis.geos import GEOSGeometry
 from planscape import settings
 
 
-# Given a region and a list of priorities, fetches the relevant condition
-# objects from DB.
+# Given a region and a list of priorities, looks up the relevant condition
+# objects in the condition catalog (see conditions.catalog).
 # Output conditions may not be listed in the same order as priorities.
 # Raises an error if any of the input priorities don't have a corresponding
 # condition.
 # Assumes each priority has a unique name linked to a single condition.
 def get_conditions(region: str, priorities: list[str]) -> list[Condition]:
-    conditions = list(
-        Condition.objects.filter(is_raw=False).select_related(
-            'condition_dataset').filter(
-            condition_dataset__condition_name__in=priorities,
-            condition_dataset__region_name=region))
+    conditions = _find_conditions(get_condition_catalog(), region, priorities)
+    if len(priorities) != len(conditions):
+        # The catalog may predate a concurrent load.
+        conditions = _find_conditions(
+            get_condition_catalog(refresh=True), region, priorities)
     if len(priorities) != len(conditions):
         raise Exception(
             "of %d priorities, only %d had conditions" %
@@ -29,6 +30,12 @@ def get_conditions(region: str, priorities: list[str]) -> list[Condition]:
     return conditions
 
 
+def _find_conditions(catalog: ConditionCatalog, region: str,
+                     priorities: list[str]) -> list[Condition]:
+    return [c for p in set(priorities)
+            for c in catalog.find_conditions(p, region)]
+
+
 # Given a list of land attributes, fetches the relevant attribute objects from
 # DB.
 # Output attributeess may not be listed in the same order as land_attributes.
@@ -80,16 +87,21 @@ class RasterConditionFetcher:
     # Maps x-pixel to y-pixel to a row index in the self.data dataframe.
     x_to_y_to_index: dict[int, dict[int, int]]
 
+    # If is_valid is given (e.g. stored along with a raster-CRS geo), geo's
+    # validity isn't recomputed; otherwise, it's computed once rather than
+    # per raster.
     def __init__(
             self, region: str, priorities: list[str],
             land_attributes: list[str],
-            geo: GEOSGeometry):
+            geo: GEOSGeometry, is_valid: bool | None = None):
         raster_geo = get_raster_geo(geo)
+        if is_valid is None:
+            is_valid = raster_geo.valid
 
         conditions = get_conditions(region, priorities)
         attributes = get_attributes(land_attributes)
-        self.raster_values = \
-            self._fetch_raster_values(conditions, attributes, raster_geo)
+        self.raster_values = self._fetch_raster_values(
+            conditions, attributes, raster_geo, is_valid)
 
         self.topleft_coords = self._get_topleft_coords(
             self.raster_values)
@@ -104,22 +116,24 @@ class RasterConditionFetcher:
         # should be added to self.data.
 
     def _fetch_raster_values(self,
-                             conditions, attributes, raster_geo) -> dict[str, RasterPixelValues]:
+                             conditions, attributes, raster_geo,
+                             is_valid: bool) -> dict[str, RasterPixelValues]:
         raster_values = {}
         self._fetch_condition_raster_values(
-            conditions, raster_geo, raster_values)
+            conditions, raster_geo, is_valid, raster_values)
         self._fetch_attribute_raster_values(
-            attributes, raster_geo, raster_values)
+            attributes, raster_geo, is_valid, raster_values)
         return raster_values
 
     # Fetches condition raster values for a given GEOSGeometry and emits it in
     # a {condition name: ConditionPixelValues} dictionary.
     def _fetch_condition_raster_values(
-            self, conditions: list[Condition],
-            geo: GEOSGeometry, raster_values: dict[str, RasterPixelValues]):
+            self, conditions: list[Condition], geo: GEOSGeometry,
+            is_valid: bool, raster_values: dict[str, RasterPixelValues]):
         for c in conditions:
             name = c.condition_dataset.condition_name
-            values = get_condition_values_from_raster(geo, c.raster_name)
+            values = get_condition_values_from_raster(
+                geo, c.raster_name, is_valid)
             if values is None:
                 raise Exception(
                     "plan has no intersection with condition raster, %s" %
@@ -129,11 +143,12 @@ class RasterConditionFetcher:
     # Fetches attribute raster values for a given GEOSGeometry and emits it in
     # a {attribute name: AttributePixelValues} dictionary.
     def _fetch_attribute_raster_values(
-            self, attributes: list[Attribute],
-            geo: GEOSGeometry, raster_values: dict[str, RasterPixelValues]):
+            self, attributes: list[Attribute], geo: GEOSGeometry,
+            is_valid: bool, raster_values: dict[str, RasterPixelValues]):
         for a in attributes:
             name = a.attribute_name
-            values = get_attribute_values_from_raster(geo, a.raster_name)
+            values = get_attribute_values_from_raster(
+                geo, a.raster_name, is_valid)
             if values is None:
                 raise Exception(
                     "plan has no intersection with attribute raster, %s" %
@@ -0,0 +1,206 @@
+import itertools
+
+import numpy as np
+from django.http import QueryDict
+
+
+# Request parameters for a weight sweep.
+# By default, weights sweep the same grid as
+# rank_projects_for_multiple_scenarios.R (integers 1 through 5 for each
+# priority).
+class WeightSweepParams():
+    # Constants for parsing url parameters.
+    # Grid bounds and step size; each priority's weight takes every value in
+    # [weight_min, weight_max] in increments of weight_step.
+    _URL_WEIGHT_MIN = 'weight_min'
+    _URL_WEIGHT_MAX = 'weight_max'
+    _URL_WEIGHT_STEP = 'weight_step'
+    # If > 0, weight vectors are sampled uniformly from the simplex (weights
+    # sum to 1) instead of taken from a grid. This covers the weight space
+    # more evenly than a grid when there are many priorities.
+    _URL_NUM_WEIGHT_SAMPLES = 'num_weight_samples'
+    # Seed for sampling weight vectors.
+    _URL_SEED = 'seed'
+    # Rank statistics include how often each project ranks within the top_k.
+    _URL_TOP_K = 'top_k'
+
+    # Constants that act as default values when parsing url parameters.
+    _DEFAULT_WEIGHT_MIN = 1
+    _DEFAULT_WEIGHT_MAX = 5
+    _DEFAULT_WEIGHT_STEP = 1
+    _DEFAULT_NUM_WEIGHT_SAMPLES = 0
+    _DEFAULT_SEED = 0
+    _DEFAULT_TOP_K = 3
+
+    # Bounds the work done per request.
+    _MAX_NUM_WEIGHT_VECTORS = 1000000
+
+    weight_min: float
+    weight_max: float
+    weight_step: float
+    num_weight_samples: int
+    seed: int
+    top_k: int
+
+    def __init__(self, params: QueryDict) -> None:
+        self._read_url_params_with_defaults(params)
+
+    def _read_url_params_with_defaults(self, params: QueryDict) -> None:
+        self.weight_min = float(params.get(
+            self._URL_WEIGHT_MIN, self._DEFAULT_WEIGHT_MIN))
+        self.weight_max = float(params.get(
+            self._URL_WEIGHT_MAX, self._DEFAULT_WEIGHT_MAX))
+        self.weight_step = float(params.get(
+            self._URL_WEIGHT_STEP, self._DEFAULT_WEIGHT_STEP))
+        self.num_weight_samples = int(params.get(
+            self._URL_NUM_WEIGHT_SAMPLES, self._DEFAULT_NUM_WEIGHT_SAMPLES))
+        self.seed = int(params.get(self._URL_SEED, self._DEFAULT_SEED))
+        self.top_k = int(params.get(self._URL_TOP_K, self._DEFAULT_TOP_K))
+
+        if self.weight_min < 0 or self.weight_max < self.weight_min:
+            raise Exception(
+                "expected 0 <= weight_min <= weight_max")
+        if self.weight_step <= 0:
+            raise Exception("expected weight_step to be > 0")
+        if self.num_weight_samples < 0 or \
+                self.num_weight_samples > self._MAX_NUM_WEIGHT_VECTORS:
+            raise Exception("expected num_weight_samples to be in [0, %d]" %
+                            self._MAX_NUM_WEIGHT_VECTORS)
+        if self.top_k <= 0:
+            raise Exception("expected top_k to be > 0")
+
+    # Returns a (weight vectors x priorities) array of weights to sweep.
+    def get_weight_vectors(self, num_priorities: int) -> np.ndarray:
+        if self.num_weight_samples > 0:
+            rng = np.random.default_rng(self.seed)
+            return rng.dirichlet(np.ones(num_priorities),
+                                 self.num_weight_samples)
+
+        # A small epsilon keeps weight_max in the grid despite rounding.
+        values = np.arange(self.weight_min,
+                           self.weight_max + self.weight_step * 1e-9,
+                           self.weight_step)
+        if len(values) ** num_priorities > self._MAX_NUM_WEIGHT_VECTORS:
+            raise Exception(
+                "weight grid has %d weight vectors (limit: %d)" %
+                (len(values) ** num_priorities,
+                 self._MAX_NUM_WEIGHT_VECTORS))
+        # As in rank_projects_for_multiple_scenarios.R, the first priority's
+        # weight varies fastest.
+        return np.array([w[::-1] for w in itertools.product(
+            values, repeat=num_priorities)]).reshape(-1, num_priorities)
+
+
+# Ranks projects given (weight vectors x projects) scores.
+# Returns a same-shape array of 1-based ranks. As in forsys.ranking_engine,
+# ties are broken by project order.
+def _get_ranks(scores: np.ndarray) -> np.ndarray:
+    order = np.argsort(-scores, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(
+        ranks, order,
+        np.broadcast_to(np.arange(1, scores.shape[1] + 1), order.shape),
+        axis=1)
+    return ranks
+
+
+# Returns a boolean mask of projects on the Pareto frontier: projects for
+# which no other project scores at least as high on every priority and higher
+# on at least one.
+def get_pareto_frontier(scores: np.ndarray) -> np.ndarray:
+    on_frontier = np.full(scores.shape[0], True)
+    for i in range(scores.shape[0]):
+        dominated_by = np.all(scores >= scores[i], axis=1) & \
+            np.any(scores > scores[i], axis=1)
+        on_frontier[i] = not np.any(dominated_by)
+    return on_frontier
+
+
+# Computes Spearman's rank correlation between each row of ranks and
+# baseline_ranks.
+def _get_rank_correlations(ranks: np.ndarray,
+                           baseline_ranks: np.ndarray) -> np.ndarray:
+    n = ranks.shape[1]
+    if n < 2:
+        return np.ones(ranks.shape[0])
+    d = (ranks - baseline_ranks).astype(float)
+    return 1 - 6 * np.sum(d * d, axis=1) / (n * (n * n - 1))
+
+
+# Ranks projects under every weight vector and summarizes how stable their
+# ranks are.
+# scores is a (projects x priorities) array (see
+# forsys.ranking_engine.get_project_scores); weights is a
+# (weight vectors x priorities) array; baseline_weights are the weights ranks
+# are compared against.
+# Weight vectors are processed in batches of batch_size: each batch is a single
+# matrix multiply and argsort, and only running statistics are kept, so
+# memory use doesn't grow with the number of weight vectors.
+def analyze_weight_sensitivity(
+        priorities: list[str], proj_ids: np.ndarray, scores: np.ndarray,
+        weights: np.ndarray, baseline_weights: list[float], top_k: int,
+        batch_size: int = 4096) -> dict:
+    num_projects = len(proj_ids)
+    baseline_ranks = _get_ranks(
+        np.array([baseline_weights], dtype=float) @ scores.T)
+
+    rank_sums = np.zeros(num_projects)
+    rank_squared_sums = np.zeros(num_projects)
+    best_ranks = np.full(num_projects, num_projects)
+    worst_ranks = np.ones(num_projects, dtype=int)
+    top_1_counts = np.zeros(num_projects, dtype=int)
+    top_k_counts = np.zeros(num_projects, dtype=int)
+    correlation_sum = 0.0
+    min_correlation = 1.0
+    # Hashes of each distinct ranking.
+    distinct_rankings = set()
+
+    for start in range(0, len(weights), batch_size):
+        ranks = _get_ranks(weights[start:start + batch_size] @ scores.T)
+        rank_sums = rank_sums + np.sum(ranks, axis=0)
+        rank_squared_sums = rank_squared_sums + \
+            np.sum(ranks.astype(float) ** 2, axis=0)
+        best_ranks = np.minimum(best_ranks, np.min(ranks, axis=0))
+        worst_ranks = np.maximum(worst_ranks, np.max(ranks, axis=0))
+        top_1_counts = top_1_counts + np.sum(ranks == 1, axis=0)
+        top_k_counts = top_k_counts + np.sum(ranks <= top_k, axis=0)
+        correlations = _get_rank_correlations(ranks, baseline_ranks)
+        correlation_sum = correlation_sum + float(np.sum(correlations))
+        min_correlation = min(min_correlation, float(np.min(correlations)))
+        distinct_rankings.update(
+            hash(r.tobytes())
+            for r in np.ascontiguousarray(ranks, dtype=np.int32))
+
+    num_weight_vectors = len(weights)
+    mean_ranks = rank_sums / num_weight_vectors
+    rank_stds = np.sqrt(np.maximum(
+        rank_squared_sums / num_weight_vectors - mean_ranks ** 2, 0))
+    on_frontier = get_pareto_frontier(scores)
+
+    projects = []
+    for i, id in enumerate(proj_ids.astype(int).tolist()):
+        projects.append({
+            'id': id,
+            'scores': dict(zip(priorities, scores[i].tolist())),
+            'baseline_rank': int(baseline_ranks[0, i]),
+            'mean_rank': float(mean_ranks[i]),
+            'rank_std': float(rank_stds[i]),
+            'best_rank': int(best_ranks[i]),
+            'worst_rank': int(worst_ranks[i]),
+            'top_1_fraction': float(top_1_counts[i] / num_weight_vectors),
+            'top_k_fraction': float(top_k_counts[i] / num_weight_vectors),
+            'on_pareto_frontier': bool(on_frontier[i]),
+        })
+    projects.sort(key=lambda p: p['baseline_rank'])
+
+    return {
+        'priorities': priorities,
+        'baseline_weights': dict(zip(priorities, baseline_weights)),
+        'num_weight_vectors': num_weight_vectors,
+        'top_k': top_k,
+        'num_distinct_rankings': len(distinct_rankings),
+        'mean_rank_correlation': correlation_sum / num_weight_vectors,
+        'min_rank_correlation': min_correlation,
+        'pareto_frontier': proj_ids[on_frontier].astype(int).tolist(),
+        'projects': projects,
+    }
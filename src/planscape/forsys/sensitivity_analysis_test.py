@@ -0,0 +1,89 @@
+import numpy as np
+
+from django.http import QueryDict
+from django.test import TestCase
+from forsys.sensitivity_analysis import (WeightSweepParams,
+                                         analyze_weight_sensitivity,
+                                         get_pareto_frontier)
+
+
+class WeightSweepParamsTest(TestCase):
+    def test_reads_default_grid(self):
+        params = WeightSweepParams(QueryDict(''))
+        weights = params.get_weight_vectors(2)
+        self.assertEqual(weights.shape, (25, 2))
+        # The first priority's weight varies fastest.
+        self.assertListEqual(weights[:2].tolist(), [[1, 1], [2, 1]])
+        self.assertListEqual(weights[-1].tolist(), [5, 5])
+
+    def test_reads_grid_from_url_params(self):
+        params = WeightSweepParams(QueryDict(
+            'weight_min=0&weight_max=1&weight_step=0.25'))
+        self.assertEqual(params.get_weight_vectors(3).shape, (125, 3))
+
+    def test_samples_weights(self):
+        params = WeightSweepParams(QueryDict('num_weight_samples=100'))
+        weights = params.get_weight_vectors(3)
+        self.assertEqual(weights.shape, (100, 3))
+        np.testing.assert_allclose(np.sum(weights, axis=1), 1)
+        np.testing.assert_array_equal(weights, params.get_weight_vectors(3))
+
+    def test_fails_given_too_many_weight_vectors(self):
+        params = WeightSweepParams(QueryDict('weight_max=100'))
+        with self.assertRaises(Exception) as context:
+            params.get_weight_vectors(4)
+        self.assertEqual(
+            str(context.exception),
+            "weight grid has 100000000 weight vectors (limit: 1000000)")
+
+    def test_fails_given_bad_step(self):
+        with self.assertRaises(Exception):
+            WeightSweepParams(QueryDict('weight_step=0'))
+
+
+class AnalyzeWeightSensitivityTest(TestCase):
+    def setUp(self) -> None:
+        self.proj_ids = np.array([1, 2, 3, 4])
+        # Project 1 is best for p1, project 2 is best for p2, project 3 is a
+        # compromise, and project 4 is dominated by project 3.
+        self.scores = np.array(
+            [[10, 0], [0, 10], [6, 6], [5, 5]], dtype=float)
+
+    def test_finds_pareto_frontier(self):
+        self.assertListEqual(
+            get_pareto_frontier(self.scores).tolist(),
+            [True, True, True, False])
+
+    def test_computes_rank_statistics(self):
+        weights = np.array([[1, 0], [0, 1], [1, 1]], dtype=float)
+        result = analyze_weight_sensitivity(
+            ['p1', 'p2'], self.proj_ids, self.scores, weights, [1, 1],
+            top_k=2, batch_size=2)
+
+        self.assertEqual(result['num_weight_vectors'], 3)
+        self.assertEqual(result['num_distinct_rankings'], 3)
+        self.assertListEqual(result['pareto_frontier'], [1, 2, 3])
+
+        projects = {p['id']: p for p in result['projects']}
+        # Under weights [1, 1], project 3 ranks first, then project 1 (which
+        # ties with project 2 but has a lower ID).
+        self.assertListEqual([p['id'] for p in result['projects']],
+                             [3, 1, 2, 4])
+        self.assertEqual(projects[1]['best_rank'], 1)
+        self.assertEqual(projects[1]['worst_rank'], 4)
+        self.assertAlmostEqual(projects[1]['top_1_fraction'], 1 / 3)
+        self.assertAlmostEqual(projects[3]['mean_rank'], 5 / 3)
+        self.assertAlmostEqual(projects[3]['top_k_fraction'], 1)
+        self.assertEqual(projects[4]['best_rank'], 3)
+        self.assertFalse(projects[4]['on_pareto_frontier'])
+        self.assertAlmostEqual(result['mean_rank_correlation'],
+                               (0.6 + 0 + 1) / 3)
+
+    def test_is_stable_given_a_single_priority(self):
+        result = analyze_weight_sensitivity(
+            ['p1'], self.proj_ids, self.scores[:, :1],
+            np.array([[1], [2], [3]], dtype=float), [1], top_k=1)
+        self.assertEqual(result['num_distinct_rankings'], 1)
+        self.assertEqual(result['min_rank_correlation'], 1)
+        for p in result['projects']:
+            self.assertEqual(p['rank_std'], 0)
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+# Measurements for one stage of a request (e.g. raster fetch or Patchmax).
+class StageTiming():
+    # Stage name. Names are used as Server-Timing metric names, so they
+    # shouldn't contain spaces.
+    name: str
+    # Elapsed wall-clock time.
+    wall_seconds: float
+    # CPU time consumed by the process during the stage. This may exceed
+    # wall_seconds if other threads were busy.
+    cpu_seconds: float
+    # Number of rows (e.g. stands or projects) processed, if set by the
+    # stage.
+    rows: int | None
+    # How far the process's resident memory peaked above its level at the
+    # start of the stage (see _MemoryBaseline).
+    memory_growth_bytes: int
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_seconds = 0
+        self.cpu_seconds = 0
+        self.rows = None
+        self.memory_growth_bytes = 0
+
+    def to_dict(self) -> dict:
+        return {'name': self.name,
+                'wall_seconds': self.wall_seconds,
+                'cpu_seconds': self.cpu_seconds,
+                'rows': self.rows,
+                'memory_growth_bytes': self.memory_growth_bytes}
+
+
+# Aggregated measurements across all requests seen by this process, keyed by
+# "<request name>.<stage name>".
+_metrics: dict[str, dict[str, float]] = {}
+_metrics_lock = threading.Lock()
+
+# The StageTimer of the request being handled in the current context.
+_current_timer: ContextVar["StageTimer | None"] = ContextVar(
+    'forsys_stage_timer', default=None)
+
+
+def _get_peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Returns the process's current resident memory, or its peak resident memory
+# where the current value isn't available (i.e. outside of Linux).
+def _get_rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return _get_peak_rss_bytes()
+
+
+# Resident memory at the start of a stage, used to measure the stage's own
+# memory growth. ru_maxrss is the peak over the life of the process, so in a
+# long-lived web worker it stops changing after the first large request.
+# Instead, growth is measured against the resident memory at the start of
+# the stage:
+#   - if the stage set a new process peak, the growth is that peak minus the
+#     baseline, which is exact
+#   - otherwise, the stage's peak is unknown, and the growth is the resident
+#     memory at the end of the stage minus the baseline (a lower bound)
+# Memory allocated by other threads during the stage is included.
+class _MemoryBaseline():
+    def __init__(self):
+        self._rss = _get_rss_bytes()
+        self._peak_rss = _get_peak_rss_bytes()
+
+    def get_growth_bytes(self) -> int:
+        peak_rss = _get_peak_rss_bytes()
+        if peak_rss > self._peak_rss:
+            return max(peak_rss - self._rss, 0)
+        return max(_get_rss_bytes() - self._rss, 0)
+
+
+# Records per-stage timings for a request.
+# Within a "with timer:" block, stage(...) blocks anywhere in the call stack
+# are recorded by the timer. On exiting the block, timings are logged and
+# added to process-wide metrics.
+#
+# Overhead is a few clock, getrusage and /proc reads per stage, so timers are
+# always on (unlike the cProfile and memory_profiler hooks enabled in DEBUG mode).
+class StageTimer():
+    # Request name, e.g. "generate_project_areas".
+    name: str
+    # Timings of completed stages, in order of completion.
+    stages: list[StageTiming]
+    # Total request timing.
+    total: StageTiming
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages = []
+        self.total = StageTiming('total')
+        self._token = None
+        self._start_wall = 0
+        self._start_cpu = 0
+        self._start_memory = None
+
+    def __enter__(self) -> "StageTimer":
+        self._token = _current_timer.set(self)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._start_memory = _MemoryBaseline()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.total.wall_seconds = time.perf_counter() - self._start_wall
+        self.total.cpu_seconds = time.process_time() - self._start_cpu
+        self.total.memory_growth_bytes = \
+            self._start_memory.get_growth_bytes()
+        _current_timer.reset(self._token)
+        self._log(succeeded=exc_type is None)
+        self._record_metrics()
+
+    # Returns the value of a Server-Timing header listing stage durations in
+    # milliseconds.
+    def get_server_timing_header(self) -> str:
+        return ', '.join(
+            ['%s;dur=%.1f' % (s.name, s.wall_seconds * 1000)
+             for s in self.stages + [self.total]])
+
+    # Adds a Server-Timing header to response and returns response.
+    def add_server_timing_header(
+            self, response: HttpResponse) -> HttpResponse:
+        response['Server-Timing'] = self.get_server_timing_header()
+        return response
+
+    def _log(self, succeeded: bool) -> None:
+        logger.info(json.dumps({
+            'request': self.name,
+            'succeeded': succeeded,
+            'stages': [s.to_dict() for s in self.stages],
+            'total': self.total.to_dict()}))
+
+    def _record_metrics(self) -> None:
+        with _metrics_lock:
+            for s in self.stages + [self.total]:
+                key = '%s.%s' % (self.name, s.name)
+                if key not in _metrics.keys():
+                    _metrics[key] = {'count': 0, 'wall_seconds': 0,
+                                     'max_wall_seconds': 0, 'cpu_seconds': 0,
+                                     'rows': 0, 'max_memory_growth_bytes': 0}
+                m = _metrics[key]
+                m['count'] = m['count'] + 1
+                m['wall_seconds'] = m['wall_seconds'] + s.wall_seconds
+                m['max_wall_seconds'] = max(m['max_wall_seconds'],
+                                            s.wall_seconds)
+                m['cpu_seconds'] = m['cpu_seconds'] + s.cpu_seconds
+                m['rows'] = m['rows'] + (0 if s.rows is None else s.rows)
+                m['max_memory_growth_bytes'] = max(
+                    m['max_memory_growth_bytes'], s.memory_growth_bytes)
+
+
+# Times a stage of the current request. Set rows on the yielded StageTiming to
+# record the number of rows processed.
+# If no StageTimer is active (e.g. in tests or management commands), the
+# stage still runs but nothing is recorded.
+@contextmanager
+def stage(name: str) -> Iterator[StageTiming]:
+    timing = StageTiming(name)
+    timer = _current_timer.get()
+    if timer is None:
+        yield timing
+        return
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    start_memory = _MemoryBaseline()
+    try:
+        yield timing
+    finally:
+        timing.wall_seconds = time.perf_counter() - start_wall
+        timing.cpu_seconds = time.process_time() - start_cpu
+        timing.memory_growth_bytes = start_memory.get_growth_bytes()
+        timer.stages.append(timing)
+
+
+# Returns aggregated stage metrics for this process, keyed by
+# "<request name>.<stage name>". Mean wall time is included for convenience.
+def get_stage_metrics() -> dict[str, dict[str, float]]:
+    with _metrics_lock:
+        metrics = {k: dict(m) for k, m in _metrics.items()}
+    for m in metrics.values():
+        m['mean_wall_seconds'] = m['wall_seconds'] / m['count']
+    return metrics
+
+
+# Clears aggregated stage metrics.
+def reset_stage_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
@@ -0,0 +1,84 @@
+import numpy as np
+from django.http import HttpResponse
+from django.test import TestCase
+from forsys.stage_timer import (StageTimer, get_stage_metrics,
+                                reset_stage_metrics, stage)
+
+
+class StageTimerTest(TestCase):
+    def setUp(self) -> None:
+        reset_stage_metrics()
+
+    def test_records_stages(self):
+        with StageTimer('request') as timer:
+            with stage('fetch') as timing:
+                timing.rows = 10
+            with stage('parse'):
+                pass
+
+        self.assertEqual([s.name for s in timer.stages], ['fetch', 'parse'])
+        self.assertEqual(timer.stages[0].rows, 10)
+        self.assertIsNone(timer.stages[1].rows)
+        self.assertGreaterEqual(timer.total.wall_seconds,
+                                timer.stages[0].wall_seconds +
+                                timer.stages[1].wall_seconds)
+
+    def test_measures_memory_per_stage(self):
+        size = 64 * 1024 * 1024
+        with StageTimer('request') as timer:
+            with stage('allocate'):
+                data = np.ones(size, dtype=np.uint8)
+            del data
+            with stage('idle'):
+                pass
+
+        self.assertGreaterEqual(timer.stages[0].memory_growth_bytes,
+                                size // 2)
+        # The allocation isn't attributed to later stages.
+        self.assertLess(timer.stages[1].memory_growth_bytes, size // 2)
+
+    def test_records_nested_calls(self):
+        def fetch():
+            with stage('fetch'):
+                pass
+
+        with StageTimer('request') as timer:
+            fetch()
+        self.assertEqual([s.name for s in timer.stages], ['fetch'])
+
+    def test_ignores_stages_without_timer(self):
+        with stage('fetch') as timing:
+            timing.rows = 10
+        self.assertEqual(get_stage_metrics(), {})
+
+    def test_records_stages_on_exception(self):
+        with self.assertRaises(Exception):
+            with StageTimer('request') as timer:
+                with stage('fetch'):
+                    raise Exception("fetch failed")
+        self.assertEqual([s.name for s in timer.stages], ['fetch'])
+        self.assertEqual(get_stage_metrics()['request.fetch']['count'], 1)
+
+    def test_adds_server_timing_header(self):
+        with StageTimer('request') as timer:
+            with stage('fetch'):
+                pass
+        response = timer.add_server_timing_header(HttpResponse())
+        self.assertRegex(response['Server-Timing'],
+                         r'^fetch;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+    def test_aggregates_metrics(self):
+        for rows in [3, 4]:
+            with StageTimer('request'):
+                with stage('fetch') as timing:
+                    timing.rows = rows
+
+        metrics = get_stage_metrics()
+        self.assertEqual(set(metrics.keys()),
+                         {'request.fetch', 'request.total'})
+        self.assertEqual(metrics['request.fetch']['count'], 2)
+        self.assertEqual(metrics['request.fetch']['rows'], 7)
+        self.assertEqual(metrics['request.total']['count'], 2)
+        self.assertAlmostEqual(
+            metrics['request.fetch']['mean_wall_seconds'],
+            metrics['request.fetch']['wall_seconds'] / 2)
@@ -12,8 +12,21 @@ urlpatterns = [
         'rank_project_areas/single_scenario/',
         views.rank_project_areas_for_a_single_scenario,
         name='rank_project_areas_for_a_single_scenario'),
+    path(
+        'rank_project_areas/sensitivity/',
+        views.rank_project_areas_sensitivity,
+        name='rank_project_areas_sensitivity'),
     path(
         'generate_project_areas/single_scenario/',
         views.generate_project_areas_for_a_single_scenario,
         name='generate_project_areas_for_a_single_scenario'),
+    path(
+        'generate_project_areas/batch/',
+        views.generate_project_areas_for_a_batch_of_scenarios,
+        name='generate_project_areas_for_a_batch_of_scenarios'),
+    path(
+        'generate_project_areas/single_scenario/submit/',
+        views.submit_generation_job_for_a_single_scenario,
+        name='submit_generation_job_for_a_single_scenario'),
+    path('metrics/', views.get_forsys_metrics, name='get_forsys_metrics'),
 ]
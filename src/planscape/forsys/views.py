@@ -1,8 +1,10 @@
+import contextvars
 import cProfile
 import io
 import logging
 import os
 import pstats
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pstats import SortKey
 
@@ -10,17 +12,33 @@ import numpy as np
 import pandas as pd
 import rpy2
 from django.conf import settings
+from django.db import transaction
 from django.http import (HttpRequest, HttpResponse, HttpResponseBadRequest,
                          JsonResponse)
-from forsys.forsys_request_params import (ClusterAlgorithmType,
-                                          get_generation_request_params,
-                                          get_ranking_request_params)
+from forsys import ranking_engine
+from forsys.admission_control import (Admission, AdmissionDecision,
+                                      AdmissionLimits, admit_generation_run)
+from forsys.forsys_request_params import (
+    ClusterAlgorithmType, ForsysGenerationBatchRequestParams,
+    ForsysGenerationRequestParams, ForsysGenerationRequestParamsFromDb,
+    ForsysRankingRequestParams, ProjectAreaGeneratorRequestParams,
+    ProjectAreaGeneratorType, RankingEngine, get_generation_request_params,
+    get_ranking_request_params)
+from forsys.forsys_response import (ForsysResponseParams,
+                                    create_forsys_response)
+from forsys.generation_jobs import submit_generation_job
 from forsys.get_forsys_inputs import (ForsysGenerationInput,
                                       ForsysInputHeaders, ForsysRankingInput)
 from forsys.parse_forsys_output import (
     ForsysGenerationOutputForASingleScenario,
     ForsysRankingOutputForASingleScenario,
     ForsysRankingOutputForMultipleScenarios)
+from forsys.project_area_generator import ProjectAreaGenerator
+from forsys.r_worker_pool import get_r_worker_pool
+from forsys.ranking_cache import get_or_compute_ranking, get_ranking_cache_key
+from forsys.sensitivity_analysis import (WeightSweepParams,
+                                         analyze_weight_sensitivity)
+from forsys.stage_timer import StageTimer, get_stage_metrics, stage
 from forsys.write_forsys_output_to_db import (create_plan_and_scenario,
                                               save_generation_output_to_db)
 from memory_profiler import profile
@@ -84,47 +102,91 @@ def run_forsys_rank_project_areas_for_multiple_scenarios(
         max_area_in_km2: float | None, max_cost_in_usd: float | None,
         forsys_proj_id_header: str, forsys_stand_id_header: str,
         forsys_area_header: str, forsys_cost_header: str,
-        forsys_priority_headers: list[str]
+        forsys_priority_headers: list[str],
+        engine: RankingEngine = RankingEngine.R
 ) -> ForsysRankingOutputForMultipleScenarios:
-    import rpy2.robjects as robjects
-    robjects.r.source(os.path.join(
-        settings.BASE_DIR, 'forsys/rank_projects_for_multiple_scenarios.R'))
-    rank_projects_for_multiple_scenarios_function_r = robjects.globalenv[
-        'rank_projects_for_multiple_scenarios']
+    pool = get_r_worker_pool()
+    if engine == RankingEngine.PYTHON:
+        with stage('forsys'):
+            forsys_output = \
+                ranking_engine.rank_projects_for_multiple_scenarios(
+                    forsys_input_dict, forsys_priority_headers,
+                    forsys_stand_id_header, forsys_proj_id_header,
+                    forsys_area_header, forsys_cost_header)
+    elif pool is not None:
+        with stage('forsys'):
+            forsys_output = pool.call(
+                'rank_projects_for_multiple_scenarios', forsys_input_dict,
+                forsys_priority_headers, forsys_stand_id_header,
+                forsys_proj_id_header, forsys_area_header, forsys_cost_header)
+    else:
+        import rpy2.robjects as robjects
+        robjects.r.source(os.path.join(
+            settings.BASE_DIR,
+            'forsys/rank_projects_for_multiple_scenarios.R'))
+        rank_projects_for_multiple_scenarios_function_r = robjects.globalenv[
+            'rank_projects_for_multiple_scenarios']
+
+        with stage('r_conversion'):
+            forsys_input = convert_dictionary_of_lists_to_rdf(
+                forsys_input_dict)
+
+        with stage('forsys'):
+            forsys_output = rank_projects_for_multiple_scenarios_function_r(
+                forsys_input, robjects.StrVector(forsys_priority_headers),
+                forsys_stand_id_header, forsys_proj_id_header,
+                forsys_area_header, forsys_cost_header)
+
+    with stage('parse'):
+        parsed_output = ForsysRankingOutputForMultipleScenarios(
+            forsys_output, forsys_priority_headers, max_area_in_km2,
+            max_cost_in_usd, forsys_proj_id_header, forsys_area_header,
+            forsys_cost_header)
 
-    forsys_input = convert_dictionary_of_lists_to_rdf(forsys_input_dict)
+    return parsed_output
 
-    forsys_output = rank_projects_for_multiple_scenarios_function_r(
-        forsys_input, robjects.StrVector(forsys_priority_headers),
-        forsys_stand_id_header, forsys_proj_id_header, forsys_area_header,
-        forsys_cost_header)
 
-    parsed_output = ForsysRankingOutputForMultipleScenarios(
-        forsys_output, forsys_priority_headers, max_area_in_km2,
-        max_cost_in_usd, forsys_proj_id_header, forsys_area_header,
-        forsys_cost_header)
+# Returns the response payload for a forsys scenario set call.
+def _rank_project_areas_for_multiple_scenarios(
+        params: ForsysRankingRequestParams) -> dict:
+    headers = ForsysInputHeaders(params.priorities)
+    with stage('raster_fetch'):
+        forsys_input = ForsysRankingInput(params, headers)
+    forsys_output = run_forsys_rank_project_areas_for_multiple_scenarios(
+        forsys_input.forsys_input, params.max_area_in_km2,
+        params.max_cost_in_usd, headers.FORSYS_PROJECT_ID_HEADER,
+        headers.FORSYS_STAND_ID_HEADER, headers.FORSYS_AREA_HEADER,
+        headers.FORSYS_COST_HEADER, headers.priority_headers,
+        params.ranking_engine)
 
-    return parsed_output
+    response = {}
+    response['forsys'] = {}
+    response['forsys']['input'] = forsys_input.forsys_input
+    response['forsys']['output_scenarios'] = forsys_output.scenarios
+    return response
 
 
 # Returns JSon data for a forsys scenario set call.
+# Results are cached (see forsys.ranking_cache).
 def rank_project_areas_for_multiple_scenarios(
         request: HttpRequest) -> HttpResponse:
     try:
-        params = get_ranking_request_params(request.GET)
-        headers = ForsysInputHeaders(params.priorities)
-        forsys_input = ForsysRankingInput(params, headers)
-        forsys_output = run_forsys_rank_project_areas_for_multiple_scenarios(
-            forsys_input.forsys_input, params.max_area_in_km2, params.max_cost_in_usd, headers.FORSYS_PROJECT_ID_HEADER,
-            headers.FORSYS_STAND_ID_HEADER, headers.FORSYS_AREA_HEADER,
-            headers.FORSYS_COST_HEADER, headers.priority_headers)
-
-        response = {}
-        response['forsys'] = {}
-        response['forsys']['input'] = forsys_input.forsys_input
-        response['forsys']['output_scenarios'] = forsys_output.scenarios
-
-        return JsonResponse(response)
+        with StageTimer('rank_project_areas_for_multiple_scenarios') as timer:
+            with stage('params'):
+                response_params = ForsysResponseParams(request.GET)
+                params = get_ranking_request_params(request.GET)
+            with stage('cache_key'):
+                cache_key = get_ranking_cache_key(
+                    'multiple_scenarios', params)
+            response = get_or_compute_ranking(
+                cache_key,
+                lambda: _rank_project_areas_for_multiple_scenarios(params))
+
+            with stage('serialization'):
+                http_response = create_forsys_response(
+                    response, response_params)
+
+        return timer.add_server_timing_header(http_response)
 
     except Exception as e:
         logger.error('project area ranking error: ' + str(e))
@@ -137,54 +199,140 @@ def run_forsys_rank_project_areas_for_a_single_scenario(
         forsys_proj_id_header: str, forsys_stand_id_header: str,
         forsys_area_header: str, forsys_cost_header: str,
         forsys_priority_headers: list[str],
-        forsys_priority_weights: list[float]
+        forsys_priority_weights: list[float],
+        engine: RankingEngine = RankingEngine.R
 ) -> ForsysRankingOutputForASingleScenario:
-    import rpy2.robjects as robjects
-    robjects.r.source(os.path.join(
-        settings.BASE_DIR, 'forsys/rank_projects_for_a_single_scenario.R'))
-    rank_projects_for_a_single_scenario_function_r = robjects.globalenv[
-        'rank_projects_for_a_single_scenario']
-
-    forsys_input = convert_dictionary_of_lists_to_rdf(forsys_input_dict)
-
-    forsys_output = rank_projects_for_a_single_scenario_function_r(
-        forsys_input, robjects.StrVector(forsys_priority_headers),
-        robjects.FloatVector(forsys_priority_weights),
-        forsys_stand_id_header, forsys_proj_id_header, forsys_area_header,
-        forsys_cost_header)
+    pool = get_r_worker_pool()
+    if engine == RankingEngine.PYTHON:
+        with stage('forsys'):
+            forsys_output = \
+                ranking_engine.rank_projects_for_a_single_scenario(
+                    forsys_input_dict, forsys_priority_headers,
+                    [float(w) for w in forsys_priority_weights],
+                    forsys_stand_id_header, forsys_proj_id_header,
+                    forsys_area_header, forsys_cost_header)
+    elif pool is not None:
+        with stage('forsys'):
+            forsys_output = pool.call(
+                'rank_projects_for_a_single_scenario', forsys_input_dict,
+                forsys_priority_headers,
+                [float(w) for w in forsys_priority_weights],
+                forsys_stand_id_header, forsys_proj_id_header,
+                forsys_area_header, forsys_cost_header)
+    else:
+        import rpy2.robjects as robjects
+        robjects.r.source(os.path.join(
+            settings.BASE_DIR, 'forsys/rank_projects_for_a_single_scenario.R'))
+        rank_projects_for_a_single_scenario_function_r = robjects.globalenv[
+            'rank_projects_for_a_single_scenario']
+
+        with stage('r_conversion'):
+            forsys_input = convert_dictionary_of_lists_to_rdf(
+                forsys_input_dict)
+
+        with stage('forsys'):
+            forsys_output = rank_projects_for_a_single_scenario_function_r(
+                forsys_input, robjects.StrVector(forsys_priority_headers),
+                robjects.FloatVector(forsys_priority_weights),
+                forsys_stand_id_header, forsys_proj_id_header,
+                forsys_area_header, forsys_cost_header)
 
     priority_weights_dict = {
         forsys_priority_headers[i]: forsys_priority_weights[i]
         for i in range(len(forsys_priority_headers))}
-    parsed_output = ForsysRankingOutputForASingleScenario(
-        forsys_output, priority_weights_dict, max_area_in_km2, max_cost_in_usd,
-        forsys_proj_id_header, forsys_area_header, forsys_cost_header)
+    with stage('parse'):
+        parsed_output = ForsysRankingOutputForASingleScenario(
+            forsys_output, priority_weights_dict, max_area_in_km2,
+            max_cost_in_usd, forsys_proj_id_header, forsys_area_header,
+            forsys_cost_header)
 
     return parsed_output
 
 
+# Returns the response payload for a single forsys scenario.
+def _rank_project_areas_for_a_single_scenario(
+        params: ForsysRankingRequestParams) -> dict:
+    headers = ForsysInputHeaders(params.priorities)
+    with stage('raster_fetch'):
+        forsys_input = ForsysRankingInput(params, headers)
+    forsys_output = run_forsys_rank_project_areas_for_a_single_scenario(
+        forsys_input.forsys_input, params.max_area_in_km2,
+        params.max_cost_in_usd, headers.FORSYS_PROJECT_ID_HEADER,
+        headers.FORSYS_STAND_ID_HEADER, headers.FORSYS_AREA_HEADER,
+        headers.FORSYS_COST_HEADER, headers.priority_headers,
+        params.priority_weights, params.ranking_engine)
+
+    response = {}
+    response['forsys'] = {}
+    response['forsys']['input'] = forsys_input.forsys_input
+    response['forsys']['output_scenario'] = forsys_output.scenario
+    return response
+
+
+# Returns JSon data for a single forsys scenario.
+# Results are cached (see forsys.ranking_cache).
 def rank_project_areas_for_a_single_scenario(
         request: HttpRequest) -> HttpResponse:
     try:
-        params = get_ranking_request_params(request.GET)
-        headers = ForsysInputHeaders(params.priorities)
-        forsys_input = ForsysRankingInput(params, headers)
-        forsys_output = run_forsys_rank_project_areas_for_a_single_scenario(
-            forsys_input.forsys_input, params.max_area_in_km2,
-            params.max_cost_in_usd, headers.FORSYS_PROJECT_ID_HEADER,
-            headers.FORSYS_STAND_ID_HEADER, headers.FORSYS_AREA_HEADER,
-            headers.FORSYS_COST_HEADER, headers.priority_headers,
-            params.priority_weights)
+        with StageTimer('rank_project_areas_for_a_single_scenario') as timer:
+            with stage('params'):
+                response_params = ForsysResponseParams(request.GET)
+                params = get_ranking_request_params(request.GET)
+            with stage('cache_key'):
+                cache_key = get_ranking_cache_key('single_scenario', params)
+            response = get_or_compute_ranking(
+                cache_key,
+                lambda: _rank_project_areas_for_a_single_scenario(params))
+
+            with stage('serialization'):
+                http_response = create_forsys_response(
+                    response, response_params)
+
+        return timer.add_server_timing_header(http_response)
 
-        response = {}
-        response['forsys'] = {}
-        response['forsys']['input'] = forsys_input.forsys_input
-        response['forsys']['output_scenario'] = forsys_output.scenario
+    except Exception as e:
+        logger.error('project area ranking error: ' + str(e))
+        return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
-        return JsonResponse(response)
+
+# Returns JSon data describing how project area ranks change as priority
+# weights are swept over a grid (or sampled; see WeightSweepParams).
+# Project scores are computed as for
+# rank_project_areas_for_multiple_scenarios; ranks are compared against ranks
+# under the requested priority weights.
+def rank_project_areas_sensitivity(request: HttpRequest) -> HttpResponse:
+    try:
+        with StageTimer('rank_project_areas_sensitivity') as timer:
+            with stage('params'):
+                response_params = ForsysResponseParams(request.GET)
+                params = get_ranking_request_params(request.GET)
+                sweep_params = WeightSweepParams(request.GET)
+            headers = ForsysInputHeaders(params.priorities)
+            with stage('raster_fetch'):
+                forsys_input = ForsysRankingInput(params, headers)
+            with stage('sensitivity_analysis') as timing:
+                proj_ids, scores = ranking_engine.get_project_scores(
+                    forsys_input.forsys_input, headers.priority_headers,
+                    headers.FORSYS_PROJECT_ID_HEADER)
+                weights = sweep_params.get_weight_vectors(
+                    len(params.priorities))
+                timing.rows = len(weights)
+                sensitivity = analyze_weight_sensitivity(
+                    params.priorities, proj_ids, scores, weights,
+                    params.priority_weights, sweep_params.top_k)
+
+            response = {}
+            response['forsys'] = {}
+            response['forsys']['input'] = forsys_input.forsys_input
+            response['sensitivity'] = sensitivity
+            with stage('serialization'):
+                http_response = create_forsys_response(
+                    response, response_params)
+
+        return timer.add_server_timing_header(http_response)
 
     except Exception as e:
-        logger.error('project area ranking error: ' + str(e))
+        logger.error('project area sensitivity analysis error: ' + str(e))
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
 
@@ -194,39 +342,259 @@ def run_forsys_generate_project_areas_for_a_single_scenario(
         forsys_priority_weights: list[float],
         enable_kmeans_clustering: bool,
         output_scenario_name: str | None,
-        output_scenario_tag: str | None
+        output_scenario_tag: str | None,
+        stand_id_to_pixels: dict[int, list[tuple[int, int]]] | None = None,
+        raster_topleft_coords: tuple[float, float] | None = None
 ) -> ForsysGenerationOutputForASingleScenario:
-    import rpy2.robjects as robjects
-    robjects.r.source(os.path.join(
-        settings.BASE_DIR, 'forsys/generate_projects_for_a_single_scenario.R'))
-    generate_projects_for_a_single_scenario_function_r = robjects.globalenv[
-        'generate_projects_for_a_single_scenario']
-
-    forsys_input = convert_dictionary_of_lists_to_rdf(forsys_input_dict)
-
-    forsys_output = generate_projects_for_a_single_scenario_function_r(
-        forsys_input, robjects.StrVector(headers.priority_headers),
-        robjects.StrVector(headers.condition_headers),
-        robjects.FloatVector(forsys_priority_weights),
-        headers.FORSYS_STAND_ID_HEADER, headers.FORSYS_PROJECT_ID_HEADER,
-        headers.FORSYS_AREA_HEADER,
-        headers.FORSYS_COST_HEADER, headers.FORSYS_GEO_WKT_HEADER,
-        headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER,
-        "" if output_scenario_name is None else output_scenario_name,
-        "" if output_scenario_tag is None else output_scenario_tag,
-        enable_kmeans_clustering)
+    pool = get_r_worker_pool()
+    if pool is not None:
+        with stage('patchmax'):
+            forsys_output = pool.call(
+                'generate_projects_for_a_single_scenario', forsys_input_dict,
+                headers.priority_headers, headers.condition_headers,
+                [float(w) for w in forsys_priority_weights],
+                headers.FORSYS_STAND_ID_HEADER,
+                headers.FORSYS_PROJECT_ID_HEADER, headers.FORSYS_AREA_HEADER,
+                headers.FORSYS_COST_HEADER, headers.FORSYS_GEO_WKT_HEADER,
+                headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER,
+                "" if output_scenario_name is None else output_scenario_name,
+                "" if output_scenario_tag is None else output_scenario_tag,
+                enable_kmeans_clustering)
+    else:
+        import rpy2.robjects as robjects
+        robjects.r.source(os.path.join(
+            settings.BASE_DIR,
+            'forsys/generate_projects_for_a_single_scenario.R'))
+        generate_projects_for_a_single_scenario_function_r = \
+            robjects.globalenv['generate_projects_for_a_single_scenario']
+
+        with stage('r_conversion'):
+            forsys_input = convert_dictionary_of_lists_to_rdf(
+                forsys_input_dict)
+
+        with stage('patchmax'):
+            forsys_output = generate_projects_for_a_single_scenario_function_r(
+                forsys_input, robjects.StrVector(headers.priority_headers),
+                robjects.StrVector(headers.condition_headers),
+                robjects.FloatVector(forsys_priority_weights),
+                headers.FORSYS_STAND_ID_HEADER,
+                headers.FORSYS_PROJECT_ID_HEADER, headers.FORSYS_AREA_HEADER,
+                headers.FORSYS_COST_HEADER, headers.FORSYS_GEO_WKT_HEADER,
+                headers.FORSYS_TREATMENT_ELIGIBILITY_HEADER,
+                "" if output_scenario_name is None else output_scenario_name,
+                "" if output_scenario_tag is None else output_scenario_tag,
+                enable_kmeans_clustering)
 
     priority_weights_dict = {
         headers.priority_headers[i]: forsys_priority_weights[i]
         for i in range(len(headers.priority_headers))}
-    parsed_output = ForsysGenerationOutputForASingleScenario(
-        forsys_output, priority_weights_dict, headers.FORSYS_PROJECT_ID_HEADER,
-        headers.FORSYS_AREA_HEADER, headers.FORSYS_COST_HEADER,
-        headers.FORSYS_GEO_WKT_HEADER)
+    with stage('parse'):
+        parsed_output = ForsysGenerationOutputForASingleScenario(
+            forsys_output, priority_weights_dict,
+            headers.FORSYS_PROJECT_ID_HEADER, headers.FORSYS_AREA_HEADER,
+            headers.FORSYS_COST_HEADER, headers.FORSYS_GEO_WKT_HEADER,
+            headers.FORSYS_STAND_ID_HEADER, stand_id_to_pixels,
+            raster_topleft_coords)
     return parsed_output
 
+
+def run_python_generate_project_areas_for_a_single_scenario(
+        forsys_input_dict: dict[str, list],
+        headers: ForsysInputHeaders,
+        forsys_priority_weights: list[float],
+        generator_params: ProjectAreaGeneratorRequestParams,
+        stand_id_to_pixels: dict[int, list[tuple[int, int]]],
+        raster_topleft_coords: tuple[float, float]
+) -> ForsysGenerationOutputForASingleScenario:
+    with stage('project_area_generation') as timing:
+        generator = ProjectAreaGenerator(
+            forsys_input_dict, headers, forsys_priority_weights,
+            generator_params, stand_id_to_pixels)
+        timing.rows = len(forsys_input_dict[headers.FORSYS_STAND_ID_HEADER])
+
+    priority_weights_dict = {
+        headers.priority_headers[i]: forsys_priority_weights[i]
+        for i in range(len(headers.priority_headers))}
+    with stage('parse'):
+        parsed_output = ForsysGenerationOutputForASingleScenario(
+            generator.forsys_output, priority_weights_dict,
+            headers.FORSYS_PROJECT_ID_HEADER, headers.FORSYS_AREA_HEADER,
+            headers.FORSYS_COST_HEADER, headers.FORSYS_GEO_WKT_HEADER,
+            headers.FORSYS_STAND_ID_HEADER, stand_id_to_pixels,
+            raster_topleft_coords)
+    return parsed_output
+
+
     # TODO: Create test endpoint that instantiates ForsysGenerationOutputForASingleScenario 
     # with stand and project output files 
+# Runs project area generation for params and returns the response payload.
+# If params.db_params.write_to_db is true, output is also written to the DB.
+# Unless admission was already decided (e.g. by the calling view), admission
+# control runs first and may reject the run or enable clustering.
+def generate_project_areas(params: ForsysGenerationRequestParams,
+                           admission: Admission | None = None) -> dict:
+    if admission is None:
+        with stage('admission'):
+            admission = admit_generation_run(
+                params, AdmissionLimits.from_settings(), synchronous=False)
+    if admission.decision == AdmissionDecision.REJECT:
+        raise Exception(admission.message)
+
+    headers = ForsysInputHeaders(params.priorities)
+    forsys_input = ForsysGenerationInput(params, headers)
+    forsys_output = _generate_project_areas_for_input(
+        params, headers, forsys_input)
+
+    response = {}
+    response['forsys'] = {}
+    response['forsys']['input'] = forsys_input.forsys_input
+    response['forsys']['output'] = forsys_output.scenario
+    response['admission'] = admission.to_dict()
+
+    if params.db_params.write_to_db:
+        # The plan and scenario are created in the same transaction as the
+        # output, so a failed write doesn't leave an empty plan behind.
+        with stage('db_write') as timing, transaction.atomic():
+            scenario = create_plan_and_scenario(params) \
+                if params.db_params.scenario is None \
+                else params.db_params.scenario
+            save_generation_output_to_db(scenario, forsys_output.scenario)
+            timing.rows = len(forsys_output.scenario['ranked_projects'])
+        response['db'] = {}
+        response['db']['scenario_id'] = str(scenario.pk)
+        response['db']['project_id'] = str(scenario.project.pk)
+        response['db']['plan_id'] = str(scenario.plan.pk)
+
+    return response
+
+
+# Runs the project area generator selected by params on forsys_input.
+def _generate_project_areas_for_input(
+        params: ForsysGenerationRequestParams, headers: ForsysInputHeaders,
+        forsys_input: ForsysGenerationInput
+) -> ForsysGenerationOutputForASingleScenario:
+    enable_kmeans_clustering = \
+        params.cluster_params.cluster_algorithm_type == \
+        ClusterAlgorithmType.KMEANS_IN_R
+    if params.generator_params.generator_type == \
+            ProjectAreaGeneratorType.GREEDY_IN_PYTHON:
+        # The python generator needs stand adjacency, which it derives from
+        # the stand to pixel mapping.
+        if enable_kmeans_clustering:
+            raise Exception(
+                "k-means clustering in R is not supported by the python " +
+                "project area generator")
+        forsys_output = \
+            run_python_generate_project_areas_for_a_single_scenario(
+                forsys_input.forsys_input, headers, params.priority_weights,
+                params.generator_params, forsys_input.stand_id_to_pixels,
+                forsys_input.raster_topleft_coords)
+    else:
+        forsys_output = \
+            run_forsys_generate_project_areas_for_a_single_scenario(
+                forsys_input.forsys_input, headers,
+                params.priority_weights,
+                enable_kmeans_clustering,
+                "test_scenario" if settings.DEBUG else None,
+                datetime.now().astimezone(
+                    timezone('US/Pacific')
+                ).strftime("%Y%m%d-%H-%M") if settings.DEBUG else None,
+                # K-means clustering in R reassigns stand ID's, so the stand
+                # to pixel mapping no longer applies.
+                None if enable_kmeans_clustering
+                else forsys_input.stand_id_to_pixels,
+                forsys_input.raster_topleft_coords)
+    return forsys_output
+
+
+# Returns a key identifying the forsys input built for params. Variants of a
+# batch request with equal keys share forsys input.
+# Forsys input depends on priority weights only if stands are clustered in
+# python.
+def _get_generation_input_key(params: ForsysGenerationRequestParams) -> tuple:
+    cluster_params = params.cluster_params
+    key = (tuple(sorted(vars(params.stand_eligibility_params).items())),)
+    if cluster_params.cluster_algorithm_type in (
+            ClusterAlgorithmType.NONE, ClusterAlgorithmType.KMEANS_IN_R):
+        return key
+    return key + (cluster_params.cluster_algorithm_type,
+                  cluster_params.num_clusters,
+                  cluster_params.pixel_index_weight,
+                  cluster_params.cache_merge_tree,
+                  tuple(params.priority_weights))
+
+
+# Runs project area generation for each variant in params and returns the
+# response payload.
+# Raster data is fetched once for all variants, and forsys input is built
+# once per distinct input key (see _get_generation_input_key). Patchmax runs
+# are fanned out across the R worker pool; python generator runs (which use
+# their own process pool) run in the calling thread meanwhile.
+# Variant outputs are under 'output_scenarios', keyed by variant index.
+def generate_project_areas_for_a_batch(
+        params: ForsysGenerationBatchRequestParams) -> dict:
+    variants = params.variants
+    admissions = []
+    with stage('admission'):
+        for v in variants:
+            admission = admit_generation_run(
+                v, AdmissionLimits.from_settings(), synchronous=True)
+            if admission.decision == AdmissionDecision.REJECT:
+                raise Exception(admission.message)
+            if admission.decision == AdmissionDecision.QUEUE:
+                raise Exception(
+                    "%s; batch runs can't be queued" % (admission.message))
+            admissions.append(admission)
+
+    headers = ForsysInputHeaders(variants[0].priorities)
+    condition_fetcher = ForsysGenerationInput.fetch_conditions(variants)
+    forsys_inputs = {}
+    for v in variants:
+        key = _get_generation_input_key(v)
+        if key not in forsys_inputs.keys():
+            forsys_inputs[key] = ForsysGenerationInput(
+                v, headers, condition_fetcher)
+
+    pool = get_r_worker_pool()
+    futures = {}
+    outputs = []
+    with stage('batch_generation') as timing:
+        with ThreadPoolExecutor(max_workers=max(1, min(
+                settings.FORSYS_R_WORKERS, len(variants)))) as executor:
+            for i, v in enumerate(variants):
+                if pool is not None and v.generator_params.generator_type == \
+                        ProjectAreaGeneratorType.PATCHMAX:
+                    # Each task gets a copy of the request context, so its
+                    # stages are recorded by the request's StageTimer.
+                    futures[i] = executor.submit(
+                        contextvars.copy_context().run,
+                        _generate_project_areas_for_input, v, headers,
+                        forsys_inputs[_get_generation_input_key(v)])
+            for i, v in enumerate(variants):
+                if i in futures.keys():
+                    outputs.append(futures[i].result())
+                else:
+                    outputs.append(_generate_project_areas_for_input(
+                        v, headers,
+                        forsys_inputs[_get_generation_input_key(v)]))
+        timing.rows = len(variants)
+
+    response = {}
+    response['forsys'] = {}
+    response['forsys']['output_scenarios'] = {
+        str(i): o.scenario for i, o in enumerate(outputs)}
+    response['variants'] = [{
+        'priority_weights': v.get_priority_weights_dict(),
+        'cluster_algorithm_type': int(
+            v.cluster_params.cluster_algorithm_type),
+        'project_area_generator_type': int(
+            v.generator_params.generator_type),
+        'admission': admissions[i].to_dict(),
+    } for i, v in enumerate(variants)]
+    response['num_forsys_inputs'] = len(forsys_inputs)
+    return response
+
+
 def generate_project_areas_for_a_single_scenario(
         request: HttpRequest) -> HttpResponse:
     try:
@@ -234,43 +602,100 @@ def generate_project_areas_for_a_single_scenario(
         if settings.DEBUG:
             _set_up_cprofiler(pr)
 
-        params = get_generation_request_params(request)
-        headers = ForsysInputHeaders(params.priorities)
-        forsys_input = ForsysGenerationInput(params, headers)
-        forsys_output = run_forsys_generate_project_areas_for_a_single_scenario(
-            forsys_input.forsys_input, headers,
-            params.priority_weights,
-            params.cluster_params.cluster_algorithm_type ==
-            ClusterAlgorithmType.KMEANS_IN_R,
-            "test_scenario" if settings.DEBUG else None,
-            datetime.now().astimezone(
-                timezone('US/Pacific')
-            ).strftime("%Y%m%d-%H-%M") if settings.DEBUG else None)
-
-        response = {}
-        response['forsys'] = {}
-        response['forsys']['input'] = forsys_input.forsys_input
-        response['forsys']['output'] = forsys_output.scenario
-
-        if params.db_params.write_to_db:
-            scenario = create_plan_and_scenario(params) \
-                if params.db_params.scenario is None \
-                else params.db_params.scenario
-            save_generation_output_to_db(scenario, forsys_output.scenario)
-            response['db'] = {}
-            response['db']['scenario_id'] = str(scenario.pk)
-            response['db']['project_id'] = str(scenario.project.pk)
-            response['db']['plan_id'] = str(scenario.plan.pk)
+        with StageTimer('generate_project_areas') as timer:
+            with stage('params'):
+                response_params = ForsysResponseParams(request.GET)
+                params = get_generation_request_params(request)
+            with stage('admission'):
+                admission = admit_generation_run(
+                    params, AdmissionLimits.from_settings(), synchronous=True)
+
+            if admission.decision == AdmissionDecision.QUEUE:
+                http_response = _queue_generation_run(
+                    request, params, admission)
+            else:
+                response = generate_project_areas(params, admission)
+                with stage('serialization'):
+                    http_response = create_forsys_response(
+                        response, response_params)
 
         if settings.DEBUG:
             _tear_down_cprofiler(pr, 'output/cprofiler.log')
 
-        return JsonResponse(response)
+        return timer.add_server_timing_header(http_response)
     except Exception as e:
         logger.error('project area generation error: ' + str(e))
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
 
+# Returns JSon data for a batch of generation runs that share a planning area
+# (see ForsysGenerationBatchRequestParams).
+def generate_project_areas_for_a_batch_of_scenarios(
+        request: HttpRequest) -> HttpResponse:
+    try:
+        with StageTimer('generate_project_areas_for_a_batch') as timer:
+            with stage('params'):
+                response_params = ForsysResponseParams(request.GET)
+                params = ForsysGenerationBatchRequestParams(request)
+            response = generate_project_areas_for_a_batch(params)
+            with stage('serialization'):
+                http_response = create_forsys_response(
+                    response, response_params)
+
+        return timer.add_server_timing_header(http_response)
+    except Exception as e:
+        logger.error('batch project area generation error: ' + str(e))
+        return HttpResponseBadRequest("Ill-formed request: " + str(e))
+
+
+# Queues a generation run that admission control deemed too large to run
+# within a request.
+def _queue_generation_run(request: HttpRequest,
+                          params: ForsysGenerationRequestParams,
+                          admission: Admission) -> HttpResponse:
+    if not isinstance(params, ForsysGenerationRequestParamsFromDb):
+        raise Exception(
+            "%s; only runs for saved scenarios can be queued" %
+            (admission.message))
+    job = submit_generation_job(params, request.GET)
+
+    response = {}
+    response['job_id'] = str(job.pk)
+    response['scenario_id'] = str(job.scenario_id)
+    response['status'] = job.get_status_display()
+    response['admission'] = admission.to_dict()
+    return JsonResponse(response)
+
+
+# Queues project area generation for a scenario (given by url parameter,
+# scenario_id) and returns immediately.
+# The job is run by the run_generation_jobs management command; progress is
+# reported via the scenario's status.
+def submit_generation_job_for_a_single_scenario(
+        request: HttpRequest) -> HttpResponse:
+    try:
+        params = ForsysGenerationRequestParamsFromDb(request)
+        job = submit_generation_job(params, request.GET)
+
+        response = {}
+        response['job_id'] = str(job.pk)
+        response['scenario_id'] = str(job.scenario_id)
+        response['status'] = job.get_status_display()
+        return JsonResponse(response)
+    except Exception as e:
+        logger.error('generation job submission error: ' + str(e))
+        return HttpResponseBadRequest("Ill-formed request: " + str(e))
+
+
+# Returns per-stage timing metrics aggregated over requests handled by this
+# process (see forsys.stage_timer).
+def get_forsys_metrics(request: HttpRequest) -> HttpResponse:
+    response = {}
+    response['pid'] = os.getpid()
+    response['metrics'] = get_stage_metrics()
+    return JsonResponse(response)
+
+
 # This enables memory profiling of generate_project_areas_for_a_single_scenario
 # if settings.DEBUG is true.
 # memory profile data is written to output/memprofiler.log.
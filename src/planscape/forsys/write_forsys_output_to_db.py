@@ -1,14 +1,18 @@
 from datetime import datetime
 
-from base.condition_types import ConditionScoreType
-from conditions.models import Condition
+from conditions.catalog import get_priority_condition
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
+from django.db import transaction
 from forsys.forsys_request_params import ForsysGenerationRequestParams
 from plan.models import (
     Plan, Project, ProjectArea, RankedProjectArea, Scenario,
-    ScenarioWeightedPriority)
+    ScenarioWeightedPriority, update_raster_geometries)
 from pytz import timezone
 
+# Rows per INSERT statement for bulk writes. This bounds statement size when
+# project area geometries are large.
+_BULK_CREATE_BATCH_SIZE = 500
+
 
 # Given a WKT, validates that the WKT repreesents either a Polygon or 
 # MultiPolygon, then returns a MultiPolygon.
@@ -31,28 +35,29 @@ def _create_plan(params: ForsysGenerationRequestParams) -> Plan:
             timezone('US/Pacific')
         ).strftime("%Y%-m-%d-%H:%M"), region_name=params.region,
         geometry=_get_multipolygon(params.planning_area))
-    plan.save()
     return plan
 
 
 def _create_weighted_priorities(
         params: ForsysGenerationRequestParams, scenario: Scenario):
-    for i in range(len(params.priorities)):
-        condition = Condition.objects.select_related('condition_dataset').get(
-            condition_dataset__condition_name=params.priorities[i],
-            condition_score_type=ConditionScoreType.CURRENT, is_raw=False)
-        weighted_priority = ScenarioWeightedPriority.objects.create(
-            scenario=scenario, priority=condition,
+    # Conditions come from the condition catalog, so this doesn't query per
+    # priority.
+    ScenarioWeightedPriority.objects.bulk_create([
+        ScenarioWeightedPriority(
+            scenario=scenario,
+            priority=get_priority_condition(
+                params.priorities[i], region_name=params.region),
             weight=params.priority_weights[i])
-        weighted_priority.save()
+        for i in range(len(params.priorities))])
 
 
 # Creates a plan, project, scenario, and the weighted priorities associated
-# with a scenario.
+# with a scenario, in a single transaction.
 # This is primarily used for debug purposes, when
 # ForsysGenerationRequestParams.db_params is missing a scenario.
 # TODO: this assumes ForsysGenerationRequestParams is well-formed; input
 # validation logic needs to be added and tested.
+@transaction.atomic
 def create_plan_and_scenario(
         params: ForsysGenerationRequestParams) -> Scenario:
     user = params.db_params.user
@@ -60,11 +65,9 @@ def create_plan_and_scenario(
     plan = _create_plan(params)
 
     project = Project.objects.create(owner=user, plan=plan)
-    project.save()
 
     scenario = Scenario.objects.create(
         owner=user, plan=plan, project=project)
-    scenario.save()
 
     _create_weighted_priorities(params, scenario)
 
@@ -75,24 +78,32 @@ def create_plan_and_scenario(
 # RankedProjectArea objects to the DB.
 # Forsys output data, represented by output_scenario, is the dictionary in
 # ForsysGenerationOutputForASingleScenario.scenario.
+# All rows are written in a single transaction with one bulk insert per table,
+# so the number of queries doesn't grow with the number of projects.
+# Geometries are parsed once and sent to the DB as (E)WKB.
 # TODO: this assumes the input arguments are well-formed; input validation
 # logic needs to be added and tested.
+@transaction.atomic
 def save_generation_output_to_db(scenario: Scenario,
                                  output_scenario: dict):
     owner = scenario.owner
     project = scenario.project
-
-    for p in output_scenario['ranked_projects']:
-        # TODO: add scenario as an optional field in ProjectArea so that project areas previously-generated for a scenario can be deleted.
-        project_area = ProjectArea.objects.create(
-            owner=owner, project=project,
-            project_area=_get_multipolygon(p['geo_wkt']))
-        project_area.save()
-
-        ranked_project_area = RankedProjectArea.objects.create(
-            scenario=scenario, project_area=project_area,
-            rank=p['rank'], weighted_score=p['total_score'])
-        ranked_project_area.save()
+    ranked_projects = output_scenario['ranked_projects']
+
+    # TODO: add scenario as an optional field in ProjectArea so that project
+    # areas previously-generated for a scenario can be deleted.
+    # On PostgreSQL, bulk_create sets primary keys, which ranked project
+    # areas refer to.
+    project_areas = ProjectArea.objects.bulk_create(
+        update_raster_geometries([
+            ProjectArea(owner=owner, project=project,
+                        project_area=_get_multipolygon(p['geo_wkt']))
+            for p in ranked_projects]), batch_size=_BULK_CREATE_BATCH_SIZE)
+    RankedProjectArea.objects.bulk_create([
+        RankedProjectArea(scenario=scenario, project_area=project_area,
+                          rank=p['rank'], weighted_score=p['total_score'])
+        for p, project_area in zip(ranked_projects, project_areas)],
+        batch_size=_BULK_CREATE_BATCH_SIZE)
 
     scenario.status = Scenario.ScenarioStatus.SUCCESS
     scenario.save()
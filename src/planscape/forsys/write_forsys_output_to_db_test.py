@@ -6,9 +6,11 @@ from forsys.write_forsys_output_to_db import (
 from conditions.models import BaseCondition, Condition
 from plan.models import ScenarioWeightedPriority, RankedProjectArea, Scenario
 from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import connection
 from django.http import HttpRequest
 from planscape import settings
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 
 def _create_condition(name: str, region: str):
@@ -72,6 +74,47 @@ class CreatePlanAndScenarioTest(TestCase):
                 scenario_id=scenario.pk)}
         self.assertDictEqual(weighted_priorities, {'foo': 1, 'bar': 4})
 
+    def test_uses_conditions_of_the_plan_region(self):
+        _create_condition('foo', 'southern_california')
+
+        params = ForsysGenerationRequestParams()
+        params.region = self.region
+        params.priorities = ['foo']
+        params.priority_weights = [1]
+        params.planning_area = self.geo
+
+        req = HttpRequest()
+        params.db_params = DbRequestParams(req)
+        params.db_params.user = self.user
+        params.db_params.write_to_db = True
+
+        scenario = create_plan_and_scenario(params)
+        weighted_priority = ScenarioWeightedPriority.objects.get(
+            scenario_id=scenario.pk)
+        self.assertEqual(
+            weighted_priority.priority.condition_dataset.region_name,
+            self.region)
+
+    def test_fails_for_missing_condition(self):
+        params = ForsysGenerationRequestParams()
+        params.region = self.region
+        params.priorities = ['foo', 'baz']
+        params.priority_weights = [1, 4]
+        params.planning_area = self.geo
+
+        req = HttpRequest()
+        params.db_params = DbRequestParams(req)
+        params.db_params.user = self.user
+        params.db_params.write_to_db = True
+
+        with self.assertRaises(Exception) as context:
+            create_plan_and_scenario(params)
+        self.assertEqual(
+            str(context.exception),
+            "expected 1 condition for priority, baz, instead, 0 were found")
+        # Nothing is written if any step fails.
+        self.assertEqual(Scenario.objects.count(), 0)
+
 
 class SaveGenerationOutputToDbTest(TestCase):
     def setUp(self):
@@ -130,3 +173,23 @@ class SaveGenerationOutputToDbTest(TestCase):
         self.assertEqual(p2.project_area.project, self.scenario.project)
 
         self.assertEqual(self.scenario.status, Scenario.ScenarioStatus.SUCCESS)
+
+    def test_query_count_does_not_grow_with_projects(self):
+        poly = Polygon(((-120.14015536869722, 39.05413814388948),
+                        (-119.93422142411087, 39.48622140686506),
+                        (-119.93422142411087, 39.05413814388948),
+                        (-120.14015536869722, 39.05413814388948)))
+        poly.srid = settings.DEFAULT_CRS
+
+        def save(num_projects: int) -> int:
+            with CaptureQueriesContext(connection) as context:
+                save_generation_output_to_db(self.scenario, {
+                    'ranked_projects': [
+                        {'id': i, 'total_score': 1.0, 'rank': i + 1,
+                         'geo_wkt': poly.wkt} for i in range(num_projects)]})
+            return len(context.captured_queries)
+
+        self.assertEqual(save(2), save(20))
+        self.assertEqual(
+            RankedProjectArea.objects.filter(
+                scenario_id=self.scenario.pk).count(), 22)
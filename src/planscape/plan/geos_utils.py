@@ -1,4 +1,6 @@
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
+from planscape import settings
 
 _MULTIPOLYGON = 6
 _POLYGON = 3
@@ -15,3 +17,16 @@ def get_multipolygon(geo: GEOSGeometry) -> MultiPolygon:
     
     raise Exception(
         "geometry, %s, is neither a polygon nor a multipolygon" % (geo.wkt))
+
+
+# Returns a geometry in the raster SRS.
+def get_raster_geo(geo: GEOSGeometry) -> GEOSGeometry:
+    if geo.srid == settings.CRS_FOR_RASTERS:
+        return geo
+    transformed_geo = geo.clone()
+    transformed_geo.transform(
+        CoordTransform(
+            SpatialReference(geo.srid),
+            SpatialReference(settings.CRS_9822_PROJ4)))
+    transformed_geo.srid = settings.CRS_FOR_RASTERS
+    return transformed_geo
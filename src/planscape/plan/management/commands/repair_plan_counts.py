@@ -0,0 +1,33 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from plan.models import Plan, get_plans_with_wrong_counts, update_plan_counts
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the project and scenario counts of plans whose '
+            'counts are wrong.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry_run', default=False,
+                            action=argparse.BooleanOptionalAction,
+                            help='Only report plans with wrong counts.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            plans = list(get_plans_with_wrong_counts().values_list(
+                'pk', 'project_count', 'actual_project_count',
+                'scenario_count', 'actual_scenario_count'))
+            for pk, projects, actual_projects, scenarios, actual_scenarios \
+                    in plans:
+                self.stdout.write(
+                    'plan %d: %d projects (expected %d), %d scenarios '
+                    '(expected %d)' % (pk, projects, actual_projects,
+                                       scenarios, actual_scenarios))
+            if not options['dry_run']:
+                update_plan_counts(
+                    Plan.objects.filter(pk__in=[p[0] for p in plans]))
+        self.stdout.write('%d plans with wrong counts%s' % (
+            len(plans), '' if options['dry_run'] else ' repaired'))
@@ -0,0 +1,44 @@
+import argparse
+import time
+
+from django.core.management.base import BaseCommand
+
+from forsys.generation_jobs import (DEFAULT_STALE_AFTER_IN_SECONDS,
+                                    claim_generation_job, run_generation_job)
+from forsys.stage_timer import StageTimer
+from forsys.views import generate_project_areas
+
+
+class Command(BaseCommand):
+    help = ('Runs queued project area generation jobs. Any number of '
+            'instances may run concurrently.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll_interval', nargs='?', type=float,
+                            default=5,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--stale_after', nargs='?', type=float,
+                            default=DEFAULT_STALE_AFTER_IN_SECONDS,
+                            help=('Seconds after which a job that is still '
+                                  'processing is assumed to be abandoned.'))
+        parser.add_argument('--exit_when_empty', default=False,
+                            action=argparse.BooleanOptionalAction,
+                            help=('Exit once the queue is empty rather than '
+                                  'polling.'))
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_generation_job(options['stale_after'])
+            if job is None:
+                if options['exit_when_empty']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write('running generation job %d for scenario %d' %
+                              (job.pk, job.scenario_id))
+            with StageTimer('generation_job'):
+                run_generation_job(job, generate_project_areas)
+            job.refresh_from_db()
+            self.stdout.write('generation job %d: %s' %
+                              (job.pk, job.get_status_display()))
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.3 on 2023-03-20 18:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0022_alter_scenario_project'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('params', models.TextField(default='')),
+                ('status', models.IntegerField(choices=[(0, 'Initialized'), (1, 'Pending'), (2, 'Processing'), (3, 'Success'), (4, 'Failed')], default=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_time', models.DateTimeField(null=True)),
+                ('error', models.TextField(null=True)),
+                ('creation_time', models.DateTimeField(auto_now_add=True, null=True)),
+                ('finished_time', models.DateTimeField(null=True)),
+                ('scenario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.scenario')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='plan_genera_status_b9a915_idx')],
+            },
+        ),
+    ]
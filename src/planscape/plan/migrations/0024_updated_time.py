@@ -0,0 +1,33 @@
+# Generated by Django 4.1.3 on 2023-03-24 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0023_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectarea',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scenario',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
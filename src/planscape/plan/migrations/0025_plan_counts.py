@@ -0,0 +1,40 @@
+# Generated by Django 4.1.3 on 2023-03-27 16:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def compute_plan_counts(apps, schema_editor):
+    Plan = apps.get_model('plan', 'Plan')
+
+    def count_by_plan(model_name):
+        model = apps.get_model('plan', model_name)
+        return Coalesce(Subquery(
+            model.objects.filter(plan=OuterRef('pk')).order_by().values(
+                'plan').annotate(count=Count('pk')).values('count')), 0)
+
+    Plan.objects.update(project_count=count_by_plan('Project'),
+                        scenario_count=count_by_plan('Scenario'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0024_updated_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='project_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='scenario_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(compute_plan_counts,
+                             migrations.RunPython.noop),
+    ]
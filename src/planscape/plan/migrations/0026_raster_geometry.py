@@ -0,0 +1,44 @@
+# Generated by Django 4.1.3 on 2023-03-28 10:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0025_plan_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='geometry_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='raster_geometry',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(null=True, spatial_index=False, srid=9822),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='raster_geometry_valid',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddField(
+            model_name='projectarea',
+            name='geometry_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectarea',
+            name='raster_geometry',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(null=True, spatial_index=False, srid=9822),
+        ),
+        migrations.AddField(
+            model_name='projectarea',
+            name='raster_geometry_valid',
+            field=models.BooleanField(null=True),
+        ),
+    ]
@@ -1,11 +1,81 @@
+import hashlib
 import math
 
 from conditions.models import Condition
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from planscape import settings
 
+from .geos_utils import get_raster_geo
 
-class Plan(models.Model):
+
+class RasterGeometryModel(models.Model):
+    """
+    A model with a geometry that is intersected with rasters.
+    Keeps a copy of the geometry in the raster CRS, and whether that copy is
+    valid, so that raster computations (see conditions.raster_utils) needn't
+    reproject and validate the geometry each time it is read.
+    The copy is refreshed on save whenever the geometry's hash changes.
+    """
+    # The name of the geometry field; set by subclasses.
+    GEOMETRY_FIELD: str
+
+    # The geometry, reprojected to the raster CRS.
+    # It's never queried spatially, so it isn't indexed.
+    raster_geometry = models.MultiPolygonField(
+        srid=settings.CRS_FOR_RASTERS, null=True, spatial_index=False)
+
+    # Whether raster_geometry is valid.
+    raster_geometry_valid: models.BooleanField = models.BooleanField(
+        null=True)
+
+    # The SHA-256 hash of the geometry's EWKB when raster_geometry was
+    # computed.
+    geometry_hash: models.CharField = models.CharField(
+        max_length=64, null=True)
+
+    RASTER_GEOMETRY_FIELDS = [
+        'raster_geometry', 'raster_geometry_valid', 'geometry_hash']
+
+    class Meta:
+        abstract = True
+
+    def update_raster_geometry(self) -> bool:
+        """
+        Recomputes raster_geometry and raster_geometry_valid if the geometry
+        changed since they were computed.
+        Returns whether they were recomputed.
+        This must be called before bulk_create, which skips save.
+        """
+        geo = getattr(self, self.GEOMETRY_FIELD)
+        if geo is None:
+            changed = self.geometry_hash is not None
+            self.raster_geometry = None
+            self.raster_geometry_valid = None
+            self.geometry_hash = None
+            return changed
+        geometry_hash = hashlib.sha256(bytes(geo.ewkb)).hexdigest()
+        if (geometry_hash == self.geometry_hash and
+                self.raster_geometry is not None):
+            return False
+        self.raster_geometry = get_raster_geo(geo)
+        self.raster_geometry_valid = self.raster_geometry.valid
+        self.geometry_hash = geometry_hash
+        return True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self.update_raster_geometry() and update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(
+                self.RASTER_GEOMETRY_FIELDS)
+        super().save(*args, **kwargs)
+
+
+class Plan(RasterGeometryModel):
     """
     A Plan is associated with one owner and one Region.
     It contains a geometry representing the planning area.
@@ -34,6 +104,20 @@ class Plan(models.Model):
     creation_time: models.DateTimeField = models.DateTimeField(
         null=True, auto_now_add=True)
 
+    # The time the plan was last saved, automatically set when the plan is
+    # saved. Used to version responses (see the ETags in plan.views).
+    updated_time: models.DateTimeField = models.DateTimeField(
+        null=True, auto_now=True)
+
+    # The number of projects and scenarios of the plan. These are maintained
+    # when projects and scenarios are saved or deleted, and by bulk deletes
+    # (via update_plan_counts); the repair_plan_counts command recomputes
+    # them.
+    project_count: models.IntegerField = models.IntegerField(default=0)
+    scenario_count: models.IntegerField = models.IntegerField(default=0)
+
+    GEOMETRY_FIELD = 'geometry'
+
 
 class Project(models.Model):
     """
@@ -70,6 +154,27 @@ class Project(models.Model):
     # Ratio of elevation to distance
     max_slope: models.FloatField = models.FloatField(null=True)
 
+    # The time the project was last saved, automatically set when the project
+    # is saved. Used to version responses (see the ETags in plan.views).
+    updated_time: models.DateTimeField = models.DateTimeField(
+        null=True, auto_now=True)
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created:
+                Plan.objects.filter(pk=self.plan_id).update(
+                    project_count=F('project_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        # Deleting a project also deletes its scenarios, so both counts are
+        # recomputed.
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            update_plan_counts(Plan.objects.filter(pk=self.plan_id))
+        return result
+
 
 class ConfigPriority(models.Model):
     # TODO: migrate to Config
@@ -115,6 +220,71 @@ class Scenario(models.Model):
     status = models.IntegerField(
         choices=ScenarioStatus.choices, default=ScenarioStatus.INITIALIZED)
 
+    # The time the scenario was last saved, automatically set when the
+    # scenario is saved. Used to version responses (see the ETags in
+    # plan.views).
+    # Queryset updates (e.g. of status) must set it explicitly.
+    updated_time: models.DateTimeField = models.DateTimeField(
+        null=True, auto_now=True)
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created:
+                Plan.objects.filter(pk=self.plan_id).update(
+                    scenario_count=F('scenario_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Plan.objects.filter(pk=self.plan_id).update(
+                scenario_count=F('scenario_count') - 1)
+        return result
+
+
+class GenerationJob(models.Model):
+    """
+    A GenerationJob queues project area generation for one Scenario.
+    Jobs are claimed and run by the run_generation_jobs management command;
+    job status mirrors the Scenario's status.
+    """
+    scenario = models.ForeignKey(
+        Scenario, on_delete=models.CASCADE)  # type: ignore
+
+    # URL parameters of the request that submitted the job (e.g. cluster
+    # parameters). These are replayed when the job runs.
+    params: models.TextField = models.TextField(default='')
+
+    # One of PENDING, PROCESSING, SUCCESS, or FAILED.
+    status = models.IntegerField(
+        choices=Scenario.ScenarioStatus.choices,
+        default=Scenario.ScenarioStatus.PENDING)
+
+    # The number of times the job has been claimed, and the number of times it
+    # may be claimed before it is marked as failed.
+    attempts: models.IntegerField = models.IntegerField(default=0)
+    max_attempts: models.IntegerField = models.IntegerField(default=3)
+
+    # A pending job isn't claimed before this time; this delays retries.
+    run_after: models.DateTimeField = models.DateTimeField(
+        default=timezone.now)
+
+    # The time the job was last claimed. Jobs left in PROCESSING for too long
+    # (e.g. because their worker crashed) may be claimed again.
+    claimed_time: models.DateTimeField = models.DateTimeField(null=True)
+
+    # The error message of the last failed attempt.
+    error: models.TextField = models.TextField(null=True)
+
+    creation_time: models.DateTimeField = models.DateTimeField(
+        null=True, auto_now_add=True)
+
+    finished_time: models.DateTimeField = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
 
 class ScenarioWeightedPriority(models.Model):
     """
@@ -129,7 +299,7 @@ class ScenarioWeightedPriority(models.Model):
     weight: models.IntegerField = models.IntegerField(null=True)
 
 
-class ProjectArea(models.Model):
+class ProjectArea(RasterGeometryModel):
     """
     ProjectAreas are associated with one owner and one Project. 
     Each ProjectArea has geometries representing the project area.
@@ -150,6 +320,14 @@ class ProjectArea(models.Model):
     estimated_area_treated: models.IntegerField = models.IntegerField(
         null=True)
 
+    # The time the project area was last saved, automatically set when the
+    # project area is saved. Used to version responses (see the ETags in
+    # plan.views).
+    updated_time: models.DateTimeField = models.DateTimeField(
+        null=True, auto_now=True)
+
+    GEOMETRY_FIELD = 'project_area'
+
 
 class RankedProjectArea(models.Model):
     """
@@ -187,3 +365,38 @@ class ConditionScores(models.Model):
     mean_score = models.FloatField(null=True)
     sum = models.FloatField(null=True)
     count = models.IntegerField(null=True)
+
+
+def _count_by_plan(model) -> Coalesce:
+    """Returns an expression counting a plan's rows of model."""
+    return Coalesce(Subquery(
+        model.objects.filter(plan=OuterRef('pk')).order_by().values(
+            'plan').annotate(count=Count('pk')).values('count')), 0)
+
+
+def update_plan_counts(plans: QuerySet) -> int:
+    """
+    Recomputes the project and scenario counts of plans with one query.
+    Returns the number of plans updated.
+    """
+    return plans.update(project_count=_count_by_plan(Project),
+                        scenario_count=_count_by_plan(Scenario))
+
+
+def get_plans_with_wrong_counts() -> QuerySet:
+    """Returns plans whose project or scenario counts are wrong."""
+    return Plan.objects.annotate(
+        actual_project_count=_count_by_plan(Project),
+        actual_scenario_count=_count_by_plan(Scenario)).exclude(
+        project_count=F('actual_project_count'),
+        scenario_count=F('actual_scenario_count'))
+
+
+def update_raster_geometries(objects: list) -> list:
+    """
+    Updates the raster geometries of RasterGeometryModel objects, e.g. before
+    they are bulk created, and returns the objects.
+    """
+    for obj in objects:
+        obj.update_raster_geometry()
+    return objects
@@ -1,15 +1,17 @@
+from base.geometry_encoder import EncodedGeometryField
 from conditions.models import BaseCondition, Condition
 from rest_framework import serializers
 from rest_framework.serializers import IntegerField
 from rest_framework_gis import serializers as gis_serializers
 
-from .models import (Plan, Project, ProjectArea, Scenario,
-                     ScenarioWeightedPriority)
+from .models import (Plan, Project, ProjectArea, RasterGeometryModel,
+                     Scenario, ScenarioWeightedPriority)
 
 
 class PlanSerializer(gis_serializers.GeoFeatureModelSerializer):
-    projects = IntegerField(read_only=True, required=False)
-    scenarios = IntegerField(read_only=True, required=False)
+    projects = IntegerField(source='project_count', read_only=True)
+    scenarios = IntegerField(source='scenario_count', read_only=True)
+    geometry = EncodedGeometryField(required=False, allow_null=True)
 
     class Meta:
         fields = ("id", "owner", "name", "region_name", "public",
@@ -18,6 +20,16 @@ class PlanSerializer(gis_serializers.GeoFeatureModelSerializer):
         geo_field = "geometry"
 
 
+class PlanSummarySerializer(serializers.ModelSerializer):
+    """Serializes a Plan's PlanSerializer properties, without its geometry."""
+    projects = IntegerField(source='project_count', read_only=True)
+    scenarios = IntegerField(source='scenario_count', read_only=True)
+
+    class Meta:
+        fields = PlanSerializer.Meta.fields
+        model = Plan
+
+
 class ConditionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Condition
@@ -43,7 +55,10 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class ProjectAreaSerializer(gis_serializers.GeoFeatureModelSerializer):
+    project_area = EncodedGeometryField(required=False, allow_null=True)
+
     class Meta:
         model = ProjectArea
-        fields = '__all__'
+        # The raster geometry is only used internally.
+        exclude = RasterGeometryModel.RASTER_GEOMETRY_FIELDS
         geo_field = "project_area"
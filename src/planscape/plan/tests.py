@@ -1,17 +1,21 @@
 import datetime
 import json
+from io import StringIO
 
 from base.condition_types import ConditionLevel, ConditionScoreType
 from conditions.models import BaseCondition, Condition, ConditionRaster
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
+from django.core.management import call_command
 from django.db import connection
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from planscape import settings
 
-from .models import (ConditionScores, Plan, Project, ProjectArea, Scenario,
-                     ScenarioWeightedPriority)
+from .geos_utils import get_raster_geo
+from .models import (ConditionScores, Plan, Project, ProjectArea,
+                     RankedProjectArea, Scenario, ScenarioWeightedPriority)
 
 
 class CreatePlanTest(TransactionTestCase):
@@ -231,6 +235,51 @@ class DeletePlanTest(TransactionTestCase):
         self.assertEqual(Project.objects.count(), 1)
         self.assertEqual(Scenario.objects.count(), 0)
 
+    def _add_project_areas(self, plan: Plan, num_project_areas: int,
+                           condition: Condition):
+        ConditionScores.objects.create(plan=plan, condition=condition)
+        for project in plan.project_set.all():
+            project.priorities.add(condition)
+            for scenario in project.scenario_set.all():
+                ScenarioWeightedPriority.objects.create(
+                    scenario=scenario, priority=condition, weight=1)
+            for i in range(num_project_areas):
+                project_area = ProjectArea.objects.create(
+                    owner=plan.owner, project=project)
+                ConditionScores.objects.create(
+                    project_area=project_area, condition=condition)
+                for scenario in project.scenario_set.all():
+                    RankedProjectArea.objects.create(
+                        scenario=scenario, project_area=project_area,
+                        rank=i + 1, weighted_score=1)
+
+    def test_delete_plan_query_count_is_flat(self):
+        self.client.force_login(self.user)
+        base_condition = BaseCondition.objects.create(
+            condition_name='foo', condition_level=ConditionLevel.METRIC)
+        condition = Condition.objects.create(
+            condition_dataset=base_condition,
+            condition_score_type=ConditionScoreType.CURRENT)
+        self._add_project_areas(self.plan2, 1, condition)
+        self._add_project_areas(self.plan3, 10, condition)
+
+        num_queries = []
+        for plan in (self.plan2, self.plan3):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    reverse('plan:delete'), {'id': plan.pk},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            num_queries.append(len(context.captured_queries))
+        self.assertEqual(num_queries[0], num_queries[1])
+
+        self.assertEqual(Plan.objects.count(), 1)
+        self.assertEqual(ProjectArea.objects.count(), 0)
+        self.assertEqual(RankedProjectArea.objects.count(), 0)
+        self.assertEqual(ConditionScores.objects.count(), 0)
+        self.assertEqual(ScenarioWeightedPriority.objects.count(), 0)
+        self.assertEqual(Condition.objects.count(), 1)
+
 
 class GetPlanTest(TransactionTestCase):
     def setUp(self):
@@ -280,6 +329,45 @@ class GetPlanTest(TransactionTestCase):
             round(datetime.datetime.now().timestamp()))
         self.assertEqual(response.json()['region_name'], 'Sierra Nevada')
 
+    def test_get_plan_as_topojson(self):
+        response = self.client.get(
+            reverse('plan:get_plan'),
+            {'id': self.plan_no_user.pk, 'geometry_format': 'topojson'},
+            content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        geometry = response.json()['geometry']
+        self.assertEqual(geometry['type'], 'Topology')
+        self.assertEqual(
+            geometry['objects']['geometry']['type'], 'MultiPolygon')
+        self.assertEqual(len(geometry['arcs']), 1)
+
+    def test_get_plan_not_modified(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('plan:get_plan'), {'id': self.plan_with_user.pk})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.get(
+            reverse('plan:get_plan'), {'id': self.plan_with_user.pk},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # The response includes the number of projects.
+        Project.objects.create(owner=self.user, plan=self.plan_with_user)
+        response = self.client.get(
+            reverse('plan:get_plan'), {'id': self.plan_with_user.pk},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['projects'], 1)
+
+    def test_get_plan_bad_geometry_params(self):
+        response = self.client.get(
+            reverse('plan:get_plan'),
+            {'id': self.plan_no_user.pk, 'precision': -1},
+            content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
     def test_get_plan_bad_stored_region(self):
         self.client.force_login(self.user)
         plan = Plan.objects.create(
@@ -297,6 +385,117 @@ class GetPlanTest(TransactionTestCase):
         self.assertEqual(response.json()['region_name'], None)
 
 
+class PlanCountsTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.plan = create_plan(self.user, 'plan', None, [2, 1])
+
+    def _assert_counts(self, projects: int, scenarios: int):
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.project_count, projects)
+        self.assertEqual(self.plan.scenario_count, scenarios)
+
+    def test_counts_are_maintained(self):
+        self._assert_counts(2, 3)
+        project = Project.objects.create(owner=self.user, plan=self.plan)
+        scenario = Scenario.objects.create(
+            owner=self.user, plan=self.plan, project=project)
+        self._assert_counts(3, 4)
+
+        # Saving existing objects doesn't change counts.
+        scenario.notes = 'note'
+        scenario.save()
+        self._assert_counts(3, 4)
+
+        scenario.delete()
+        self._assert_counts(3, 3)
+        Project.objects.filter(plan=self.plan).first().delete()
+        self._assert_counts(2, 1)
+
+    def test_bulk_deletes_update_counts(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('plan:delete_projects'),
+            {'project_ids': [Project.objects.filter(
+                plan=self.plan).first().pk]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self._assert_counts(1, 1)
+
+    def test_repair_plan_counts(self):
+        Plan.objects.filter(pk=self.plan.pk).update(
+            project_count=0, scenario_count=10)
+        out = StringIO()
+        call_command('repair_plan_counts', '--dry_run', stdout=out)
+        self.assertIn('1 plans with wrong counts', out.getvalue())
+        self._assert_counts(0, 10)
+
+        call_command('repair_plan_counts', stdout=StringIO())
+        self._assert_counts(2, 3)
+
+
+class RasterGeometryTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.geometry = MultiPolygon(Polygon(
+            ((-120, 40), (-120, 41), (-121, 41), (-121, 40), (-120, 40))))
+        self.geometry.srid = 4269
+
+    def test_plan_stores_raster_geometry(self):
+        plan = create_plan(self.user, 'plan', self.geometry, [])
+        plan.refresh_from_db()
+        self.assertEqual(plan.raster_geometry.srid, settings.CRS_FOR_RASTERS)
+        self.assertTrue(plan.raster_geometry_valid)
+        self.assertIsNotNone(plan.geometry_hash)
+
+        # Saving an unchanged geometry doesn't recompute the raster geometry.
+        self.assertFalse(plan.update_raster_geometry())
+
+        geometry_hash = plan.geometry_hash
+        plan.geometry = MultiPolygon(Polygon(
+            ((-120, 40), (-120, 42), (-121, 42), (-121, 40), (-120, 40))),
+            srid=4269)
+        plan.save(update_fields=['geometry'])
+        plan.refresh_from_db()
+        self.assertNotEqual(plan.geometry_hash, geometry_hash)
+        self.assertAlmostEqual(plan.raster_geometry.area,
+                               get_raster_geo(plan.geometry).area)
+
+        plan.geometry = None
+        plan.save()
+        plan.refresh_from_db()
+        self.assertIsNone(plan.raster_geometry)
+        self.assertIsNone(plan.raster_geometry_valid)
+
+    def test_bulk_created_project_areas_store_raster_geometry(self):
+        plan = create_plan(self.user, 'plan', self.geometry, [0])
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('plan:create_project_areas_for_project'),
+            {'project_id': Project.objects.get(plan=plan).pk,
+             'geometries': [{'features': [{'geometry': json.loads(
+                 self.geometry.json)}]}]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        area = ProjectArea.objects.get(pk=response.json()[0])
+        self.assertEqual(area.raster_geometry.srid, settings.CRS_FOR_RASTERS)
+        self.assertTrue(area.raster_geometry_valid)
+
+    def test_project_area_response_omits_raster_geometry(self):
+        plan = create_plan(self.user, 'plan', self.geometry, [0])
+        project = Project.objects.get(plan=plan)
+        ProjectArea.objects.create(
+            owner=self.user, project=project, project_area=self.geometry)
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('plan:get_project_areas'), {'project_id': project.pk},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        for area in response.json().values():
+            self.assertNotIn('raster_geometry', area['properties'])
+            self.assertNotIn('geometry_hash', area['properties'])
+
+
 class ListPlansTest(TransactionTestCase):
     def setUp(self):
         self.user = User.objects.create(username='testuser')
@@ -345,6 +544,47 @@ class ListPlansTest(TransactionTestCase):
             else:
                 self.assertTrue(False)
 
+    def test_list_plans_by_owner_in_pages(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('plan:list_plans_by_owner'), {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([p['name'] for p in response.json()], ['plan3'])
+        self.assertEqual(response.json()[0]['scenarios'], 1)
+        next_page = response.headers['Link'].split(';')[0].strip('<>')
+
+        response = self.client.get(next_page)
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([p['name'] for p in response.json()], ['plan4'])
+        self.assertEqual(response.json()[0]['projects'], 2)
+        self.assertEqual(response.json()[0]['scenarios'], 3)
+        self.assertFalse(response.has_header('Link'))
+
+    def test_list_plans_by_owner_bad_limit(self):
+        response = self.client.get(
+            reverse('plan:list_plans_by_owner'), {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_plans_by_owner_with_geometry(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('plan:list_plans_by_owner'), {'include_geometry': 'true'})
+        self.assertEqual(response.status_code, 200)
+        for plan in response.json():
+            self.assertEqual(plan['geometry'], self.geometry)
+
+    def test_list_plans_by_owner_query_count_is_flat(self):
+        self.client.force_login(self.user)
+        num_queries = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(
+                    reverse('plan:list_plans_by_owner'), {})
+            self.assertEqual(response.status_code, 200)
+            num_queries.append(len(context.captured_queries))
+            create_plan(self.user, 'another_plan', None, [1, 1])
+        self.assertEqual(num_queries[0], num_queries[1])
+
     def test_list_plans_by_owner_with_user(self):
         response = self.client.get(
             reverse('plan:list_plans_by_owner'),
@@ -1432,6 +1672,40 @@ class GetScenarioTest(TransactionTestCase):
             self.project_area.pk)]['properties']['estimated_area_treated'], 200)
         self.assertEqual(scenario['config']['max_budget'], 100)
 
+    def test_get_scenario_not_modified(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('plan:get_scenario'), {'id': self.scenario.pk})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.get(
+            reverse('plan:get_scenario'), {'id': self.scenario.pk},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Query parameters change the response, and so the ETag.
+        response = self.client.get(
+            reverse('plan:get_scenario'),
+            {'id': self.scenario.pk, 'precision': 2},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # So do changes to the scenario's project areas.
+        self.project_area.estimated_area_treated = 300
+        self.project_area.save()
+        response = self.client.get(
+            reverse('plan:get_scenario'), {'id': self.scenario.pk},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_scenario_not_owned_has_no_etag(self):
+        response = self.client.get(
+            reverse('plan:get_scenario'), {'id': self.scenario.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
 
 class ListScenariosTest(TransactionTestCase):
     def setUp(self):
@@ -1517,6 +1791,37 @@ class ListScenariosTest(TransactionTestCase):
             self.project_area.pk)]['properties']['estimated_area_treated'], 200)
         self.assertEqual(scenario2['config']['max_budget'], 100)
 
+    def test_list_scenario_query_count_is_flat(self):
+        self.client.force_login(self.user)
+
+        def count_queries() -> int:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(
+                    reverse('plan:list_scenarios_for_plan'),
+                    {'plan_id': self.plan.pk},
+                    content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            # Project areas' raster geometries aren't read.
+            for query in context.captured_queries:
+                self.assertNotIn('"plan_projectarea"."raster_geometry"',
+                                 query['sql'])
+            return len(context.captured_queries)
+
+        num_queries = count_queries()
+        for i in range(5):
+            project = Project.objects.create(owner=self.user, plan=self.plan)
+            project.priorities.add(self.condition1, self.condition2)
+            ProjectArea.objects.create(
+                owner=self.user, project=project,
+                project_area=self.project_area.project_area)
+            scenario = Scenario.objects.create(
+                owner=self.user, plan=self.plan, project=project)
+            ScenarioWeightedPriority.objects.create(
+                scenario=scenario, priority=self.condition1, weight=1)
+            ScenarioWeightedPriority.objects.create(
+                scenario=scenario, priority=self.condition2, weight=1)
+        self.assertEqual(count_queries(), num_queries)
+
 
 class DeleteScenariosTest(TransactionTestCase):
     def setUp(self):
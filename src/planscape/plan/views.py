@@ -1,23 +1,29 @@
 import datetime
+import hashlib
 import json
 
 import boto3
-from base.condition_types import ConditionScoreType
+from base.geometry_encoder import (GEOMETRY_ENCODER_CONTEXT_KEY,
+                                   GeometryEncoder)
 from base.region_name import display_name_to_region, region_to_display_name
-from conditions.models import BaseCondition, Condition
+from conditions.catalog import get_condition_name, get_priority_condition
 from conditions.raster_utils import fetch_or_compute_condition_stats
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q
 from django.db.models.query import QuerySet
 from django.http import (HttpRequest, HttpResponse, HttpResponseBadRequest,
                          JsonResponse, QueryDict)
 from django.views.decorators.csrf import csrf_exempt
-from plan.models import (Plan, Project, ProjectArea, Scenario,
-                         ScenarioWeightedPriority)
-from plan.serializers import (PlanSerializer, ProjectAreaSerializer,
-                              ProjectSerializer, ScenarioSerializer,
-                              ScenarioWeightedPrioritySerializer)
+from django.views.decorators.http import condition
+from plan.models import (ConditionScores, ConfigPriority, GenerationJob,
+                         Plan, Project, ProjectArea, RankedProjectArea,
+                         Scenario, ScenarioWeightedPriority,
+                         update_plan_counts, update_raster_geometries)
+from plan.serializers import (PlanSerializer, PlanSummarySerializer,
+                              ProjectAreaSerializer, ProjectSerializer,
+                              ScenarioSerializer)
 from planscape import settings
 
 # TODO: remove csrf_exempt decorators when logged in users are required.
@@ -29,6 +35,9 @@ MAX_ROAD_DIST = 'max_road_distance'
 MAX_SLOPE = 'max_slope'
 PRIORITIES = 'priorities'
 
+# The maximum page size of list_plans_by_owner.
+MAX_PLANS_PAGE_SIZE = 200
+
 
 def get_user(request: HttpRequest) -> User:
     user = None
@@ -52,14 +61,107 @@ def get_scenario_by_id(
     return scenario
 
 
+def _get_etag(request: HttpRequest, user: User | None, version) -> str:
+    """
+    Returns a strong ETag for a GET response, given the version of the objects
+    it is built from (e.g. their updated_time fields and counts).
+    The path, user, and query parameters are part of the ETag, since query
+    parameters (e.g. geometry encoding) change the response.
+    """
+    return hashlib.sha256(repr((
+        request.path, None if user is None else user.pk,
+        sorted(request.GET.lists()), version)).encode()).hexdigest()
+
+
+def _get_plan_etag(request: HttpRequest) -> str | None:
+    """
+    Returns the ETag of get_plan, from one query that doesn't load the plan's
+    geometry. Returns None (i.e. no ETag) if the request would fail.
+    """
+    try:
+        user = get_user(request)
+        GeometryEncoder.from_params(request.GET)
+        version = Plan.objects.filter(
+            pk=int(request.GET['id']), owner=user).values_list(
+            'updated_time', 'project_count', 'scenario_count').get()
+    except Exception:
+        return None
+    return _get_etag(request, user, version)
+
+
+def _get_project_areas_etag(request: HttpRequest) -> str | None:
+    """
+    Returns the ETag of get_project_areas; see _get_plan_etag.
+    Project areas are versioned by their count and latest updated_time.
+    """
+    try:
+        user = get_user(request)
+        GeometryEncoder.from_params(request.GET)
+        version = Project.objects.filter(
+            pk=int(request.GET['project_id']), owner=user).annotate(
+            project_areas=Count('projectarea'),
+            project_areas_updated_time=Max(
+                'projectarea__updated_time')).values_list(
+            'project_areas', 'project_areas_updated_time').get()
+    except Exception:
+        return None
+    return _get_etag(request, user, version)
+
+
+def _get_scenario_etag(request: HttpRequest) -> str | None:
+    """
+    Returns the ETag of get_scenario; see _get_plan_etag.
+    A scenario's response also depends on its project and project areas.
+    """
+    try:
+        user = get_user(request)
+        GeometryEncoder.from_params(request.GET)
+        version = Scenario.objects.filter(
+            pk=int(request.GET['id']), owner=user).annotate(
+            project_areas=Count('project__projectarea'),
+            project_areas_updated_time=Max(
+                'project__projectarea__updated_time')).values_list(
+            'updated_time', 'project__updated_time', 'project_areas',
+            'project_areas_updated_time').get()
+    except Exception:
+        return None
+    return _get_etag(request, user, version)
+
+
+def _get_scenarios_for_plan_etag(request: HttpRequest) -> str | None:
+    """
+    Returns the ETag of list_scenarios_for_plan; see _get_plan_etag.
+    The user's scenarios in the plan, their projects, and their project areas
+    are versioned by their counts and latest updated_time.
+    """
+    try:
+        user = get_user(request)
+        owned = Q(scenario__owner=user)
+        version = Plan.objects.filter(
+            pk=int(request.GET['plan_id']), owner=user).annotate(
+            scenarios=Count('scenario', filter=owned, distinct=True),
+            scenarios_updated_time=Max(
+                'scenario__updated_time', filter=owned),
+            projects_updated_time=Max(
+                'scenario__project__updated_time', filter=owned),
+            project_areas=Count(
+                'scenario__project__projectarea', filter=owned,
+                distinct=True),
+            project_areas_updated_time=Max(
+                'scenario__project__projectarea__updated_time',
+                filter=owned)).values_list(
+            'scenarios', 'scenarios_updated_time', 'projects_updated_time',
+            'project_areas', 'project_areas_updated_time').get()
+    except Exception:
+        return None
+    return _get_etag(request, user, version)
+
+
 def get_plan_by_id(user, id_url_param: str, params: QueryDict):
     assert isinstance(params[id_url_param], str)
     plan_id = params.get(id_url_param, "0")
 
-    plan = Plan.objects.annotate(
-        projects=Count('project', distinct=True)).annotate(
-        scenarios=Count('project__scenario')).get(
-        id=int(plan_id))
+    plan = Plan.objects.get(id=int(plan_id))
     if plan.owner != user:
         raise ValueError("You do not have permission to view this plan.")
     return plan
@@ -127,6 +229,66 @@ def _convert_polygon_to_multipolygon(geometry: dict):
     return actual_geometry
 
 
+def _check_owner(objects: QuerySet, owner_id: int | None,
+                 num_expected: int | None, message: str):
+    """
+    Checks, in one query, that every object in objects is owned by owner_id
+    (None for ownerless objects). If num_expected is set, also checks that
+    objects contains that many objects.
+    Raises a ValueError with the given message if an object isn't owned.
+    """
+    counts = objects.aggregate(
+        found=Count('pk'), owned=Count('pk', filter=Q(owner_id=owner_id)))
+    if num_expected is not None and counts['found'] != num_expected:
+        raise ValueError(
+            "Expected %d objects, but only %d exist" %
+            (num_expected, counts['found']))
+    if counts['owned'] != counts['found']:
+        raise ValueError(message)
+
+
+def _delete_scenarios(scenarios: QuerySet):
+    """
+    Deletes scenarios and the rows that cascade from them.
+    Each dependent table is cleared with a single DELETE filtered on a
+    subquery, rather than by collecting and deleting objects one at a time.
+    Plan project and scenario counts are recomputed afterwards.
+    Callers should run this in a transaction.
+    """
+    plan_ids = list(scenarios.values_list('plan_id', flat=True).distinct())
+    for model in (RankedProjectArea, ScenarioWeightedPriority, GenerationJob):
+        model.objects.filter(scenario__in=scenarios).delete()
+    scenarios.delete()
+    update_plan_counts(Plan.objects.filter(pk__in=plan_ids))
+
+
+def _delete_projects(projects: QuerySet):
+    """
+    Deletes projects, their scenarios and project areas, and the rows that
+    cascade from them; see _delete_scenarios.
+    """
+    plan_ids = list(projects.values_list('plan_id', flat=True).distinct())
+    _delete_scenarios(Scenario.objects.filter(project__in=projects))
+    project_areas = ProjectArea.objects.filter(project__in=projects)
+    for model in (RankedProjectArea, ConditionScores):
+        model.objects.filter(project_area__in=project_areas).delete()
+    project_areas.delete()
+    ConfigPriority.objects.filter(project__in=projects).delete()
+    projects.delete()
+    update_plan_counts(Plan.objects.filter(pk__in=plan_ids))
+
+
+def _delete_plans(plans: QuerySet):
+    """
+    Deletes plans, their projects and scenarios, and the rows that cascade
+    from them; see _delete_scenarios.
+    """
+    _delete_scenarios(Scenario.objects.filter(plan__in=plans))
+    _delete_projects(Project.objects.filter(plan__in=plans))
+    ConditionScores.objects.filter(plan__in=plans).delete()
+    plans.delete()
+
+
 @csrf_exempt
 def delete(request: HttpRequest) -> HttpResponse:
     try:
@@ -150,14 +312,11 @@ def delete(request: HttpRequest) -> HttpResponse:
         # Get the plans, and if the user is logged in, make sure either
         # 1. the plan owner and the owner are both None, or
         # 2. the plan owner and the owner are both not None, and are equal.
-        plans = Plan.objects.filter(pk__in=plan_ids)
-        for plan in plans:
-            plan_owner_id = None if plan.owner is None else plan.owner.pk
-            if owner_id != plan_owner_id:
-                raise ValueError(
-                    "Cannot delete plan; plan is not owned by user")
-        for plan in plans:
-            plan.delete()
+        # IDs of plans that don't exist are ignored.
+        _check_owner(Plan.objects.filter(pk__in=plan_ids), owner_id, None,
+                     "Cannot delete plan; plan is not owned by user")
+        with transaction.atomic():
+            _delete_plans(Plan.objects.filter(pk__in=plan_ids))
         response_data = {'id': plan_ids}
         return HttpResponse(
             json.dumps(response_data),
@@ -166,43 +325,70 @@ def delete(request: HttpRequest) -> HttpResponse:
         return HttpResponseBadRequest("Error in delete: " + str(e))
 
 
-def _serialize_plan(plan: Plan, add_geometry: bool) -> dict:
+def _get_serializer_context(encoder: GeometryEncoder | None) -> dict:
+    return {GEOMETRY_ENCODER_CONTEXT_KEY: encoder}
+
+
+def _serialize_plan(plan: Plan, add_geometry: bool,
+                    encoder: GeometryEncoder | None = None) -> dict:
     """
     Serializes a Plan into a dictionary.
     1. Converts the Plan to a dictionary with fields 'id', 'geometry', and 'properties'
        (the latter of which is a dictionary).
+       If the geometry isn't requested, it isn't read, so it may be deferred.
     2. Creates the partial result from the properties and 'id' fields.
     3. Replaces 'creation_time' with a Posix timestamp.
-    4. Adds the 'geometry' if requested.
+    4. Adds the 'geometry' if requested, encoded by the encoder, if any
+       (see base.geometry_encoder).
     5. Replaces the internal region_name with the display version.
     """
-    data = PlanSerializer(plan).data
-    result = data['properties']
-    result['id'] = data['id']
+    if add_geometry:
+        data = PlanSerializer(
+            plan, context=_get_serializer_context(encoder)).data
+        result = data['properties']
+        result['id'] = data['id']
+    else:
+        data = PlanSummarySerializer(plan).data
+        result = dict(data)
     if 'creation_time' in result:
         result['creation_timestamp'] = round(datetime.datetime.fromisoformat(
             result['creation_time'].replace('Z', '+00:00')).timestamp())
         del result['creation_time']
     if 'geometry' in data and add_geometry:
         result['geometry'] = data['geometry']
+        if encoder is not None and encoder.is_topojson and \
+                data['geometry'] is not None:
+            result['geometry'] = encoder.encode_topology(
+                {'geometry': data['geometry']})
     if 'region_name' in result:
         result['region_name'] = region_to_display_name(result['region_name'])
     return result
 
 
+@condition(etag_func=_get_plan_etag)
 def get_plan(request: HttpRequest) -> HttpResponse:
     try:
         user = get_user(request)
+        encoder = GeometryEncoder.from_params(request.GET)
 
         return JsonResponse(
             _serialize_plan(
                 get_plan_by_id(user, 'id', request.GET),
-                True))
+                True, encoder))
     except Exception as e:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
 
 def list_plans_by_owner(request: HttpRequest) -> HttpResponse:
+    """
+    Lists plans of an owner, in order of ID.
+    Optional URL parameters:
+      limit: the page size, up to MAX_PLANS_PAGE_SIZE. If more plans remain,
+        the response's Link header points to the next page.
+      after: the ID of the last plan of the previous page.
+      include_geometry: if true, plan geometries are included (and may be
+        encoded, see base.geometry_encoder); otherwise, they aren't loaded.
+    """
     try:
         owner_id = None
         owner_str = request.GET.get('owner')
@@ -210,12 +396,42 @@ def list_plans_by_owner(request: HttpRequest) -> HttpResponse:
             owner_id = int(owner_str)
         elif request.user.is_authenticated:
             owner_id = request.user.pk
-        plans = (Plan.objects.filter(owner=owner_id)
-                 .annotate(projects=Count('project', distinct=True))
-                 .annotate(scenarios=Count('project__scenario')))
-        return JsonResponse(
-            [_serialize_plan(plan, False) for plan in plans],
+        include_geometry = request.GET.get(
+            'include_geometry', 'false').lower() in ('true', '1')
+        encoder = GeometryEncoder.from_params(
+            request.GET) if include_geometry else None
+
+        plans = Plan.objects.filter(owner=owner_id).order_by('id').defer(
+            *Plan.RASTER_GEOMETRY_FIELDS)
+        if not include_geometry:
+            plans = plans.defer('geometry')
+        after = request.GET.get('after', None)
+        if after is not None:
+            plans = plans.filter(id__gt=int(after))
+
+        has_next_page = False
+        limit = request.GET.get('limit', None)
+        if limit is None:
+            plans = list(plans)
+        else:
+            limit = int(limit)
+            if limit <= 0 or limit > MAX_PLANS_PAGE_SIZE:
+                raise ValueError(
+                    "limit must be in [1, %d]" % MAX_PLANS_PAGE_SIZE)
+            plans = list(plans[:limit + 1])
+            has_next_page = len(plans) > limit
+            plans = plans[:limit]
+
+        response = JsonResponse(
+            [_serialize_plan(plan, include_geometry, encoder)
+             for plan in plans],
             safe=False)
+        if has_next_page:
+            params = request.GET.copy()
+            params['after'] = str(plans[-1].pk)
+            response['Link'] = '<%s?%s>; rel="next"' % (
+                request.path, params.urlencode())
+        return response
     except Exception as e:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
@@ -254,14 +470,10 @@ def _set_project_parameters(
 
 def _set_priorities(priorities, project: Project):
     if priorities is not None:
-        for i in range(len(priorities)):
-            base_condition = BaseCondition.objects.get(
-                condition_name=priorities[i])
-            # is_raw=False required because for metrics, we store both current raw and current normalized data.
-            condition = Condition.objects.get(
-                condition_dataset=base_condition,
-                condition_score_type=ConditionScoreType.CURRENT, is_raw=False)
-            project.priorities.add(condition)
+        # Priorities are current, normalized (is_raw=False) conditions; for
+        # metrics, we store both current raw and current normalized data.
+        project.priorities.add(
+            *[get_priority_condition(p) for p in priorities])
 
 
 @csrf_exempt
@@ -365,7 +577,8 @@ def list_projects_for_plan(request: HttpRequest) -> HttpResponse:
             raise ValueError("Plan with id " +
                              str(plan_id) + " does not exist")
 
-        projects = Project.objects.filter(owner=user, plan=int(plan_id))
+        projects = Project.objects.filter(
+            owner=user, plan=int(plan_id)).prefetch_related('priorities')
 
         return JsonResponse([_serialize_project(project)
                              for project in projects],
@@ -388,6 +601,8 @@ def _serialize_project(project: Project) -> dict:
     Serializes a Project into a dictionary.
     1. Replaces 'creation_time' with a Posix timestamp.
     2. Replaces the priority IDs with the condition name.
+    Condition names are looked up in the condition catalog (see
+    conditions.catalog).
     """
     result = ProjectSerializer(project).data
     if 'creation_time' in result and result['creation_time'] is not None:
@@ -395,8 +610,8 @@ def _serialize_project(project: Project) -> dict:
             result['creation_time'].replace('Z', '+00:00')).timestamp())
         del result['creation_time']
     if 'priorities' in result:
-        result['priorities'] = [Condition.objects.get(
-            pk=priority).condition_dataset.condition_name for priority in result['priorities']]
+        result['priorities'] = [get_condition_name(priority)
+                                for priority in result['priorities']]
     return result
 
 
@@ -411,17 +626,14 @@ def delete_projects(request: HttpRequest) -> HttpResponse:
         if project_ids is None or not (isinstance(project_ids, list)):
             raise ValueError("Must specify project_ids as a list")
 
-        projects = [Project.objects.get(id=project_id)
-                    for project_id in project_ids]
-
-        # Check that the user owns the projects
-        for project in projects:
-            if project.owner != owner:
-                raise ValueError(
-                    "You do not have permission to delete one or more of these projects.")
+        # Check that the projects exist and that the user owns them.
+        _check_owner(
+            Project.objects.filter(pk__in=project_ids),
+            None if owner is None else owner.pk, len(set(project_ids)),
+            "You do not have permission to delete one or more of these projects.")
 
-        for project in projects:
-            project.delete()
+        with transaction.atomic():
+            _delete_projects(Project.objects.filter(pk__in=project_ids))
 
         response_data = project_ids
         return HttpResponse(
@@ -511,31 +723,45 @@ def create_project_areas_for_project(request: HttpRequest) -> HttpResponse:
             polygon = _convert_polygon_to_multipolygon(geometry)
             polygons.append(polygon)
 
-        project_areas = ProjectArea.objects.bulk_create([ProjectArea(**{
-            'owner': owner,
-            'project': project,
-            'project_area': p})
-            for p in polygons])
+        project_areas = ProjectArea.objects.bulk_create(
+            update_raster_geometries([ProjectArea(**{
+                'owner': owner,
+                'project': project,
+                'project_area': p})
+                for p in polygons]))
 
         return JsonResponse([area.pk for area in project_areas], safe=False)
     except Exception as e:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
 
-def _serialize_project_areas(areas: QuerySet):
+def _serialize_project_areas(areas: QuerySet,
+                             encoder: GeometryEncoder | None = None):
+    """
+    Serializes project areas into a dictionary of GeoJSON features by ID,
+    encoding geometries with the encoder, if any. For TopoJSON output, the
+    dictionary is a topology with a named object per project area.
+    """
+    context = _get_serializer_context(encoder)
     response = {}
     for area in areas:
-        data = ProjectAreaSerializer(area).data
+        data = ProjectAreaSerializer(area, context=context).data
         response[data['id']] = data
+    if encoder is not None and encoder.is_topojson:
+        return encoder.encode_topology(
+            {str(id): data for id, data in response.items()})
     return response
 
 
+@condition(etag_func=_get_project_areas_etag)
 def get_project_areas(request: HttpRequest) -> HttpResponse:
     try:
         user = get_user(request)
         project = get_project_by_id(user, 'project_id', request.GET)
-        project_areas = ProjectArea.objects.filter(project=project.pk)
-        response = _serialize_project_areas(project_areas)
+        project_areas = ProjectArea.objects.filter(
+            project=project.pk).defer(*ProjectArea.RASTER_GEOMETRY_FIELDS)
+        response = _serialize_project_areas(
+            project_areas, GeometryEncoder.from_params(request.GET))
         return JsonResponse(response)
     except Exception as e:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
@@ -544,16 +770,13 @@ def get_project_areas(request: HttpRequest) -> HttpResponse:
 def _set_scenario_metadata(priorities, weights, notes, scenario: Scenario):
     scenario.notes = notes if notes else None
 
-    for i in range(len(priorities)):
-        base_condition = BaseCondition.objects.get(
-            condition_name=priorities[i])
-        # is_raw=False required because for metrics, we store both current raw and current normalized data.
-        condition = Condition.objects.get(
-            condition_dataset=base_condition,
-            condition_score_type=ConditionScoreType.CURRENT, is_raw=False)
-        weight = weights[i] if weights is not None else None
-        weighted_pri = ScenarioWeightedPriority.objects.create(
-            scenario=scenario, priority=condition, weight=weight)
+    # Priorities are current, normalized (is_raw=False) conditions; for
+    # metrics, we store both current raw and current normalized data.
+    ScenarioWeightedPriority.objects.bulk_create([
+        ScenarioWeightedPriority(
+            scenario=scenario, priority=get_priority_condition(priorities[i]),
+            weight=weights[i] if weights is not None else None)
+        for i in range(len(priorities))])
 
 # TODO: create scenario for project instead of plan
 
@@ -654,8 +877,12 @@ def update_scenario(request: HttpRequest) -> HttpResponse:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
 
-def _serialize_scenario(scenario: Scenario, weights: QuerySet, areas: QuerySet,
-                        project: Project) -> dict:
+def _serialize_scenario(scenario: Scenario, weights,
+                        project_areas: dict, config: dict | None) -> dict:
+    """
+    Serializes a Scenario into a dictionary, given its weighted priorities
+    and its project's already-serialized project areas and config.
+    """
     result = ScenarioSerializer(scenario).data
 
     if 'creation_time' in result:
@@ -665,38 +892,69 @@ def _serialize_scenario(scenario: Scenario, weights: QuerySet, areas: QuerySet,
 
     result['priorities'] = {}
     for weight in weights:
-        serialized_weight = ScenarioWeightedPrioritySerializer(weight).data
-        if 'priority' in serialized_weight and 'weight' in serialized_weight:
-            result['priorities'][
-                Condition.objects.get(pk=serialized_weight['priority']).
-                condition_dataset.condition_name] = serialized_weight['weight']
+        if weight.priority_id is not None:
+            result['priorities'][get_condition_name(weight.priority_id)] = \
+                weight.weight
 
-    result['project_areas'] = _serialize_project_areas(areas)
+    result['project_areas'] = project_areas
     # TODO: project should be a required field
-    if project is not None:
-        result['config'] = _serialize_project(project)
+    if config is not None:
+        result['config'] = config
 
     return result
 
 
+def _serialize_scenarios(scenarios: QuerySet,
+                         encoder: GeometryEncoder | None = None) -> list[dict]:
+    """
+    Serializes scenarios with a fixed number of queries, regardless of the
+    number of scenarios, weighted priorities, and project areas.
+    Weighted priorities, project areas, and project priorities are
+    prefetched, and condition names come from the condition catalog; project
+    areas and projects shared by several scenarios are only serialized once.
+    Project area geometries are encoded with the encoder, if any.
+    """
+    scenarios = scenarios.select_related('project').prefetch_related(
+        'scenarioweightedpriority_set',
+        Prefetch('project__projectarea_set',
+                 queryset=ProjectArea.objects.defer(
+                     *ProjectArea.RASTER_GEOMETRY_FIELDS)),
+        'project__priorities')
+
+    serialized_areas = {}
+    serialized_projects = {}
+    results = []
+    for scenario in scenarios:
+        project = scenario.project
+        if project is not None and project.pk not in serialized_projects:
+            serialized_areas[project.pk] = _serialize_project_areas(
+                project.projectarea_set.all(), encoder)
+            serialized_projects[project.pk] = _serialize_project(project)
+        results.append(_serialize_scenario(
+            scenario, scenario.scenarioweightedpriority_set.all(),
+            {} if project is None else serialized_areas[project.pk],
+            None if project is None else serialized_projects[project.pk]))
+    return results
+
+
 @csrf_exempt
+@condition(etag_func=_get_scenario_etag)
 def get_scenario(request: HttpRequest) -> HttpResponse:
     try:
         user = get_user(request)
         scenario = get_scenario_by_id(user, 'id', request.GET)
 
-        weights = ScenarioWeightedPriority.objects.filter(scenario=scenario)
-        project_areas = ProjectArea.objects.filter(project=scenario.project.pk)
-
         return JsonResponse(
-            _serialize_scenario(
-                scenario, weights, project_areas, scenario.project),
+            _serialize_scenarios(
+                Scenario.objects.filter(pk=scenario.pk),
+                GeometryEncoder.from_params(request.GET))[0],
             safe=False)
     except Exception as e:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
 
 @csrf_exempt
+@condition(etag_func=_get_scenarios_for_plan_etag)
 def list_scenarios_for_plan(request: HttpRequest) -> HttpResponse:
     try:
         assert isinstance(request.GET['plan_id'], str)
@@ -709,15 +967,9 @@ def list_scenarios_for_plan(request: HttpRequest) -> HttpResponse:
             raise ValueError(
                 "You do not have permission to view scenarios for this plan.")
 
-        scenarios = Scenario.objects.select_related(
-            'project').filter(owner=user, plan=plan_id)
+        scenarios = Scenario.objects.filter(owner=user, plan=plan_id)
 
-        return JsonResponse(
-            [_serialize_scenario(scenario,
-                                 weights=ScenarioWeightedPriority.objects.filter(
-                                     scenario=scenario),
-                                 areas=ProjectArea.objects.filter(project=scenario.project.pk), project=scenario.project)
-             for scenario in scenarios], safe=False)
+        return JsonResponse(_serialize_scenarios(scenarios), safe=False)
     except Exception as e:
         return HttpResponseBadRequest("Ill-formed request: " + str(e))
 
@@ -733,17 +985,14 @@ def delete_scenarios(request: HttpRequest) -> HttpResponse:
         if scenario_ids is None or not (isinstance(scenario_ids, list)):
             raise ValueError("Must specify scenario_ids as a list")
 
-        scenarios = [Scenario.objects.get(pk=scenario_id)
-                     for scenario_id in scenario_ids]
-
-        # Check that the user owns the scenarios
-        for scenario in scenarios:
-            if scenario.owner != owner:
-                raise ValueError(
-                    "You do not have permission to delete one or more of these scenarios.")
+        # Check that the scenarios exist and that the user owns them.
+        _check_owner(
+            Scenario.objects.filter(pk__in=scenario_ids),
+            None if owner is None else owner.pk, len(set(scenario_ids)),
+            "You do not have permission to delete one or more of these scenarios.")
 
-        for scenario in scenarios:
-            scenario.delete()
+        with transaction.atomic():
+            _delete_scenarios(Scenario.objects.filter(pk__in=scenario_ids))
 
         response_data = scenario_ids
         return HttpResponse(
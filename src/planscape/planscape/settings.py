@@ -27,6 +27,28 @@ These settings are
 
   PLANSCAPE_CACHE_BACKEND: Backend type for cache
   PLANSCAPE_CACHE_LOCATION: Cache location (important for memcached, etc.)
+
+  PLANSCAPE_FORSYS_R_WORKERS: Number of long-lived R worker processes for
+                              forsys runs (0 runs R in the web worker)
+  PLANSCAPE_FORSYS_R_JOB_TIMEOUT_SECONDS: Per-job timeout for R workers
+  PLANSCAPE_FORSYS_R_WORKER_MAX_MEMORY_MB: Address space cap per R worker
+                                           (0 for no cap)
+  PLANSCAPE_FORSYS_R_WORKER_MAX_JOBS: Jobs an R worker runs before it is
+                                      replaced
+
+  PLANSCAPE_FORSYS_MAX_PIXELS: Generation runs over this many pixels are
+                               rejected (0 for no limit)
+  PLANSCAPE_FORSYS_MAX_MEMORY_MB: Generation runs estimated to need more
+                                  memory are rejected (0 for no limit)
+  PLANSCAPE_FORSYS_MAX_SYNC_PIXELS: Synchronous generation runs over this many
+                                    pixels are queued (0 for no limit)
+  PLANSCAPE_FORSYS_MAX_STANDS: Generation runs over this many stands are
+                               clustered (0 for no limit)
+
+  PLANSCAPE_FORSYS_RANKING_CACHE_TIMEOUT_SECONDS: How long ranking results are
+                                                  cached (0 disables caching)
+  PLANSCAPE_FORSYS_RANKING_CACHE_MAX_ENTRY_BYTES: Larger ranking results aren't
+                                                  cached
 """
 import os
 from pathlib import Path
@@ -253,6 +275,32 @@ CACHES = {
     }
 }
 
+# Forsys R worker pool (see forsys/r_worker_pool.py).
+# If FORSYS_R_WORKERS is 0, forsys R scripts run in the web worker process.
+FORSYS_R_WORKERS = config('PLANSCAPE_FORSYS_R_WORKERS', default=0, cast=int)
+FORSYS_R_JOB_TIMEOUT_SECONDS = config(
+    'PLANSCAPE_FORSYS_R_JOB_TIMEOUT_SECONDS', default=900, cast=int)
+FORSYS_R_WORKER_MAX_MEMORY_MB = config(
+    'PLANSCAPE_FORSYS_R_WORKER_MAX_MEMORY_MB', default=0, cast=int)
+FORSYS_R_WORKER_MAX_JOBS = config(
+    'PLANSCAPE_FORSYS_R_WORKER_MAX_JOBS', default=50, cast=int)
+
+# Admission control for forsys generation runs (see
+# forsys/admission_control.py). A limit of 0 disables the check.
+FORSYS_MAX_PIXELS = config('PLANSCAPE_FORSYS_MAX_PIXELS', default=0, cast=int)
+FORSYS_MAX_MEMORY_MB = config(
+    'PLANSCAPE_FORSYS_MAX_MEMORY_MB', default=0, cast=int)
+FORSYS_MAX_SYNC_PIXELS = config(
+    'PLANSCAPE_FORSYS_MAX_SYNC_PIXELS', default=0, cast=int)
+FORSYS_MAX_STANDS = config('PLANSCAPE_FORSYS_MAX_STANDS', default=0, cast=int)
+
+# Caching of forsys ranking results (see forsys/ranking_cache.py).
+FORSYS_RANKING_CACHE_TIMEOUT_SECONDS = config(
+    'PLANSCAPE_FORSYS_RANKING_CACHE_TIMEOUT_SECONDS', default=3600, cast=int)
+FORSYS_RANKING_CACHE_MAX_ENTRY_BYTES = config(
+    'PLANSCAPE_FORSYS_RANKING_CACHE_MAX_ENTRY_BYTES', default=10 * 1024 * 1024,
+    cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,